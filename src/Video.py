@@ -1,5 +1,7 @@
+import os
 from dataclasses import dataclass, field
 
+import numpy as np
 from numpy.core.multiarray import ndarray
 
 
@@ -20,17 +22,48 @@ class Plate:
 
 @dataclass
 class Vehicle:
-    """Class that contains information about one vehicle, where it is located and potential license plates"""
+    """
+    Class that contains information about one vehicle, where it is located and potential license plates.
+    score: confidence of the vehicle detector
+    track_id: id that stays the same for this vehicle across frames, if the vehicles are tracked
+    plates_from_search_area: if the plate candidates were only searched in the area predicted from earlier frames
+    The undistorted image patch of the vehicle is kept in 'image' while the frame is being processed.
+    """
     box: [int, int, int, int] = field(default_factory=list)
+    score: float = 0
+    track_id: int = None
     plates: [Plate] = field(default_factory=list)
+    plates_from_search_area: bool = False
+    image: ndarray = field(default=None, repr=False)
 
 
 @dataclass
 class Frame:
-    """Class for keeping track of data found within a frame"""
+    """
+    Class for keeping track of data found within a frame. Once the frame is processed the images can be released, only
+    the compact metadata (vehicle and plate boxes, heights and confidences) is kept then. If the image was spilled to
+    disk, 'image_path' points to it.
+    """
     frame_number: int
     image: ndarray
     vehicles: [Vehicle] = field(default_factory=list)
+    image_path: str = None
+
+    def release_images(self, spill_directory=None):
+        """Drops the image of the frame and its vehicles, optionally saving the frame image to 'spill_directory' first"""
+        if spill_directory is not None and self.image is not None:
+            self.image_path = os.path.join(spill_directory, "frame_%d.npy" % self.frame_number)
+            np.save(self.image_path, self.image)
+        self.image = None
+        self.release_vehicle_images()
+
+    def release_vehicle_images(self):
+        """Drops the image patches of the vehicles, they are only needed until the plates are measured"""
+        for vehicle in self.vehicles:
+            vehicle.image = None
+
+    def load_spilled_image(self):
+        return np.load(self.image_path)
 
     def __str__(self):
         ret_string = "Frame: " + str(self.frame_number)
@@ -44,6 +77,17 @@ class Frame:
 
 @dataclass
 class Video:
-    """Contains all information about a processed video file"""
+    """
+    Contains all information about a processed video file. In 'streaming' mode the frames only keep their metadata,
+    their images are dropped or, if a 'spill_directory' is given, saved there.
+    """
     path_to_file: str
     frames: [Frame] = field(default_factory=list)
+    streaming: bool = False
+    spill_directory: str = None
+
+    def add_frame(self, frame: Frame):
+        """Adds a processed frame. In streaming mode its images are released to keep the memory usage bounded."""
+        if self.streaming:
+            frame.release_images(self.spill_directory)
+        self.frames.append(frame)
@@ -0,0 +1,5 @@
+"""
+Benchmarks package:
+This package contains scripts that compare the accuracy and speed of the different processing modes on the test videos.
+They are meant to be run from the /src directory, just like main.py.
+"""
@@ -0,0 +1,37 @@
+"""
+Compares the decoding speed of the frame sources on the test videos, with and without buffer reuse and downscaling.
+"""
+import time
+
+from tabulate import tabulate
+
+from src.utils.image_utils import get_frames
+
+TEST_VIDEOS = ["../testFiles/25,74kmh.mov"]
+
+CONFIGURATIONS = [
+    ("moviepy", False, None),
+    ("opencv", False, None),
+    ("opencv", True, None),
+    ("opencv", True, (1920, 1080)),
+]
+
+
+def benchmark_decoding(video_file, backend, reuse_buffer, downscale_to, from_sec=7, to_sec=9):
+    """Returns the number of decoded frames and the decoding time per frame in ms"""
+    number_of_frames = 0
+    start = time.time()
+    for _ in get_frames(video_file, from_sec, to_sec, backend, reuse_buffer, downscale_to):
+        number_of_frames += 1
+    duration = time.time() - start
+    return number_of_frames, duration / max(number_of_frames, 1) * 1000
+
+
+if __name__ == "__main__":
+    rows = []
+    for video_file in TEST_VIDEOS:
+        for backend, reuse_buffer, downscale_to in CONFIGURATIONS:
+            number_of_frames, ms_per_frame = benchmark_decoding(video_file, backend, reuse_buffer, downscale_to)
+            rows.append([video_file, backend, reuse_buffer, downscale_to, number_of_frames, ms_per_frame,
+                         1000 / ms_per_frame])
+    print(tabulate(rows, ["Video", "backend", "reuse buffer", "downscale to", "frames", "ms per frame", "FPS"]))
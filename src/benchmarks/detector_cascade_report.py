@@ -0,0 +1,47 @@
+"""
+Runs the DetectorCascade of tiny and full yolo on the test videos and reports how often and why the full yolo was
+triggered, together with the time per frame and the recall of the vehicles the full yolo finds on every frame.
+"""
+import time
+
+from tabulate import tabulate
+
+from src.benchmarks.quantization_report import compare
+from src.camera_calibration.CameraCalibration import CameraCalibration
+from src.car_detection.detector_cascade import DetectorCascade, TINY_YOLO
+from src.car_detection.yolo import YOLO
+from src.utils.image_utils import get_frames
+
+TEST_VIDEOS = ["../testFiles/25,74kmh.mov"]
+CAMERA_MODEL = "camera_calibration/camera_calibration_iPhoneXR_4k_60.npz"
+
+
+def detect_vehicles(detector, images):
+    """Returns the vehicles found per image and the mean time per image in ms"""
+    start = time.time()
+    vehicles_per_image = [detector.detect_vehicle(image) for image in images]
+    return vehicles_per_image, (time.time() - start) / len(images) * 1000
+
+
+if __name__ == "__main__":
+    camera_calibration = CameraCalibration(CAMERA_MODEL)
+    yolo = YOLO()
+    tiny_yolo = YOLO(**TINY_YOLO)
+    rows = []
+    for video_file in TEST_VIDEOS:
+        images = [camera_calibration.undistort(image) for image in get_frames(video_file, from_sec=7, to_sec=9)]
+        # Warm up both networks, so neither pays for the first run in the comparison
+        yolo.detect_vehicle(images[0])
+        tiny_yolo.detect_vehicle(images[0])
+
+        reference_vehicles_per_image, full_ms_per_frame = detect_vehicles(yolo, images)
+        cascade = DetectorCascade(tiny_yolo, yolo)
+        vehicles_per_image, cascade_ms_per_frame = detect_vehicles(cascade, images)
+        recall, mean_iou, _, additional_vehicles = compare(reference_vehicles_per_image, vehicles_per_image)
+        rows.append([video_file, cascade.trigger_rate, full_ms_per_frame, cascade_ms_per_frame, recall, mean_iou,
+                     additional_vehicles])
+        print(video_file)
+        cascade.print_statistics()
+        print()
+    print(tabulate(rows, ["Video", "trigger rate", "ms per frame full", "ms per frame cascade", "recall", "mean iou",
+                          "additional vehicles"]))
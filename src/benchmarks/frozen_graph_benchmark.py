@@ -0,0 +1,114 @@
+"""
+Compares the frozen inference graphs written by export_frozen_graphs.py against the Keras models they were exported
+from: the time to construct the detectors and the latency per frame of the vehicle detection and per batch of the plate
+validation. The frozen graphs have to give the same results for single frames and for batches of frames, whose
+post-processing runs in a while loop. The largest deviation of the vehicle boxes and of the plate confidences is
+reported and checked against BOX_TOLERANCE and CONFIDENCE_TOLERANCE.
+"""
+import time
+
+import numpy as np
+from tabulate import tabulate
+
+from src.camera_calibration.CameraCalibration import CameraCalibration
+from src.car_detection.yolo import YOLO, FROZEN_GRAPH_PATH as YOLO_FROZEN_GRAPH_PATH
+from src.lp_validation.LPValidation import LPValidation, FROZEN_GRAPH_PATH as LP_VALIDATION_FROZEN_GRAPH_PATH, \
+    img_rows, img_cols
+from src.utils.image_utils import get_frames
+
+TEST_VIDEO = "../testFiles/25,74kmh.mov"
+CAMERA_MODEL = "camera_calibration/camera_calibration_iPhoneXR_4k_60.npz"
+
+# Number of plate candidates validated at once
+VALIDATION_BATCH_SIZE = 16
+VALIDATION_REPETITIONS = 50
+# Number of frames detected at once in the batch comparison
+YOLO_BATCH_SIZE = 4
+
+# Largest deviation of a box coordinate in pixel and of a plate confidence between the Keras models and the frozen graphs
+BOX_TOLERANCE = 1
+CONFIDENCE_TOLERANCE = 1e-4
+
+
+def time_construction(constructor):
+    start = time.time()
+    instance = constructor()
+    return instance, time.time() - start
+
+
+def benchmark_yolo(yolo, images):
+    """Returns the found vehicles per image and the mean latency per image in ms, the first image is a warm-up"""
+    yolo.detect_vehicle(images[0])
+    vehicles_per_image = []
+    start = time.time()
+    for image in images:
+        vehicles_per_image.append(yolo.detect_vehicle(image))
+    return vehicles_per_image, (time.time() - start) / len(images) * 1000
+
+
+def benchmark_yolo_batches(yolo, images):
+    """Returns the found vehicles per image and the mean latency per image in ms when detecting batches of images"""
+    batches = [images[i:i + YOLO_BATCH_SIZE] for i in range(0, len(images), YOLO_BATCH_SIZE)]
+    yolo.detect_vehicles_batch(batches[0])
+    vehicles_per_image = []
+    start = time.time()
+    for batch in batches:
+        vehicles_per_image.extend(yolo.detect_vehicles_batch(batch))
+    return vehicles_per_image, (time.time() - start) / len(images) * 1000
+
+
+def benchmark_lp_validation(lp_validation, batch):
+    """Returns the confidences of the 'batch' and the mean latency per batch in ms"""
+    confidences = lp_validation._predict(batch)
+    start = time.time()
+    for _ in range(VALIDATION_REPETITIONS):
+        lp_validation._predict(batch)
+    return confidences, (time.time() - start) / VALIDATION_REPETITIONS * 1000
+
+
+def get_largest_box_deviation(vehicles_per_image, frozen_vehicles_per_image):
+    """Largest difference of a box coordinate in pixel, or None if a different number of vehicles was found"""
+    largest_deviation = 0
+    for vehicles, frozen_vehicles in zip(vehicles_per_image, frozen_vehicles_per_image):
+        if len(vehicles) != len(frozen_vehicles):
+            return None
+        for vehicle, frozen_vehicle in zip(vehicles, frozen_vehicles):
+            largest_deviation = max(largest_deviation, np.max(np.abs(vehicle.box - frozen_vehicle.box)))
+    return largest_deviation
+
+
+if __name__ == "__main__":
+    camera_calibration = CameraCalibration(CAMERA_MODEL)
+    images = [camera_calibration.undistort(image) for image in get_frames(TEST_VIDEO, from_sec=7, to_sec=8)]
+    batch = np.random.RandomState(0).randint(0, 256, (VALIDATION_BATCH_SIZE, img_rows, img_cols, 3)).astype(np.uint8)
+
+    yolo, yolo_startup = time_construction(YOLO)
+    frozen_yolo, frozen_yolo_startup = time_construction(lambda: YOLO(frozen_graph_path=YOLO_FROZEN_GRAPH_PATH))
+    lp_validation, lp_validation_startup = time_construction(LPValidation)
+    frozen_lp_validation, frozen_lp_validation_startup = time_construction(
+        lambda: LPValidation(LP_VALIDATION_FROZEN_GRAPH_PATH))
+
+    vehicles_per_image, yolo_latency = benchmark_yolo(yolo, images)
+    frozen_vehicles_per_image, frozen_yolo_latency = benchmark_yolo(frozen_yolo, images)
+    batch_vehicles_per_image, yolo_batch_latency = benchmark_yolo_batches(yolo, images)
+    frozen_batch_vehicles_per_image, frozen_yolo_batch_latency = benchmark_yolo_batches(frozen_yolo, images)
+    confidences, lp_validation_latency = benchmark_lp_validation(lp_validation, batch)
+    frozen_confidences, frozen_lp_validation_latency = benchmark_lp_validation(frozen_lp_validation, batch)
+
+    box_deviation = get_largest_box_deviation(vehicles_per_image, frozen_vehicles_per_image)
+    batch_box_deviation = get_largest_box_deviation(batch_vehicles_per_image, frozen_batch_vehicles_per_image)
+    confidence_deviation = np.max(np.abs(confidences - frozen_confidences))
+    rows = [
+        ["yolo", "keras", yolo_startup, yolo_latency, ""],
+        ["yolo", "frozen", frozen_yolo_startup, frozen_yolo_latency, box_deviation],
+        ["yolo batch", "keras", "", yolo_batch_latency, ""],
+        ["yolo batch", "frozen", "", frozen_yolo_batch_latency, batch_box_deviation],
+        ["lp validation", "keras", lp_validation_startup, lp_validation_latency, ""],
+        ["lp validation", "frozen", frozen_lp_validation_startup, frozen_lp_validation_latency, confidence_deviation],
+    ]
+    print(tabulate(rows, ["Network", "graph", "startup in s", "ms per frame / batch", "largest deviation"]))
+    assert box_deviation is not None and box_deviation <= BOX_TOLERANCE, \
+        "The frozen yolo graph finds different vehicles"
+    assert batch_box_deviation is not None and batch_box_deviation <= BOX_TOLERANCE, \
+        "The frozen yolo graph finds different vehicles in batches"
+    assert confidence_deviation <= CONFIDENCE_TOLERANCE, "The frozen validation graph gives different confidences"
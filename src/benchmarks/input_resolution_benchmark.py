@@ -0,0 +1,55 @@
+"""
+Compares the yolo input resolutions on the test videos: the square model_image_size, fixed heights with the aspect ratio
+of the frames and the dynamic selection of the InputResolutionPolicy. Reported are the latency per frame and the recall
+of the vehicles found at the largest resolution, which serves as the reference.
+"""
+import time
+
+from tabulate import tabulate
+
+from src.benchmarks.quantization_report import compare
+from src.camera_calibration.CameraCalibration import CameraCalibration
+from src.car_detection.resolution_policy import InputResolutionPolicy, get_input_size
+from src.car_detection.yolo import YOLO
+from src.utils.image_utils import get_frames
+
+TEST_VIDEOS = ["../testFiles/25,74kmh.mov"]
+CAMERA_MODEL = "camera_calibration/camera_calibration_iPhoneXR_4k_60.npz"
+
+INPUT_HEIGHTS = [224, 320, 416, 512, 608, 736]
+
+
+def detect_vehicles(yolo, images):
+    """Returns the vehicles found per image and the mean time per image in ms, the first image is a warm-up"""
+    yolo.detect_vehicle(images[0])
+    start = time.time()
+    vehicles_per_image = [yolo.detect_vehicle(image) for image in images]
+    return vehicles_per_image, (time.time() - start) / len(images) * 1000
+
+
+if __name__ == "__main__":
+    camera_calibration = CameraCalibration(CAMERA_MODEL)
+    images = [camera_calibration.undistort(image)
+              for video_file in TEST_VIDEOS for image in get_frames(video_file, from_sec=7, to_sec=9)]
+    yolo = YOLO()
+
+    configurations = [("square " + str(yolo.model_image_size), yolo.model_image_size, None)]
+    for input_height in INPUT_HEIGHTS:
+        input_size = get_input_size(images[0].shape, input_height)
+        configurations.append((str(input_size), input_size, None))
+    configurations.append(("dynamic", None, InputResolutionPolicy(min_box_size=yolo.min_box_size)))
+
+    results = []
+    for name, input_size, resolution_policy in configurations:
+        yolo.model_image_size = input_size if input_size is not None else yolo.model_image_size
+        yolo.resolution_policy = resolution_policy
+        results.append((name, resolution_policy) + detect_vehicles(yolo, images))
+
+    # The largest fixed resolution is the reference
+    reference_vehicles_per_image = results[len(INPUT_HEIGHTS)][2]
+    rows = []
+    for name, resolution_policy, vehicles_per_image, ms_per_frame in results:
+        recall, mean_iou, _, additional_vehicles = compare(reference_vehicles_per_image, vehicles_per_image)
+        rows.append([name, ms_per_frame, recall, mean_iou, additional_vehicles])
+    print(tabulate(rows, ["Input size", "ms per frame", "recall", "mean iou", "additional vehicles"]))
+    print("\nSizes selected by the dynamic policy: " + str(configurations[-1][2].selected_sizes))
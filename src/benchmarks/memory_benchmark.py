@@ -0,0 +1,67 @@
+"""
+Shows that the memory of processing a clip in streaming mode, in which the frames only keep their metadata once they
+are processed, does not grow with the length of the clip.
+
+A short and then a long part of the clip are processed after loading the models. The peak resident memory the short
+part adds covers the frames in flight and everything that is allocated once. Processing the long part must then not
+raise the peak by more than the images of MAX_ADDITIONAL_FRAMES frames, otherwise memory grows with the clip length.
+"""
+import resource
+
+from src import main
+from src.Video import Video
+from src.camera_calibration.CameraCalibration import CameraCalibration
+from src.car_detection.yolo import YOLO
+from src.lp_localization.LicensePlateDetectionCascadeClassifier import LicensePlateDetection
+from src.speed_estimation.SpeedEstimator import SpeedEstimator
+from src.utils.image_utils import get_frames
+
+VIDEO_FILE = "../testFiles/25,74kmh.mov"
+SHORT_CLIP_LENGTH_IN_SEC = 5
+LONG_CLIP_LENGTH_IN_SEC = 60
+
+# The long part has to have at least this many times the frames of the short one to tell flat from growing memory
+MIN_CLIP_LENGTH_RATIO = 3
+
+# Slack for the peak of the long part over the one of the short part, in frame images
+MAX_ADDITIONAL_FRAMES = 4
+
+
+def get_peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def process_clip(yolo, license_plate_detection, camera_calibration, clip_length_in_sec):
+    """Processes the first seconds of the video in streaming mode and returns the number of frames"""
+    video = Video(VIDEO_FILE, streaming=True)
+    estimator = SpeedEstimator()
+    images = get_frames(video.path_to_file, from_sec=0, to_sec=clip_length_in_sec)
+    frames = (main.create_frame(camera_calibration, frame_number, image) for frame_number, image in enumerate(images))
+    for frame in main.process_frames_sequentially(frames, yolo, license_plate_detection, camera_calibration):
+        video.add_frame(frame)
+        estimator.add_frame(frame)
+    return len(video.frames)
+
+
+if __name__ == "__main__":
+    yolo = YOLO()
+    license_plate_detection = LicensePlateDetection()
+    camera_calibration = CameraCalibration(main.CAMERA_MODEL)
+    frame_image_mb = next(get_frames(VIDEO_FILE)).nbytes / 2 ** 20
+    rss_after_loading = get_peak_rss_mb()
+
+    short_frames = process_clip(yolo, license_plate_detection, camera_calibration, SHORT_CLIP_LENGTH_IN_SEC)
+    rss_after_short_clip = get_peak_rss_mb()
+    long_frames = process_clip(yolo, license_plate_detection, camera_calibration, LONG_CLIP_LENGTH_IN_SEC)
+    rss_after_long_clip = get_peak_rss_mb()
+
+    max_growth = MAX_ADDITIONAL_FRAMES * frame_image_mb
+    print("Peak RSS after loading the models: {0:.0f} MB".format(rss_after_loading))
+    print("After {0} frames: {1:.0f} MB (+{2:.0f} MB)".format(
+        short_frames, rss_after_short_clip, rss_after_short_clip - rss_after_loading))
+    print("After {0} frames: {1:.0f} MB (+{2:.0f} MB, limit: +{3:.0f} MB)".format(
+        long_frames, rss_after_long_clip, rss_after_long_clip - rss_after_short_clip, max_growth))
+    assert long_frames >= MIN_CLIP_LENGTH_RATIO * short_frames, \
+        "The clip is too short to tell whether memory grows with its length"
+    assert rss_after_long_clip - rss_after_short_clip <= max_growth, "Memory grows with the length of the clip"
@@ -0,0 +1,111 @@
+"""
+Micro-benchmark of the vectorized perfect_line against the original point by point implementation.
+It runs both on synthetic license plate patches, checks that the found edge points agree within LINE_POINT_TOLERANCE
+pixels and that the measured plate heights agree within HEIGHT_TOLERANCE pixels, and prints the time per call of both
+versions.
+"""
+import math
+import timeit
+
+import cv2.cv2 as cv2
+import numpy as np
+from tabulate import tabulate
+
+from src.lp_measurement.lp_measurement import _NUM_OF_HORIZONTAL_MEASURING_POINTS, _NUM_OF_VERTICAL_MEASURING_POINTS, \
+    best_fit_line_from_points, correct_white_balance, find_actual_line_point, find_lp_contour, \
+    get_2_longest_lines_from_contour, get_actual_line_points, get_average_distance_of_lines, get_equidistant_points, \
+    get_height_of_license_plate, get_pixel_at, get_point_at, perfect_line
+
+# Maximum distance in pixels between the edge points found by both versions
+LINE_POINT_TOLERANCE = 0.01
+# Maximum difference in pixels between the plate heights measured with both versions
+HEIGHT_TOLERANCE = 0.01
+
+NUMBER_OF_PATCHES = 50
+REPETITIONS = 20
+
+
+def perfect_line_iterative(image, line):
+    """Original point by point implementation of perfect_line, it draws the measuring lines onto the image as well"""
+    actual_line_points = get_actual_line_points_iterative(image, line)
+    line_start, line_end = best_fit_line_from_points(actual_line_points)
+    return line_start, line_end
+
+
+def get_actual_line_points_iterative(image, line):
+    ten_percent_of_image_height = image.shape[0] * 0.1
+    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    pt1, pt2 = line
+    dx, dy = pt1[0] - pt2[0], pt1[1] - pt2[1]
+    angle_rad = math.atan2(dy, dx)
+    points_on_line = get_equidistant_points(pt1, pt2, _NUM_OF_HORIZONTAL_MEASURING_POINTS)
+    actual_line_points = []
+    for point in points_on_line:
+        first_point = get_pixel_at(point, ten_percent_of_image_height, angle_rad + np.pi / 2)
+        second_point = get_pixel_at(point, - ten_percent_of_image_height, angle_rad + np.pi / 2)
+        cv2.line(image, first_point, second_point, (0, 0, 255), 1)
+        measuring_points = get_equidistant_points(first_point, second_point, _NUM_OF_VERTICAL_MEASURING_POINTS)
+        gray_values = []
+        for measuring_point in measuring_points:
+            y = min(measuring_point[1], gray_image.shape[0] - 1)
+            x = min(measuring_point[0], gray_image.shape[1] - 1)
+            gray_values.append(float(gray_image[y][x]))
+
+        line_point_in_array = find_actual_line_point(gray_values, ten_percent_of_image_height * 2)
+        if line_point_in_array is not None:
+            actual_line_point = get_point_at(first_point, line_point_in_array, angle_rad - np.pi / 2)
+            actual_line_points.append(actual_line_point)
+    return actual_line_points
+
+
+def get_height_of_license_plate_iterative(lp_image):
+    """get_height_of_license_plate with the original perfect_line"""
+    balanced_image = correct_white_balance(lp_image)
+    lp_contour = find_lp_contour(balanced_image)
+    lines = get_2_longest_lines_from_contour(lp_contour)
+    final_lines = [perfect_line_iterative(balanced_image, line) for line in lines]
+    return get_average_distance_of_lines(final_lines[0], final_lines[1])
+
+
+def create_synthetic_plate(random_generator):
+    """Returns a blurred and noisy image of a slightly tilted bright plate together with a rough line of its top edge"""
+    image = np.full((80, 240, 3), 40, np.uint8)
+    top = int(random_generator.randint(12, 20))
+    bottom = int(random_generator.randint(60, 70))
+    corners = np.array([[20, top], [220, top + random_generator.randint(-4, 5)],
+                        [220, bottom], [20, bottom + random_generator.randint(-4, 5)]], np.int32)
+    cv2.fillPoly(image, [corners], (230, 230, 230))
+    image = cv2.GaussianBlur(image, (5, 5), 2)
+    image = np.clip(image + random_generator.normal(0, 5, image.shape), 0, 255).astype(np.uint8)
+    rough_line = ((20, top + 2), (220, top + 1))
+    return image, rough_line
+
+
+if __name__ == "__main__":
+    random_generator = np.random.RandomState(0)
+    patches = [create_synthetic_plate(random_generator) for _ in range(NUMBER_OF_PATCHES)]
+
+    max_deviation = 0
+    for image, line in patches:
+        iterative_points = np.array(get_actual_line_points_iterative(np.copy(image), line))
+        vectorized_points = get_actual_line_points(np.copy(image), line)
+        assert iterative_points.shape == vectorized_points.shape, "Both versions must find the same edge points"
+        max_deviation = max(max_deviation, np.abs(iterative_points - vectorized_points).max())
+    assert max_deviation <= LINE_POINT_TOLERANCE, "The vectorized version deviates from the original one"
+
+    max_height_difference = 0
+    for image, _ in patches:
+        iterative_height = get_height_of_license_plate_iterative(np.copy(image))
+        height = get_height_of_license_plate(np.copy(image))
+        assert (iterative_height is None) == (height is None), "Both versions must measure the same plates"
+        if height is not None:
+            max_height_difference = max(max_height_difference, abs(iterative_height - height))
+    assert max_height_difference <= HEIGHT_TOLERANCE, "The vectorized version measures different plate heights"
+
+    rows = []
+    for name, function in [("iterative", perfect_line_iterative), ("vectorized", perfect_line)]:
+        total_time = timeit.timeit(lambda: [function(np.copy(image), line) for image, line in patches], number=REPETITIONS)
+        rows.append([name, total_time / (REPETITIONS * NUMBER_OF_PATCHES) * 1000])
+    print(tabulate(rows, ["Version", "ms per call"]))
+    print("\nSpeedup: {0:.1f}x, max edge point deviation: {1:.2e} px, max height difference: {2:.2e} px".format(
+        rows[0][1] / rows[1][1], max_deviation, max_height_difference))
@@ -0,0 +1,84 @@
+"""
+Measures the throughput of the plate candidate search for frames with 1 to MAX_VEHICLES vehicles, searching the vehicle
+images one after another and with thread pools of different sizes. OpenCV's own thread count is lowered so the detection
+threads and OpenCV's threads together do not use more threads than there are cores.
+
+The vehicle images are taken from the test video and repeated until a frame has the requested number of vehicles. The
+candidates found with threads have to be the same as the ones found one vehicle after another.
+"""
+import os
+import time
+
+import cv2.cv2 as cv2
+from tabulate import tabulate
+
+from src.Video import Frame, Vehicle
+from src.camera_calibration.CameraCalibration import CameraCalibration
+from src.car_detection.yolo import YOLO
+from src.lp_localization.LicensePlateDetectionCascadeClassifier import LicensePlateDetection
+from src.lp_validation.LPValidation import LPValidation
+from src.utils.image_utils import get_frames, get_image_patch_from_rect
+
+TEST_VIDEO = "../testFiles/25,74kmh.mov"
+CAMERA_MODEL = "camera_calibration/camera_calibration_iPhoneXR_4k_60.npz"
+
+MAX_VEHICLES = 8
+DETECTION_THREADS = [1, 2, 4, 8]
+REPETITIONS = 10
+
+
+def get_vehicle_images(video_file, from_sec=7, to_sec=9):
+    """Returns the undistorted images of all vehicles found in the clip"""
+    yolo = YOLO()
+    camera_calibration = CameraCalibration(CAMERA_MODEL)
+    vehicle_images = []
+    for image in get_frames(video_file, from_sec=from_sec, to_sec=to_sec):
+        undistorted_image = camera_calibration.undistort(image)
+        for vehicle in yolo.detect_vehicle(undistorted_image):
+            vehicle_images.append(get_image_patch_from_rect(undistorted_image, vehicle.box))
+    return vehicle_images
+
+
+def benchmark_threads(vehicle_images, validator, detection_threads, number_of_vehicles):
+    """
+    Returns the time per frame in ms for frames with 'number_of_vehicles' vehicles and the candidate boxes found per
+    vehicle. The 'validator' is shared by all runs, so loading it is not part of the measurement.
+    """
+    cv2.setNumThreads(max(1, os.cpu_count() // detection_threads))
+    license_plate_detection = LicensePlateDetection(predict_plate_search_area=False,
+                                                    detection_threads=detection_threads, validator=validator)
+    frames = []
+    for frame_number in range(REPETITIONS):
+        vehicles = []
+        for vehicle_index in range(number_of_vehicles):
+            vehicle_image = vehicle_images[(frame_number * number_of_vehicles + vehicle_index) % len(vehicle_images)]
+            vehicles.append(Vehicle(image=vehicle_image))
+        frames.append(Frame(frame_number, None, vehicles))
+
+    start = time.time()
+    for frame in frames:
+        license_plate_detection.detect_plate_candidates_of_frame(frame)
+    duration = time.time() - start
+    license_plate_detection.close()
+    candidate_boxes = [[list(plate.box) for plate in vehicle.plates] for frame in frames for vehicle in frame.vehicles]
+    return duration / REPETITIONS * 1000, candidate_boxes
+
+
+if __name__ == "__main__":
+    vehicle_images = get_vehicle_images(TEST_VIDEO)
+    validator = LPValidation()
+    rows = []
+    for number_of_vehicles in range(1, MAX_VEHICLES + 1):
+        row = [number_of_vehicles]
+        serial_candidate_boxes = None
+        for detection_threads in DETECTION_THREADS:
+            ms_per_frame, candidate_boxes = benchmark_threads(vehicle_images, validator, detection_threads,
+                                                              number_of_vehicles)
+            if serial_candidate_boxes is None:
+                serial_candidate_boxes = candidate_boxes
+            assert candidate_boxes == serial_candidate_boxes, \
+                "{0} threads found other candidates than 1 thread".format(detection_threads)
+            row.append(1000 / ms_per_frame)
+        rows.append(row)
+    print("Frames per second of the plate candidate search on {0} cores".format(os.cpu_count()))
+    print(tabulate(rows, ["Vehicles"] + ["{0} thread(s)".format(threads) for threads in DETECTION_THREADS]))
@@ -0,0 +1,77 @@
+"""
+Compares the plate search restricted to the predicted area around the last plate of a tracked vehicle against the search
+over the whole vehicle image. For every tracked vehicle with a predicted search area both searches are run and the
+recall of the candidates and of the valid plate of the full search is reported, together with the time per search.
+"""
+import time
+
+from tabulate import tabulate
+
+from src.Video import Frame
+from src.camera_calibration.CameraCalibration import CameraCalibration
+from src.car_detection.yolo import YOLO
+from src.lp_localization.LicensePlateDetectionCascadeClassifier import LicensePlateDetection
+from src.tracking.VehicleTracker import VehicleTracker
+from src.utils.image_utils import get_frames, get_image_patch_from_rect, get_intersection_over_union
+
+TEST_VIDEOS = ["../testFiles/25,74kmh.mov"]
+CAMERA_MODEL = "camera_calibration/camera_calibration_iPhoneXR_4k_60.npz"
+
+# Minimum overlap for a candidate of the restricted search to count as finding a candidate of the full search
+MIN_IOU = 0.5
+
+
+def is_found(plate, candidates):
+    return any(get_intersection_over_union(plate.box, candidate.box) >= MIN_IOU for candidate in candidates)
+
+
+def benchmark_video(video_file, from_sec=7, to_sec=9):
+    tracker = VehicleTracker(YOLO())
+    license_plate_detection = LicensePlateDetection()
+    camera_calibration = CameraCalibration(CAMERA_MODEL)
+
+    statistics = {"searches": 0, "candidates": 0, "found candidates": 0, "valid plates": 0, "found valid plates": 0,
+                  "full search time": 0.0, "restricted search time": 0.0}
+    for frame_number, image in enumerate(get_frames(video_file, from_sec=from_sec, to_sec=to_sec)):
+        frame = Frame(frame_number, camera_calibration.undistort(image))
+        frame.vehicles = tracker.detect_vehicle(frame.image)
+        restricted_candidates_per_vehicle = []
+        for vehicle in frame.vehicles:
+            vehicle.image = get_image_patch_from_rect(frame.image, vehicle.box)
+            search_area = license_plate_detection._predict_search_area(vehicle, frame_number)
+
+            start = time.time()
+            vehicle.plates = license_plate_detection.process_image(vehicle.image, False)
+            statistics["full search time"] += time.time() - start
+            if search_area is None:
+                continue
+
+            start = time.time()
+            restricted_candidates = license_plate_detection.process_image(vehicle.image, False, search_area)
+            statistics["restricted search time"] += time.time() - start
+            restricted_candidates_per_vehicle.append((vehicle, restricted_candidates))
+
+        license_plate_detection.validate_plates_of_frame(frame)
+        for vehicle, restricted_candidates in restricted_candidates_per_vehicle:
+            statistics["searches"] += 1
+            statistics["candidates"] += len(vehicle.plates)
+            statistics["found candidates"] += sum(is_found(plate, restricted_candidates) for plate in vehicle.plates)
+            for plate in filter(lambda p: p.valid, vehicle.plates):
+                statistics["valid plates"] += 1
+                statistics["found valid plates"] += is_found(plate, restricted_candidates)
+        license_plate_detection.measure_plates_of_frame(frame)
+    return statistics
+
+
+if __name__ == "__main__":
+    rows = []
+    for video_file in TEST_VIDEOS:
+        statistics = benchmark_video(video_file)
+        searches = max(statistics["searches"], 1)
+        rows.append([video_file, statistics["searches"],
+                     statistics["found candidates"] / max(statistics["candidates"], 1),
+                     statistics["found valid plates"] / max(statistics["valid plates"], 1),
+                     statistics["full search time"] / searches * 1000,
+                     statistics["restricted search time"] / searches * 1000])
+    print(tabulate(rows, ["Video", "searches", "candidate recall", "valid plate recall", "ms full search",
+                          "ms restricted search"]))
@@ -0,0 +1,75 @@
+"""
+Compares the yolo post-processing that prunes the boxes of other classes and small boxes before the non max suppression
+(prune_before_nms in YOLO._defaults) against the default one that filters the vehicles afterwards. Pruning may only be
+turned on if both find the same vehicles, the number of frames where they differ is reported together with the time per
+frame.
+
+The network and the post-processing are timed separately by running them in two session calls (time_post_processing),
+which copies the feature maps out of the graph and back in. The default single session call is timed as well to show
+what this costs.
+"""
+import time
+
+import numpy as np
+from tabulate import tabulate
+
+from src.camera_calibration.CameraCalibration import CameraCalibration
+from src.car_detection.yolo import YOLO
+from src.utils import timer
+from src.utils.image_utils import get_frames
+
+TEST_VIDEOS = ["../testFiles/25,74kmh.mov"]
+CAMERA_MODEL = "camera_calibration/camera_calibration_iPhoneXR_4k_60.npz"
+
+# Name and YOLO arguments of the compared configurations, the first one is the reference
+CONFIGURATIONS = [
+    ("after nms, one call", {"prune_before_nms": False}),
+    ("after nms, two calls", {"prune_before_nms": False, "time_post_processing": True}),
+    ("before nms, one call", {"prune_before_nms": True}),
+    ("before nms, two calls", {"prune_before_nms": True, "time_post_processing": True}),
+]
+
+
+def get_time_per_call(function_name, calls_before, time_before):
+    """Returns the time per call of the timed function in ms since the given number of calls and total time"""
+    calls = timer.number_of_calls[function_name] - calls_before
+    if calls == 0:
+        return ""
+    return (timer.total_time_per_function[function_name] - time_before) / calls * 1000
+
+
+def detect_vehicles(yolo, images):
+    """
+    Returns the vehicles per image, the total time per image and, if timed separately, the time of the network and of
+    the post-processing per image in ms
+    """
+    yolo.detect_vehicle(images[0])  # warm-up
+    timed_functions = ["_run_network", "_post_process"]
+    before = [(timer.number_of_calls[name], timer.total_time_per_function[name]) for name in timed_functions]
+    start = time.time()
+    vehicles_per_image = [yolo.detect_vehicle(image) for image in images]
+    total_time = (time.time() - start) / len(images) * 1000
+    return [vehicles_per_image, total_time] + [get_time_per_call(name, *function_before)
+                                               for name, function_before in zip(timed_functions, before)]
+
+
+def is_same(vehicles, other_vehicles):
+    return len(vehicles) == len(other_vehicles) and all(
+        np.array_equal(vehicle.box, other_vehicle.box) and vehicle.score == other_vehicle.score
+        for vehicle, other_vehicle in zip(vehicles, other_vehicles))
+
+
+if __name__ == "__main__":
+    camera_calibration = CameraCalibration(CAMERA_MODEL)
+    images = [camera_calibration.undistort(image)
+              for video_file in TEST_VIDEOS for image in get_frames(video_file, from_sec=7, to_sec=9)]
+
+    results = [(name,) + tuple(detect_vehicles(YOLO(**arguments), images)) for name, arguments in CONFIGURATIONS]
+    reference_vehicles = results[0][1]
+    rows = []
+    for name, vehicles_per_image, total_time, network_time, post_processing_time in results:
+        different_frames = sum(not is_same(vehicles, other_vehicles)
+                               for vehicles, other_vehicles in zip(reference_vehicles, vehicles_per_image))
+        rows.append([name, total_time, network_time, post_processing_time, different_frames])
+    print(tabulate(rows, ["Vehicle filter", "ms per frame", "ms network", "ms post-processing",
+                          "frames with different vehicles"]))
@@ -0,0 +1,69 @@
+"""
+Compares the vehicles found by the quantized yolo networks written by quantize_yolo.py against the float32 network on
+undistorted frames of the test videos. A vehicle counts as found again if a box of the quantized network overlaps it by
+at least MIN_IOU. Reported are the recall, the mean overlap and score difference of the matched vehicles, the number of
+additional vehicles and the time per frame, so precision can be traded for throughput on purpose.
+"""
+import os
+import time
+
+import numpy as np
+from tabulate import tabulate
+
+from src.camera_calibration.CameraCalibration import CameraCalibration
+from src.car_detection.yolo import YOLO, PRECISIONS, get_quantized_model_path
+from src.utils.image_utils import get_frames, get_intersection_over_union
+
+TEST_VIDEOS = ["../testFiles/25,74kmh.mov"]
+CAMERA_MODEL = "camera_calibration/camera_calibration_iPhoneXR_4k_60.npz"
+
+MIN_IOU = 0.5
+
+
+def detect_vehicles(yolo, images):
+    """Returns the vehicles found per image and the mean time per image in ms, the first image is a warm-up"""
+    yolo.detect_vehicle(images[0])
+    start = time.time()
+    vehicles_per_image = [yolo.detect_vehicle(image) for image in images]
+    return vehicles_per_image, (time.time() - start) / len(images) * 1000
+
+
+def compare(reference_vehicles_per_image, vehicles_per_image):
+    """Returns the recall, the mean iou and score difference of the matches and the number of additional vehicles"""
+    matches, ious, score_differences, additional_vehicles = 0, [], [], 0
+    for reference_vehicles, vehicles in zip(reference_vehicles_per_image, vehicles_per_image):
+        unmatched = list(vehicles)
+        for reference_vehicle in reference_vehicles:
+            overlaps = [get_intersection_over_union(reference_vehicle.box, vehicle.box) for vehicle in unmatched]
+            if len(overlaps) == 0 or max(overlaps) < MIN_IOU:
+                continue
+            best_match = unmatched.pop(int(np.argmax(overlaps)))
+            matches += 1
+            ious.append(max(overlaps))
+            score_differences.append(abs(reference_vehicle.score - best_match.score))
+        additional_vehicles += len(unmatched)
+    number_of_reference_vehicles = sum(len(vehicles) for vehicles in reference_vehicles_per_image)
+    recall = matches / number_of_reference_vehicles if number_of_reference_vehicles > 0 else 1
+    return recall, np.mean(ious) if ious else 0, np.mean(score_differences) if score_differences else 0, \
+        additional_vehicles
+
+
+if __name__ == "__main__":
+    camera_calibration = CameraCalibration(CAMERA_MODEL)
+    images = [camera_calibration.undistort(image)
+              for video_file in TEST_VIDEOS for image in get_frames(video_file, from_sec=7, to_sec=9)]
+
+    # quantize_yolo.py skips the precisions the installed tensorflow cannot convert to
+    precisions = [precision for precision in PRECISIONS
+                  if precision == "float32" or os.path.exists(get_quantized_model_path(precision))]
+    print("Comparing " + ", ".join(precisions))
+    results = {precision: detect_vehicles(YOLO(precision=precision), images) for precision in precisions}
+    reference_vehicles_per_image, reference_ms_per_frame = results["float32"]
+    rows = []
+    for precision, (vehicles_per_image, ms_per_frame) in results.items():
+        recall, mean_iou, mean_score_difference, additional_vehicles = compare(reference_vehicles_per_image,
+                                                                               vehicles_per_image)
+        rows.append([precision, ms_per_frame, reference_ms_per_frame / ms_per_frame, recall, mean_iou,
+                     mean_score_difference, additional_vehicles])
+    print(tabulate(rows, ["Precision", "ms per frame", "speedup", "recall", "mean iou", "mean score difference",
+                          "additional vehicles"]))
@@ -0,0 +1,69 @@
+"""
+Compares the plate heights measured with region-of-interest undistortion (ROI_UNDISTORTION in main.py) against the
+ones measured on fully undistorted frames. As the plate heights directly feed the SpeedEstimator, the relative
+deviation of every plate found by both paths has to stay within PLATE_HEIGHT_TOLERANCE.
+"""
+
+from tabulate import tabulate
+
+from src.camera_calibration.CameraCalibration import CameraCalibration
+from src.car_detection.yolo import YOLO
+from src.lp_localization.LicensePlateDetectionCascadeClassifier import LicensePlateDetection
+from src.utils.image_utils import get_frames, get_image_patch_from_rect, get_intersection_over_union
+
+VIDEO_FILE = "../testFiles/25,74kmh.mov"
+CAMERA_MODEL = "camera_calibration/camera_calibration_iPhoneXR_4k_60.npz"
+
+# Maximum relative deviation of a plate height measured with ROI undistortion from the full frame measurement
+PLATE_HEIGHT_TOLERANCE = 0.02
+
+# Minimum overlap for two vehicle boxes of both paths to be considered the same vehicle
+MIN_IOU = 0.8
+
+
+def get_valid_plate_height(plates):
+    for plate in plates:
+        if plate.valid:
+            return plate.height
+
+
+def compare_plate_heights(video_file, from_sec, to_sec):
+    """Runs both undistortion paths on every frame and returns a list of (frame, full height, roi height, deviation)"""
+    yolo = YOLO()
+    license_plate_detection = LicensePlateDetection()
+    camera_calibration = CameraCalibration(CAMERA_MODEL)
+
+    results = []
+    for frame_number, raw_image in enumerate(get_frames(video_file, from_sec=from_sec, to_sec=to_sec)):
+        full_image = camera_calibration.undistort(raw_image)
+        full_vehicles = yolo.detect_vehicle(full_image)
+        roi_vehicles = yolo.detect_vehicle(raw_image)
+        for roi_vehicle in roi_vehicles:
+            roi_vehicle.box = camera_calibration.undistort_box(roi_vehicle.box)
+
+        for full_vehicle in full_vehicles:
+            matches = [v for v in roi_vehicles if get_intersection_over_union(v.box, full_vehicle.box) >= MIN_IOU]
+            if not matches:
+                continue
+            roi_vehicle = max(matches, key=lambda v: get_intersection_over_union(v.box, full_vehicle.box))
+
+            full_plates = license_plate_detection.detect_license_plate_candidates(
+                get_image_patch_from_rect(full_image, full_vehicle.box))
+            roi_plates = license_plate_detection.detect_license_plate_candidates(
+                camera_calibration.undistort_patch(raw_image, roi_vehicle.box))
+
+            full_height = get_valid_plate_height(full_plates)
+            roi_height = get_valid_plate_height(roi_plates)
+            if full_height is not None and roi_height is not None:
+                deviation = abs(roi_height - full_height) / full_height
+                results.append((frame_number, full_height, roi_height, deviation))
+    return results
+
+
+if __name__ == "__main__":
+    comparison = compare_plate_heights(VIDEO_FILE, from_sec=7, to_sec=9)
+    print(tabulate(comparison, ["Frame", "full frame height", "roi height", "relative deviation"]))
+    assert comparison, "No plate was measured by both paths"
+    max_deviation = max(deviation for _, _, _, deviation in comparison)
+    print("\nMaximum relative deviation: {0:.4f} (tolerance: {1:.4f})".format(max_deviation, PLATE_HEIGHT_TOLERANCE))
+    assert max_deviation <= PLATE_HEIGHT_TOLERANCE, "ROI undistortion exceeds the plate height tolerance"
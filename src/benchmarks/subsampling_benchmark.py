@@ -0,0 +1,84 @@
+"""
+Compares the accuracy of the speed estimation against the fraction of frames that are processed with the different
+subsampling strategies of the FrameSubsampler.
+
+Every frame of a clip is processed once and the processed frames are then replayed for every strategy, so all strategies
+see exactly the same plate measurements. The true speed is taken from the file name of the clip, e.g. "25,74kmh.mov".
+"""
+import os
+
+from tabulate import tabulate
+
+from src.Video import Frame
+from src.camera_calibration.CameraCalibration import CameraCalibration
+from src.car_detection.yolo import YOLO
+from src.lp_localization.LicensePlateDetectionCascadeClassifier import LicensePlateDetection
+from src.speed_estimation.FrameSubsampler import FrameSubsampler
+from src.speed_estimation.SpeedEstimator import SpeedEstimator
+from src.utils.frame_source import create_frame_source
+from src.utils.image_utils import get_frame_rate, get_image_patch_from_rect
+
+TEST_VIDEOS = ["../testFiles/25,74kmh.mov"]
+CAMERA_MODEL = "camera_calibration/camera_calibration_iPhoneXR_4k_60.npz"
+
+# Arguments of the FrameSubsampler for every strategy
+STRATEGIES = [
+    ("every frame", dict(stride=1)),
+    ("stride 2", dict(stride=2)),
+    ("stride 3", dict(stride=3)),
+    ("stride 4", dict(stride=4)),
+    ("stride 6", dict(stride=6)),
+    ("adaptive", dict(stride=2, adaptive=True)),
+]
+
+
+def get_true_speed(video_file):
+    return float(os.path.basename(video_file).split("kmh")[0].replace(",", "."))
+
+
+def process_all_frames(video_file, from_sec=7, to_sec=9):
+    """Returns all frames of the clip with their vehicles and plates but without their images, and its frame rate"""
+    yolo = YOLO()
+    license_plate_detection = LicensePlateDetection()
+    camera_calibration = CameraCalibration(CAMERA_MODEL)
+    frame_source = create_frame_source(video_file, from_sec=from_sec, to_sec=to_sec)
+    frame_rate = get_frame_rate(frame_source, SpeedEstimator.FRAME_RATE)
+    frames = []
+    for frame_number, image in enumerate(frame_source.frames()):
+        frame = Frame(frame_number, camera_calibration.undistort(image))
+        frame.vehicles = yolo.detect_vehicle(frame.image)
+        for vehicle in frame.vehicles:
+            vehicle.image = get_image_patch_from_rect(frame.image, vehicle.box)
+        license_plate_detection.detect_plate_candidates_of_frame(frame)
+        license_plate_detection.validate_plates_of_frame(frame)
+        license_plate_detection.measure_plates_of_frame(frame)
+        frame.release_images()
+        frames.append(frame)
+    return frames, frame_rate
+
+
+def replay(frames, subsampler, frame_rate):
+    """Feeds the frames the 'subsampler' lets through to a new estimator and returns it"""
+    estimator = SpeedEstimator(frame_rate)
+    for frame in frames:
+        if subsampler.should_process(frame.frame_number):
+            estimator.add_frame(frame)
+            subsampler.update(frame)
+    return estimator
+
+
+if __name__ == "__main__":
+    rows = []
+    for video_file in TEST_VIDEOS:
+        true_speed = get_true_speed(video_file)
+        frames, frame_rate = process_all_frames(video_file)
+        for name, arguments in STRATEGIES:
+            subsampler = FrameSubsampler(**arguments)
+            estimator = replay(frames, subsampler, frame_rate)
+            speed = estimator.estimate_speed()
+            speed_fit = estimator.fit_speed()
+            fitted_speed = speed_fit.speed if speed_fit is not None else float("nan")
+            rows.append([os.path.basename(video_file), name, subsampler.processed_fraction, speed,
+                         abs(speed - true_speed), fitted_speed, abs(fitted_speed - true_speed)])
+    print(tabulate(rows, ["Video", "strategy", "fraction processed", "speed", "error", "fitted speed",
+                          "fitted error"]))
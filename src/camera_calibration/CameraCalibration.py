@@ -4,11 +4,12 @@ https://opencv-python-tutroals.readthedocs.io/en/latest/py_tutorials/py_calib3d/
 """
 
 import glob
+import os
 
 import cv2.cv2 as cv2
 import numpy as np
 
-from src.utils.image_utils import resize_image
+from src.utils.image_utils import resize_image, get_image_patch_from_rect
 from src.utils.timer import timing
 
 
@@ -18,11 +19,70 @@ class CameraCalibration:
     """
 
     def __init__(self, path_to_camera_model_file):
+        self.path_to_camera_model_file = path_to_camera_model_file
         self.camera_matrix, self.distortion_coeffs, self.camera_matrix_with_crop = load_calibration_data(path_to_camera_model_file)
+        # Rectification maps for the frame size (width, height) they were built for
+        self.map_size = None
+        self.map1 = None
+        self.map2 = None
 
     @timing
     def undistort(self, image):
-        return cv2.undistort(image, self.camera_matrix, self.distortion_coeffs, None, self.camera_matrix_with_crop)
+        """Removes the distortion from the image by remapping it with precomputed rectification maps"""
+        self._ensure_maps(image.shape[1], image.shape[0])
+        return cv2.remap(image, self.map1, self.map2, cv2.INTER_LINEAR)
+
+    @timing
+    def undistort_patch(self, image, rect):
+        """
+        Returns the same patch as get_image_patch_from_rect(self.undistort(image), rect) where 'rect' is given in
+        undistorted coordinates. Only the pixels within the rect are rectified, the rest of the frame is never touched.
+        """
+        self._ensure_maps(image.shape[1], image.shape[0])
+        top, left, bottom, right = [int(x) for x in rect]
+        map_height, map_width = self.map1.shape[:2]
+        # getRectSubPix interpolates between neighbouring pixels which is why one more row and column are needed
+        roi_top, roi_left = max(top, 0), max(left, 0)
+        roi_bottom, roi_right = min(bottom + 1, map_height), min(right + 1, map_width)
+        if roi_top >= roi_bottom or roi_left >= roi_right:
+            return get_image_patch_from_rect(self.undistort(image), rect)
+
+        rectified_roi = cv2.remap(image, self.map1[roi_top:roi_bottom, roi_left:roi_right],
+                                  self.map2[roi_top:roi_bottom, roi_left:roi_right], cv2.INTER_LINEAR)
+        return get_image_patch_from_rect(rectified_roi, (top - roi_top, left - roi_left, bottom - roi_top, right - roi_left))
+
+    def undistort_box(self, box, points_per_edge=5):
+        """
+        Maps a box (top, left, bottom, right) found on a distorted frame into undistorted coordinates.
+        As straight edges become curves, multiple points along every edge are mapped and the enclosing box is returned.
+        """
+        top, left, bottom, right = box
+        xs = np.linspace(left, right, points_per_edge)
+        ys = np.linspace(top, bottom, points_per_edge)
+        border_points = np.concatenate([
+            np.stack([xs, np.full_like(xs, top)], axis=1),
+            np.stack([xs, np.full_like(xs, bottom)], axis=1),
+            np.stack([np.full_like(ys, left), ys], axis=1),
+            np.stack([np.full_like(ys, right), ys], axis=1),
+        ]).astype(np.float32).reshape(-1, 1, 2)
+        undistorted_points = cv2.undistortPoints(border_points, self.camera_matrix, self.distortion_coeffs,
+                                                 P=self.camera_matrix_with_crop).reshape(-1, 2)
+        min_x, min_y = undistorted_points.min(axis=0)
+        max_x, max_y = undistorted_points.max(axis=0)
+        return np.array([min_y, min_x, max_y, max_x]).round()
+
+    def _ensure_maps(self, width, height):
+        """Makes sure the rectification maps fit the given frame size. They are loaded from the cache or built."""
+        if self.map_size == (width, height):
+            return
+        path_to_maps_file = get_path_to_maps_file(self.path_to_camera_model_file, width, height)
+        if os.path.isfile(path_to_maps_file):
+            self.map1, self.map2 = load_undistortion_maps(path_to_maps_file)
+        else:
+            self.map1, self.map2 = calculate_undistortion_maps(self.camera_matrix, self.distortion_coeffs,
+                                                               self.camera_matrix_with_crop, width, height)
+            np.savez(path_to_maps_file, map1=self.map1, map2=self.map2)
+        self.map_size = (width, height)
 
 
 def calculate_camera_matrix_and_distortion_coefficients(camera_model_name):
@@ -78,6 +138,27 @@ def load_calibration_data(path_to_camera_model_file):
     return camera_matrix, distortion_coeffs, camera_matrix_with_crop
 
 
+@timing
+def calculate_undistortion_maps(camera_matrix, distortion_coeffs, camera_matrix_with_crop, width, height):
+    """
+    Builds the rectification maps for frames of the given size. They are stored as compact fixed-point maps
+    (CV_16SC2 coordinates plus an interpolation table) which are about half the size of float maps and faster to remap.
+    """
+    return cv2.initUndistortRectifyMap(camera_matrix, distortion_coeffs, None, camera_matrix_with_crop,
+                                       (width, height), cv2.CV_16SC2)
+
+
+def get_path_to_maps_file(path_to_camera_model_file, width, height):
+    """The maps are cached next to the calibration file, one file per frame size"""
+    base_path, _ = os.path.splitext(path_to_camera_model_file)
+    return "%s_maps_%dx%d.npz" % (base_path, width, height)
+
+
+def load_undistortion_maps(path_to_maps_file):
+    data = np.load(path_to_maps_file)
+    return data["map1"], data["map2"]
+
+
 def undistort(image_path, camera_matrix, distortion_coeffs, camera_matrix_with_crop):
     image = cv2.imread(image_path)
     cv2.imshow('distorted', resize_image(image, (1920, 1080)))
@@ -0,0 +1,92 @@
+"""
+Two-tier vehicle detection: a cheap detector (tiny yolo) runs on every frame and the full yolo only where the cheap one
+is uncertain.
+"""
+from collections import Counter
+
+from tabulate import tabulate
+
+from src.Video import Vehicle
+from src.utils.image_utils import get_intersection_over_union
+
+# Model files of the tiny yolo, to be passed to YOLO
+TINY_YOLO = {
+    "model_path": 'car_detection/model_data/yolo_tiny.h5',
+    "anchors_path": 'car_detection/model_data/tiny_yolo_anchors.txt',
+}
+
+
+class DetectorCascade:
+    """
+    Wraps a cheap and a full vehicle detector and can be used in place of a YOLO. The full detector runs on a frame if
+    the cheap one finds no vehicle, a vehicle with a score below 'min_score', or vehicles that do not match the ones it
+    found in the previous frame: a different number of them or one that overlaps none of the previous ones by at least
+    'min_iou'. The result of the full detector replaces the one of the cheap detector then.
+    Comparing with the previous result of the cheap detector, and not with the final one, makes the triggers the same
+    whether the frames are detected one at a time or in batches, in which the final result of the previous frame is
+    not known yet.
+    """
+
+    def __init__(self, cheap_detector, full_detector, min_score=0.5, min_iou=0.5):
+        self.cheap_detector = cheap_detector
+        self.full_detector = full_detector
+        self.min_score = min_score
+        self.min_iou = min_iou
+        # Vehicles the cheap detector found in the previous frame
+        self.previous_vehicles = None
+        self.number_of_frames = 0
+        self.triggers = Counter()
+
+    def detect_vehicle(self, image) -> [Vehicle]:
+        vehicles = self.cheap_detector.detect_vehicle(image)
+        triggered = self._check_trigger(vehicles) is not None
+        self.previous_vehicles = vehicles
+        if triggered:
+            vehicles = self.full_detector.detect_vehicle(image)
+        return vehicles
+
+    def detect_vehicles_batch(self, images) -> [[Vehicle]]:
+        """Runs the cheap detector on all 'images' and the full detector once on all of those where it is triggered"""
+        vehicles_per_image = self.cheap_detector.detect_vehicles_batch(images)
+        triggered_indexes = []
+        for index, vehicles in enumerate(vehicles_per_image):
+            if self._check_trigger(vehicles) is not None:
+                triggered_indexes.append(index)
+            self.previous_vehicles = vehicles
+        if triggered_indexes:
+            full_vehicles_per_image = self.full_detector.detect_vehicles_batch([images[i] for i in triggered_indexes])
+            for index, vehicles in zip(triggered_indexes, full_vehicles_per_image):
+                vehicles_per_image[index] = vehicles
+        return vehicles_per_image
+
+    def _check_trigger(self, vehicles):
+        """Returns why the full detector has to run on the frame with the cheaply found 'vehicles', or None"""
+        self.number_of_frames += 1
+        reason = None
+        if len(vehicles) == 0:
+            reason = "no vehicle"
+        elif min(vehicle.score for vehicle in vehicles) < self.min_score:
+            reason = "low score"
+        elif self.previous_vehicles is not None and not self._matches_previous_vehicles(vehicles):
+            reason = "disagreement with previous frame"
+        if reason is not None:
+            self.triggers[reason] += 1
+        return reason
+
+    def _matches_previous_vehicles(self, vehicles):
+        if len(vehicles) != len(self.previous_vehicles):
+            return False
+        return all(max(get_intersection_over_union(vehicle.box, previous_vehicle.box)
+                       for previous_vehicle in self.previous_vehicles) >= self.min_iou
+                   for vehicle in vehicles)
+
+    @property
+    def trigger_rate(self):
+        """Fraction of frames on which the full detector had to run"""
+        return sum(self.triggers.values()) / self.number_of_frames if self.number_of_frames > 0 else 0
+
+    def print_statistics(self):
+        rows = [[reason, count, count / self.number_of_frames] for reason, count in self.triggers.most_common()]
+        rows.append(["total", sum(self.triggers.values()), self.trigger_rate])
+        print("Full detector triggered on {0} of {1} frames".format(sum(self.triggers.values()), self.number_of_frames))
+        print(tabulate(rows, ["Reason", "frames", "rate"]))
@@ -45,18 +45,28 @@ def scale_boxes_to_original_image_size(box_xy, box_wh, image_shape):
     return boxes
 
 
-def process_yolo_layer_output(feats, anchors, num_classes, input_shape, image_shape):
-    """Process Conv layer output"""
+def process_yolo_layer_output(feats, anchors, num_classes, input_shape, image_shape, keep_batch_dim=False):
+    """
+    Process Conv layer output. By default all boxes are flattened into one list, which is only correct for a batch
+    size of one. With 'keep_batch_dim' the outputs keep a leading batch dimension, so every image's boxes stay apart.
+    """
     box_xy, box_wh, box_confidence, box_class_probs = yolo_head(feats, anchors, num_classes, input_shape)
 
     box_scores = box_confidence * box_class_probs
     highest_score_indexes = K.argmax(box_scores, axis=-1)
-    box_classes = K.reshape(highest_score_indexes, [-1])
     highest_scores = K.max(box_scores, axis=-1)
-    highest_box_scores = K.reshape(highest_scores, [-1])
 
     boxes = scale_boxes_to_original_image_size(box_xy, box_wh, image_shape)
-    boxes = K.reshape(boxes, [-1, 4])
+
+    if keep_batch_dim:
+        batch_size = K.shape(feats)[0]
+        box_classes = K.reshape(highest_score_indexes, [batch_size, -1])
+        highest_box_scores = K.reshape(highest_scores, [batch_size, -1])
+        boxes = K.reshape(boxes, [batch_size, -1, 4])
+    else:
+        box_classes = K.reshape(highest_score_indexes, [-1])
+        highest_box_scores = K.reshape(highest_scores, [-1])
+        boxes = K.reshape(boxes, [-1, 4])
 
     return boxes, highest_box_scores, box_classes
 
@@ -67,8 +77,13 @@ def yolo_eval(yolo_outputs,
               image_shape,
               score_threshold,
               iou_threshold,
-              max_boxes=20):
-    """Evaluate YOLO model on given input and return nms filtered boxes."""
+              max_boxes=20,
+              class_whitelist=None,
+              min_box_size=0):
+    """
+    Evaluate YOLO model on given input and return nms filtered boxes.
+    Boxes of classes that are not in 'class_whitelist' or too small are dropped before the nms, see filter_boxes.
+    """
     num_layers = len(yolo_outputs)  # This refers to the different scales at which yolo detects objects
     anchor_mask = [[6, 7, 8], [3, 4, 5], [0, 1, 2]] if num_layers == 3 else [[3, 4, 5], [1, 2, 3]]  # default or tiny yolo
     input_shape = K.shape(yolo_outputs[0])[1:3] * 32
@@ -83,12 +98,81 @@ def yolo_eval(yolo_outputs,
     boxes = K.concatenate(boxes, axis=0)
     box_scores = K.concatenate(box_scores, axis=0)
     box_classes = K.concatenate(box_classes, axis=0)
+    boxes, box_scores, box_classes = filter_boxes(boxes, box_scores, box_classes, class_whitelist, min_box_size)
 
     scores_, boxes_, classes_ = non_max_suppression(box_scores, boxes, box_classes, max_boxes, iou_threshold, score_threshold)
 
     return boxes_, scores_, classes_
 
 
+def yolo_eval_batch(yolo_outputs,
+                    anchors,
+                    num_classes,
+                    image_shape,
+                    score_threshold,
+                    iou_threshold,
+                    max_boxes=20,
+                    class_whitelist=None,
+                    min_box_size=0):
+    """
+    Evaluate YOLO model on a batch of images of the same 'image_shape' and return nms filtered boxes per image.
+    As every image can end up with a different number of boxes, the results are padded to 'max_boxes' and the number
+    of valid entries per image is returned as well. 'class_whitelist' and 'min_box_size' work like in yolo_eval.
+    """
+    num_layers = len(yolo_outputs)
+    anchor_mask = [[6, 7, 8], [3, 4, 5], [0, 1, 2]] if num_layers == 3 else [[3, 4, 5], [1, 2, 3]]  # default or tiny yolo
+    input_shape = K.shape(yolo_outputs[0])[1:3] * 32
+    boxes = []
+    box_scores = []
+    box_classes = []
+    for l in range(num_layers):
+        _boxes, _box_scores, _box_classes = process_yolo_layer_output(yolo_outputs[l], anchors[anchor_mask[l]], num_classes, input_shape, image_shape,
+                                                                      keep_batch_dim=True)
+        boxes.append(_boxes)
+        box_scores.append(_box_scores)
+        box_classes.append(_box_classes)
+    boxes = K.concatenate(boxes, axis=1)
+    box_scores = K.concatenate(box_scores, axis=1)
+    box_classes = K.concatenate(box_classes, axis=1)
+
+    def nms_per_image(image_outputs):
+        image_scores, image_boxes, image_classes = image_outputs
+        image_boxes, image_scores, image_classes = filter_boxes(image_boxes, image_scores, image_classes,
+                                                                class_whitelist, min_box_size)
+        scores_, boxes_, classes_ = non_max_suppression(image_scores, image_boxes, image_classes, max_boxes, iou_threshold, score_threshold)
+        number_of_boxes = K.shape(scores_)[0]
+        padding = max_boxes - number_of_boxes
+        scores_ = tf.pad(scores_, [[0, padding]])
+        boxes_ = tf.pad(boxes_, [[0, padding], [0, 0]])
+        classes_ = tf.pad(classes_, [[0, padding]])
+        return scores_, boxes_, classes_, number_of_boxes
+
+    scores_, boxes_, classes_, number_of_boxes = tf.map_fn(nms_per_image, (box_scores, boxes, box_classes),
+                                                           dtype=(box_scores.dtype, boxes.dtype, box_classes.dtype, tf.int32))
+
+    return boxes_, scores_, classes_, number_of_boxes
+
+
+def filter_boxes(boxes, box_scores, box_classes, class_whitelist=None, min_box_size=0):
+    """
+    Drops the boxes whose class is not in 'class_whitelist' (a list of class indexes) and those whose rounded height or
+    width is not larger than 'min_box_size' pixel. Pruning them before the nms saves it from comparing boxes that are
+    thrown away afterwards anyway.
+
+    The class of a box stays the most likely one of all classes, only scoring the whitelisted classes would turn boxes
+    into vehicles that are more likely something else.
+    """
+    keep = tf.ones_like(box_scores, dtype=tf.bool)
+    if class_whitelist is not None:
+        whitelist = tf.constant(class_whitelist, dtype=box_classes.dtype)
+        keep = tf.reduce_any(tf.equal(tf.expand_dims(box_classes, -1), whitelist), axis=-1)
+    if min_box_size > 0:
+        rounded_boxes = tf.round(boxes)
+        keep = tf.logical_and(keep, rounded_boxes[:, 2] - rounded_boxes[:, 0] > min_box_size)
+        keep = tf.logical_and(keep, rounded_boxes[:, 3] - rounded_boxes[:, 1] > min_box_size)
+    return tf.boolean_mask(boxes, keep), tf.boolean_mask(box_scores, keep), tf.boolean_mask(box_classes, keep)
+
+
 def non_max_suppression(scores, boxes, classes, max_boxes=10, iou_threshold=0.5, score_threshold=0.3):
     """
     Applies Non-max suppression (NMS) to a set of boxes
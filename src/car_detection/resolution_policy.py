@@ -0,0 +1,52 @@
+"""
+Selection of the input resolution of the yolo network per frame.
+
+The network accepts any input size that is a multiple of 32. The cost of a frame grows with the number of input pixels,
+but a vehicle has to cover enough input pixels to be found. Large vehicles close to the camera are found at a small
+input resolution, vehicles far away need a large one.
+"""
+from src.Video import Vehicle
+
+
+def get_input_size(image_shape, input_height):
+    """
+    Returns the input size (width, height) of the given height whose width keeps the aspect ratio of the image, both
+    rounded to multiples of 32. A 16:9 frame is not squashed into a square then.
+    """
+    image_height, image_width = image_shape[:2]
+    height = max(32, int(round(input_height / 32)) * 32)
+    width = max(32, int(round(height * image_width / image_height / 32)) * 32)
+    return width, height
+
+
+class InputResolutionPolicy:
+    """
+    Picks the smallest of the 'input_heights' at which the smallest vehicle found in the last frame still covers at
+    least 'min_vehicle_height' input pixels. While no vehicle is in view, the smallest vehicle that counts (of
+    'min_box_size' pixel in the frame) is assumed, which usually means the largest resolution to find vehicles early.
+    """
+
+    def __init__(self, input_heights=(320, 416, 608), min_box_size=150, min_vehicle_height=64):
+        self.input_heights = sorted(input_heights)
+        self.min_box_size = min_box_size
+        self.min_vehicle_height = min_vehicle_height
+        self.smallest_vehicle_height = None
+        self.selected_sizes = {}
+
+    def select(self, image_shape):
+        """Returns the input size (width, height) for the next frame of the given shape"""
+        image_height = image_shape[0]
+        vehicle_height = self.smallest_vehicle_height if self.smallest_vehicle_height is not None else self.min_box_size
+        input_height = self.input_heights[-1]
+        for candidate_height in self.input_heights:
+            if vehicle_height * candidate_height / image_height >= self.min_vehicle_height:
+                input_height = candidate_height
+                break
+        input_size = get_input_size(image_shape, input_height)
+        self.selected_sizes[input_size] = self.selected_sizes.get(input_size, 0) + 1
+        return input_size
+
+    def update(self, vehicles: [Vehicle]):
+        """Takes the vehicles found in the frame"""
+        heights = [vehicle.box[2] - vehicle.box[0] for vehicle in vehicles]
+        self.smallest_vehicle_height = min(heights) if heights else None
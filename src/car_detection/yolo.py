@@ -5,16 +5,41 @@ Class definition of YOLO_v3 style detection model on image and video
 import os
 
 import numpy as np
+import tensorflow as tf
 from tensorflow.python.keras import backend as K
 from tensorflow.python.keras.models import load_model
 from tensorflow.python.keras.utils import multi_gpu_model
 
 from src.Video import Vehicle
-from src.car_detection.model import yolo_eval
+from src.car_detection.model import yolo_eval, yolo_eval_batch
+from src.car_detection.resolution_policy import InputResolutionPolicy
+from src.utils.frozen_graph import FrozenGraph
 from src.utils.timer import timing
 from src.utils.image_utils import resize_image
 from tensorflow.python import debug as tf_debug  # only used for debugging during development
 
+# Where export_frozen_graphs.py writes the frozen inference graph
+FROZEN_GRAPH_PATH = 'car_detection/model_data/yolo_frozen.pb'
+
+# Precisions the network can be run in, all but float32 need a quantized model written by quantize_yolo.py
+PRECISIONS = ["float32", "float16", "int8"]
+
+
+def get_quantized_model_path(precision):
+    return 'car_detection/model_data/yolo_{0}.tflite'.format(precision)
+
+
+def prepare_image(image, model_image_size):
+    """Resizes the image to the input size (width, height) of the network and normalizes it"""
+    return normalize_images(resize_image(image, model_image_size))
+
+
+def normalize_images(images):
+    """Converts (a batch of) images that have the input size of the network to its float input"""
+    image_data = np.array(images, dtype='float32')
+    image_data /= 255.
+    return image_data
+
 
 @timing
 class YOLO:
@@ -28,20 +53,73 @@ class YOLO:
         "iou": 0.45,
         "model_image_size": (416, 416),
         "gpu_num": 1,
+        # Frozen inference graph written by export_frozen_graphs.py, used instead of the Keras model if set
+        "frozen_graph_path": None,
+        # One of PRECISIONS. Reduced precisions run the quantized network with tflite, only the post-processing runs in
+        # tensorflow then. The input size of a quantized network is fixed to the model_image_size it was quantized with.
+        "precision": "float32",
+        # Only boxes of these classes whose height and width exceed min_box_size pixel are vehicles. With
+        # prune_before_nms the other boxes are already dropped within the graph, before the non max suppression. This
+        # can change the found vehicles: the nms does not tell classes apart, so a dropped person box no longer
+        # suppresses a vehicle it overlaps, and more vehicles fit into its max_boxes. Only turn it on if
+        # benchmarks/post_processing_comparison.py shows no difference on the videos at hand.
+        "vehicle_classes": ["car", "bus", "truck"],
+        "min_box_size": 150,
+        "prune_before_nms": False,
+        # If set, the network and the post-processing run in two session calls that are timed separately as
+        # _run_network and _post_process. This copies the feature maps out of the graph and back in on every call.
+        "time_post_processing": False,
+        # If set, the input resolution is picked per frame from input_heights by an InputResolutionPolicy instead of
+        # always using model_image_size. The widths keep the aspect ratio of the frames. Not possible with a quantized
+        # network, whose input size is fixed.
+        "dynamic_input_resolution": False,
+        "input_heights": (320, 416, 608),
     }
 
-    def __init__(self):
+    def __init__(self, **kwargs):
         self.__dict__.update(self._defaults)  # set up default values
+        self.__dict__.update(kwargs)  # and update with user overrides
         self.class_names = self._get_classes()
         self.anchors = self._get_anchors()
-        self.sess = K.get_session()
+        self.class_whitelist = None
+        if self.prune_before_nms:
+            self.class_whitelist = [self.class_names.index(class_name) for class_name in self.vehicle_classes]
+        self.resolution_policy = None
+        if self.dynamic_input_resolution:
+            assert self.precision == "float32", 'A quantized network has a fixed input resolution'
+            self.resolution_policy = InputResolutionPolicy(self.input_heights, self.min_box_size)
+        self.frozen_graph = None
+        self.interpreter = None
+        if self.frozen_graph_path is not None:
+            # The frozen graph already contains the float32 network and the post-processing, score and iou thresholds
+            # and the pruning are fixed on export
+            assert self.precision == "float32", 'A frozen graph runs the float32 network'
+            assert not self.time_post_processing, 'A frozen graph runs the network and the post-processing in one call'
+            self.frozen_graph = FrozenGraph(os.path.expanduser(self.frozen_graph_path))
+            assert self.frozen_graph.settings == self.get_graph_settings(), \
+                'The frozen graph was exported with {0}, export it again for {1}'.format(self.frozen_graph.settings,
+                                                                                      self.get_graph_settings())
+            print('{} frozen graph loaded.'.format(self.frozen_graph_path))
+            return
+        # Every instance builds its model in a graph and session of its own, so several models, e.g. the tiny and the
+        # full yolo, can be used side by side without sharing the global Keras session
+        self.graph = tf.Graph()
+        self.sess = tf.Session(graph=self.graph)
 
         # Use this for debugging
-        # sess = tf_debug.LocalCLIDebugWrapperSession(self.sess)
-        # K.set_session(sess)
-        # self.sess = K.get_session()
+        # self.sess = tf_debug.LocalCLIDebugWrapperSession(self.sess)
 
-        self.boxes, self.scores, self.classes = self.generate()
+        with self.graph.as_default(), self.sess.as_default():
+            # The models are only used for inference, so their training branches (e.g. of batch norm) are not built
+            K.set_learning_phase(0)
+            if self.precision != "float32":
+                self.boxes, self.scores, self.classes = self._load_quantized_model()
+                return
+
+            self.boxes, self.scores, self.classes = self.generate()
+            self.batch_boxes, self.batch_scores, self.batch_classes, self.batch_number_of_boxes = yolo_eval_batch(
+                self.feature_maps, self.anchors, len(self.class_names), self.input_image_shape, self.score, self.iou,
+                **self._get_pruning_arguments())
 
     def _get_classes(self):
         classes_path = os.path.expanduser(self.classes_path)
@@ -76,43 +154,159 @@ class YOLO:
         self.input_image_shape = K.placeholder(shape=(2,))
         if self.gpu_num >= 2:
             self.yolo_model = multi_gpu_model(self.yolo_model, gpus=self.gpu_num)
-        boxes, scores, classes = yolo_eval(self.yolo_model.output, self.anchors, len(self.class_names),
-                                           self.input_image_shape, self.score, self.iou)
+        # The post-processing takes the outputs of the network, it can also be fed with them, see time_post_processing
+        self.feature_maps = self.yolo_model.output
+        boxes, scores, classes = yolo_eval(self.feature_maps, self.anchors, len(self.class_names),
+                                           self.input_image_shape, self.score, self.iou, **self._get_pruning_arguments())
         return boxes, scores, classes
 
+    def _get_pruning_arguments(self):
+        if not self.prune_before_nms:
+            return {}
+        return {"class_whitelist": self.class_whitelist, "min_box_size": self.min_box_size}
+
+    def _load_quantized_model(self):
+        """Loads the quantized network and builds the post-processing that takes its outputs"""
+        assert self.precision in PRECISIONS, 'Unknown precision: ' + self.precision
+        model_path = get_quantized_model_path(self.precision)
+        assert os.path.exists(model_path), 'No {0} model, quantize_yolo.py writes it'.format(self.precision)
+        self.interpreter = tf.lite.Interpreter(model_path=os.path.abspath(model_path))
+        self.interpreter.allocate_tensors()
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        # The outputs have to be ordered like the anchor masks, i.e. from the coarsest to the finest grid
+        output_details = sorted(self.interpreter.get_output_details(), key=lambda details: details["shape"][1])
+        self.output_indexes = [details["index"] for details in output_details]
+        print('{} quantized model loaded.'.format(model_path))
+
+        self.feature_maps = [K.placeholder(shape=(None, None, None, details["shape"][-1])) for details in output_details]
+        self.input_image_shape = K.placeholder(shape=(2,))
+        return yolo_eval(self.feature_maps, self.anchors, len(self.class_names), self.input_image_shape, self.score,
+                         self.iou, **self._get_pruning_arguments())
+
+    def _run(self, outputs, image_data, height, width):
+        """Runs the network and the post-processing that computes the 'outputs' on the (batch of) prepared images"""
+        if self.interpreter is None and not self.time_post_processing:
+            return self.sess.run(outputs, feed_dict={self.yolo_model.input: image_data,
+                                                     self.input_image_shape: [height, width]})
+        return self._post_process(outputs, self._run_network(image_data), height, width)
+
+    @timing
+    def _run_network(self, image_data):
+        """Runs the network on the (batch of) prepared images and returns its outputs"""
+        if self.interpreter is not None:
+            self.interpreter.set_tensor(self.input_index, image_data)
+            self.interpreter.invoke()
+            return [self.interpreter.get_tensor(index) for index in self.output_indexes]
+        return self.sess.run(self.feature_maps, feed_dict={self.yolo_model.input: image_data})
+
+    @timing
+    def _post_process(self, outputs, network_outputs, height, width):
+        """Computes the 'outputs' of the post-processing, e.g. the boxes after nms, from the outputs of the network"""
+        feed_dict = dict(zip(self.feature_maps, network_outputs))
+        feed_dict[self.input_image_shape] = [height, width]
+        return self.sess.run(outputs, feed_dict=feed_dict)
+
     @timing
     def detect_vehicle(self, image) -> [Vehicle]:
         """Runs the yolo network on this 'image' and returns a list of found vehicles"""
 
         # Preparing the input data
         height, width, _ = image.shape
-        resized_image = resize_image(image, self.model_image_size)
-        image_data = np.array(resized_image, dtype='float32')
-        image_data /= 255.
-        image_data = np.expand_dims(image_data, 0)  # Add batch dimension.
+        input_size = self._select_input_size(image.shape)
+        image_data = np.expand_dims(prepare_image(image, input_size), 0)  # Add batch dimension.
 
         # Where the magic happens
-        out_boxes, out_scores, out_classes = self.sess.run(
-            [self.boxes, self.scores, self.classes],
-            feed_dict={
-                self.yolo_model.input: image_data,
-                self.input_image_shape: [height, width],
-                K.learning_phase(): 0
-            })
+        if self.frozen_graph is not None:
+            out_boxes, out_scores, out_classes = self.frozen_graph.run(
+                ["boxes", "scores", "classes"], {"image": image_data, "image_shape": [height, width]})
+        else:
+            out_boxes, out_scores, out_classes = self._run([self.boxes, self.scores, self.classes], image_data, height,
+                                                           width)
+
+        vehicles = self._filter_vehicles(out_boxes, out_scores, out_classes)
+        if self.resolution_policy is not None:
+            self.resolution_policy.update(vehicles)
+        return vehicles
+
+    @timing
+    def detect_vehicles_batch(self, images) -> [[Vehicle]]:
+        """
+        Runs the yolo network once on all 'images' and returns a list of found vehicles per image.
+        All images have to be of the same size, e.g. consecutive frames of one video.
+        """
+        if len(images) == 0:
+            return []
+        height, width, _ = images[0].shape
+        assert all(image.shape == images[0].shape for image in images), 'All images of a batch must have the same shape'
+        # All images of the batch are fed at the same resolution
+        input_size = self._select_input_size(images[0].shape)
+        image_data = np.stack([prepare_image(image, input_size) for image in images])
+        vehicles_per_image = self.detect_vehicles_in_image_data(image_data, height, width)
+        if self.resolution_policy is not None:
+            self.resolution_policy.update(vehicles_per_image[-1])
+        return vehicles_per_image
+
+    def detect_vehicles_in_image_data(self, image_data, height, width) -> [[Vehicle]]:
+        """
+        Runs the yolo network on a batch of images that were already prepared with prepare_image and returns a list of
+        found vehicles per image. 'height' and 'width' are the size of the original images.
+        """
+        if self.interpreter is not None:
+            # The quantized network takes one image at a time
+            return [self._filter_vehicles(*self._run([self.boxes, self.scores, self.classes], image_data[i:i + 1],
+                                                     height, width))
+                    for i in range(len(image_data))]
+
+        if self.frozen_graph is not None:
+            out_boxes, out_scores, out_classes, out_number_of_boxes = self.frozen_graph.run(
+                ["batch_boxes", "batch_scores", "batch_classes", "batch_number_of_boxes"],
+                {"image": image_data, "image_shape": [height, width]})
+        else:
+            out_boxes, out_scores, out_classes, out_number_of_boxes = self._run(
+                [self.batch_boxes, self.batch_scores, self.batch_classes, self.batch_number_of_boxes], image_data,
+                height, width)
+
+        # Strip the padding of every image before filtering
+        return [self._filter_vehicles(out_boxes[i][:number_of_boxes], out_scores[i][:number_of_boxes],
+                                      out_classes[i][:number_of_boxes])
+                for i, number_of_boxes in enumerate(out_number_of_boxes)]
+
+    def get_graph_settings(self):
+        """Returns the settings that are built into the graph of the post-processing, see export_frozen_graph"""
+        return dict(score=self.score, iou=self.iou, prune_before_nms=self.prune_before_nms,
+                    **self._get_pruning_arguments())
+
+    def get_inputs_and_outputs(self):
+        """Returns the input and output tensors of the Keras model by name, see export_frozen_graph"""
+        inputs = {"image": self.yolo_model.input, "image_shape": self.input_image_shape}
+        outputs = {"boxes": self.boxes, "scores": self.scores, "classes": self.classes,
+                   "batch_boxes": self.batch_boxes, "batch_scores": self.batch_scores,
+                   "batch_classes": self.batch_classes, "batch_number_of_boxes": self.batch_number_of_boxes}
+        return inputs, outputs
+
+    def _select_input_size(self, image_shape):
+        """Returns the input size (width, height) of the network for an image of the given shape"""
+        if self.resolution_policy is not None:
+            return self.resolution_policy.select(image_shape)
+        return self.model_image_size
+
+    def _filter_vehicles(self, out_boxes, out_scores, out_classes) -> [Vehicle]:
+        """Keeps only the boxes of large enough vehicles and wraps them in Vehicle objects"""
 
         # Resolve class names
         out_class_names = [self.class_names[class_index] for class_index in out_classes]
         # print("Found the following objects: " + str(out_class_names))
 
-        # Filter for vehicles only
+        # Filter for vehicles only, without prune_before_nms this has not happened in the graph yet
         vehicles: [Vehicle] = []
         for i, class_name in enumerate(out_class_names):
-            if class_name == "car" or class_name == "bus" or class_name == "truck":
+            if class_name in self.vehicle_classes:
                 box = out_boxes[i].round()
                 top, left, bottom, right = box
-                if bottom - top > 150 and right - left > 150:
+                if bottom - top > self.min_box_size and right - left > self.min_box_size:
                     vehicle = Vehicle()
                     vehicle.box = box
+                    vehicle.score = float(out_scores[i])
                     vehicles.append(vehicle)
 
         return vehicles
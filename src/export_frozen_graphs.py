@@ -0,0 +1,25 @@
+"""
+Writes frozen inference graphs of the vehicle detection and the plate validation network, see utils/frozen_graph.py.
+The yolo graph includes the post-processing with the score and iou thresholds and the pruning of YOLO._defaults, a
+YOLO that loads it has to use the same.
+
+Has to be run from the /src directory, like main.py. The graphs are loaded with USE_FROZEN_GRAPHS in main.py.
+"""
+import keras.backend
+
+from src.car_detection.yolo import YOLO, FROZEN_GRAPH_PATH as YOLO_FROZEN_GRAPH_PATH
+from src.lp_validation.LPValidation import LPValidation, FROZEN_GRAPH_PATH as LP_VALIDATION_FROZEN_GRAPH_PATH
+from src.utils.frozen_graph import export_frozen_graph
+
+if __name__ == "__main__":
+    # The models are built for inference only, so dropout and the training branches of batch norm are not part of the
+    # graphs. YOLO does so for its own graph, the validation uses the standalone Keras whose learning phase is set here.
+    keras.backend.set_learning_phase(0)
+
+    yolo = YOLO()
+    inputs, outputs = yolo.get_inputs_and_outputs()
+    export_frozen_graph(yolo.sess, inputs, outputs, YOLO_FROZEN_GRAPH_PATH, yolo.get_graph_settings())
+
+    lp_validation = LPValidation()
+    inputs, outputs = lp_validation.get_inputs_and_outputs()
+    export_frozen_graph(keras.backend.get_session(), inputs, outputs, LP_VALIDATION_FROZEN_GRAPH_PATH)
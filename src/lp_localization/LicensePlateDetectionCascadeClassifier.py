@@ -1,39 +1,184 @@
 """This detector uses a trained haar cascade classifier to find license plates within images"""
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2.cv2 as cv2
+import numpy as np
 
 from src.Video import Plate
 from src.lp_validation.LPValidation import LPValidation
 from src.lp_measurement.lp_measurement import get_height_of_license_plate
+from src.lp_measurement.parallel_measurement import PlateMeasurement
 from src.utils.image_utils import get_image_patch_from_rect, save_debug_image
 from src.utils.timer import timing
 
+# Margin around the last plate of a tracked vehicle that is searched, relative to the plate's width and height
+_PLATE_SEARCH_MARGIN = 1.0
+# Factor by which the plate may have grown or shrunk since it was last found
+_PLATE_SCALE_TOLERANCE = 1.3
+# Number of frames after which the last plate of a track is no longer used to predict the search area
+_MAX_PLATE_MEMORY_AGE = 10
+
 
 class LicensePlateDetection:
 
-    def __init__(self):
-        # Loading the classifier
-        path_to_xml_classifier_file = os.path.abspath("lp_localization/lp_cascade.xml")
-        self.classifier = cv2.CascadeClassifier(path_to_xml_classifier_file)
-        # Initializing the plate validator
-        self.validator = LPValidation()
+    def __init__(self, measurement_pool=None, predict_plate_search_area=True, search_whole_frame=False,
+                 detection_threads=1, validator=None):
+        # Optional PlateMeasurementPool, the plates are measured in this process if it is not set
+        self.measurement_pool = measurement_pool
+        # For tracked vehicles, the search can be restricted to the surroundings of the plate found in earlier frames
+        self.predict_plate_search_area = predict_plate_search_area
+        # Searches the vehicle regions of the frame image instead of every vehicle image on its own, see
+        # detect_plate_candidates_of_frame. Requires the vehicle boxes to be in the coordinates of the frame image.
+        self.search_whole_frame = search_whole_frame
+        # Last valid plate per track id as (frame number, plate box in frame coordinates). Frames may be measured by
+        # several threads and finish out of order, see _remember_plates.
+        self.last_plates = {}
+        self._last_plates_lock = threading.Lock()
+        # Loading the classifier. A classifier must not be used by several threads at once, so every thread that
+        # searches for plates loads its own, see _get_classifier.
+        self.path_to_xml_classifier_file = os.path.abspath("lp_localization/lp_cascade.xml")
+        self.classifier = cv2.CascadeClassifier(self.path_to_xml_classifier_file)
+        self._thread_local = threading.local()
+        self._thread_local.classifier = self.classifier
+        # With more than one thread, the vehicle images of a frame are searched concurrently, detectMultiScale releases
+        # the GIL. OpenCV's own thread count should then be lowered so the threads do not oversubscribe the cores.
+        self.detection_threads = detection_threads
+        self.thread_pool = ThreadPoolExecutor(detection_threads) if detection_threads > 1 else None
+        # Initializing the plate validator, unless one is given
+        self.validator = validator if validator is not None else LPValidation()
 
     @timing
     def detect_license_plate_candidates(self, image, debug_mode=False):
         """Orchestrator method that combines the detection, validation and height measurement of license plates"""
         plate_candidates = self.process_image(image, debug_mode)
         self.validator.validate_plates(image, plate_candidates)
-        for plate in plate_candidates:
+        self.measure_valid_plates(image, plate_candidates)
+        return plate_candidates
+
+    @timing
+    def detect_plate_candidates_of_frame(self, frame, debug_mode=False):
+        """
+        Detects the plate candidates of every vehicle in the frame. The vehicle images have to be set.
+        If 'search_whole_frame' is set, the frame image is converted to gray once and the classifier runs once over each
+        group of overlapping vehicle boxes instead of once per vehicle, so pixels shared by several vehicles are only
+        searched once. The plates found are then assigned to every vehicle whose box contains them.
+        """
+        if self.search_whole_frame:
+            self._detect_plate_candidates_in_frame_image(frame)
+            return
+        search_areas = [self._predict_search_area(vehicle, frame.frame_number) for vehicle in frame.vehicles]
+        if self.thread_pool is not None and len(frame.vehicles) > 1:
+            results = list(self.thread_pool.map(
+                lambda vehicle, search_area: self._search_plates(vehicle.image, debug_mode, search_area),
+                frame.vehicles, search_areas))
+        else:
+            results = [self._search_plates(vehicle.image, debug_mode, search_area)
+                       for vehicle, search_area in zip(frame.vehicles, search_areas)]
+        for vehicle, (plates, plates_from_search_area) in zip(frame.vehicles, results):
+            vehicle.plates = plates
+            vehicle.plates_from_search_area = plates_from_search_area
+
+    def _detect_plate_candidates_in_frame_image(self, frame):
+        gray_image = cv2.cvtColor(frame.image, cv2.COLOR_BGR2GRAY)
+        image_height, image_width = gray_image.shape[:2]
+        # Vehicles without candidates in their predicted search area together with the origin of their vehicle image
+        vehicles_to_search = []
+        for vehicle in frame.vehicles:
+            top, left, _, _ = [int(x) for x in vehicle.box]
+            search_area = self._predict_search_area(vehicle, frame.frame_number)
+            lps = ()
+            if search_area is not None:
+                # The search area is given in vehicle coordinates, the vehicle box may reach beyond the frame
+                (area_top, area_left, area_bottom, area_right), min_size, max_size = search_area
+                area = (max(top + area_top, 0), max(left + area_left, 0),
+                        min(top + area_bottom, image_height), min(left + area_right, image_width))
+                if area[0] < area[2] and area[1] < area[3]:
+                    lps = self._detect_in_search_area(gray_image, (area, min_size, max_size))
+            vehicle.plates = self._create_plates(lps - np.array([left, top, 0, 0])) if len(lps) > 0 else []
+            vehicle.plates_from_search_area = len(lps) > 0
+            if len(lps) == 0:
+                vehicles_to_search.append((vehicle, top, left))
+
+        for region in _merge_overlapping_boxes([vehicle.box for vehicle, _, _ in vehicles_to_search]):
+            top, left, bottom, right = [int(x) for x in region]
+            top, left = max(top, 0), max(left, 0)
+            bottom, right = min(bottom, image_height), min(right, image_width)
+            if bottom <= top or right <= left:
+                continue
+            lps = self._get_classifier().detectMultiScale(gray_image[top:bottom, left:right])
+            for plate_left, plate_top, plate_width, plate_height in lps:
+                plate_box = (top + plate_top, left + plate_left,
+                             top + plate_top + plate_height, left + plate_left + plate_width)
+                for vehicle, vehicle_top, vehicle_left in vehicles_to_search:
+                    if _contains(vehicle.box, plate_box):
+                        plate = Plate()
+                        plate.box = [plate_box[0] - vehicle_top, plate_box[1] - vehicle_left,
+                                     plate_box[2] - vehicle_top, plate_box[3] - vehicle_left]
+                        vehicle.plates.append(plate)
+
+    def validate_plates_of_frame(self, frame):
+        """Validates the plate candidates of every vehicle in the frame"""
+        self.validate_plates_of_frames([frame])
+
+    @timing
+    def validate_plates_of_frames(self, frames):
+        """
+        Validates the plate candidates of every vehicle in a window of frames with a single prediction. If the
+        candidates of a vehicle were only searched in its predicted search area and none of them is valid, e.g. because
+        the plate is hidden there or was mixed up with another one, the whole vehicle image is searched and validated
+        once more.
+        """
+        self.validator.validate_plate_groups([(vehicle.image, vehicle.plates) for frame in frames for vehicle in frame.vehicles])
+        missed_vehicles = [vehicle for frame in frames for vehicle in frame.vehicles
+                           if vehicle.plates_from_search_area and not any(plate.valid for plate in vehicle.plates)]
+        for vehicle in missed_vehicles:
+            vehicle.plates, vehicle.plates_from_search_area = self._search_plates(vehicle.image, False)
+        self.validator.validate_plate_groups([(vehicle.image, vehicle.plates) for vehicle in missed_vehicles])
+
+    @timing
+    def measure_plates_of_frame(self, frame):
+        """Measures the height of every valid plate in the frame, using the measurement pool if there is one"""
+        if self.measurement_pool is None:
+            for vehicle in frame.vehicles:
+                self.measure_valid_plates(vehicle.image, vehicle.plates)
+            self._remember_plates(frame)
+            return
+
+        patches = []
+        for vehicle_index, vehicle in enumerate(frame.vehicles):
+            for plate_index, plate in enumerate(vehicle.plates):
+                if plate.valid:
+                    measurement = PlateMeasurement(frame.frame_number, vehicle_index, plate_index)
+                    patches.append((measurement, get_image_patch_from_rect(vehicle.image, plate.box)))
+        for measurement in self.measurement_pool.measure_plates_parallel(patches):
+            plate = frame.vehicles[measurement.vehicle_index].plates[measurement.plate_index]
+            self._set_plate_height(plate, measurement.height)
+        self._remember_plates(frame)
+
+    def measure_valid_plates(self, image, plates):
+        for plate in plates:
             if plate.valid:
                 self.measure_plate_height(image, plate)
-        return plate_candidates
 
-    def process_image(self, image, debug_mode):
+    def process_image(self, image, debug_mode, search_area=None):
         """Detects license plates in the given 'image' using haar features. 'debug_mode' can be set to true to save the
-        found image patches for debugging"""
+        found image patches for debugging. If a 'search_area' is given, only that area is searched first and the whole
+        image only if the classifier found nothing there."""
+        plates, _ = self._search_plates(image, debug_mode, search_area)
+        return plates
+
+    def _search_plates(self, image, debug_mode, search_area=None):
+        """Returns the plates found by process_image and whether they were only searched in the 'search_area'"""
         gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        lps = self.classifier.detectMultiScale(gray_image)
+        lps = ()
+        if search_area is not None:
+            lps = self._detect_in_search_area(gray_image, search_area)
+        plates_from_search_area = len(lps) > 0
+        if not plates_from_search_area:
+            lps = self._get_classifier().detectMultiScale(gray_image)
+        plates = self._create_plates(lps)
 
         if debug_mode:
             for box in lps:
@@ -41,6 +186,11 @@ class LicensePlateDetection:
                 lp_image_patch = cv2.getRectSubPix(image, (w, h), (left + w / 2, top + h / 2))
                 save_debug_image(lp_image_patch, str(abs(hash(image.tostring()))), "plate_candidates")
 
+        return plates, plates_from_search_area
+
+    @staticmethod
+    def _create_plates(lps):
+        """Creates the plates for the boxes (left, top, width, height) found by the classifier"""
         plates: [Plate] = []
         for box in lps:
             plate = Plate()
@@ -49,10 +199,116 @@ class LicensePlateDetection:
             plates.append(plate)
         return plates
 
+    def _get_classifier(self):
+        """Returns the classifier of the calling thread, loading it on first use"""
+        classifier = getattr(self._thread_local, "classifier", None)
+        if classifier is None:
+            classifier = cv2.CascadeClassifier(self.path_to_xml_classifier_file)
+            self._thread_local.classifier = classifier
+        return classifier
+
+    def close(self):
+        """Shuts down the detection threads, if there are any"""
+        if self.thread_pool is not None:
+            self.thread_pool.shutdown()
+
+    def _detect_in_search_area(self, gray_image, search_area):
+        """Runs the classifier on the area (top, left, bottom, right) for plates within the (min size, max size) range"""
+        (top, left, bottom, right), min_size, max_size = search_area
+        lps = self._get_classifier().detectMultiScale(gray_image[top:bottom, left:right], minSize=min_size,
+                                                      maxSize=max_size)
+        if len(lps) == 0:
+            return lps
+        return lps + np.array([left, top, 0, 0])
+
+    def _predict_search_area(self, vehicle, frame_number):
+        """
+        Predicts where the plate of a tracked vehicle will be, based on the plate found in an earlier frame.
+        Returns the area within the vehicle image and the range of plate sizes to search for, or None.
+        """
+        if not self.predict_plate_search_area:
+            return None
+        with self._last_plates_lock:
+            last_plate = self.last_plates.get(vehicle.track_id)
+        if last_plate is None:
+            return None
+        last_frame_number, (plate_top, plate_left, plate_bottom, plate_right) = last_plate
+        if frame_number - last_frame_number > _MAX_PLATE_MEMORY_AGE:
+            return None
+
+        vehicle_top, vehicle_left, _, _ = vehicle.box
+        image_height, image_width = vehicle.image.shape[:2]
+        plate_height, plate_width = plate_bottom - plate_top, plate_right - plate_left
+        margin_y, margin_x = plate_height * _PLATE_SEARCH_MARGIN, plate_width * _PLATE_SEARCH_MARGIN
+        top = int(max(plate_top - vehicle_top - margin_y, 0))
+        left = int(max(plate_left - vehicle_left - margin_x, 0))
+        bottom = int(min(plate_bottom - vehicle_top + margin_y, image_height))
+        right = int(min(plate_right - vehicle_left + margin_x, image_width))
+        if bottom <= top or right <= left:
+            return None
+
+        min_size = (int(plate_width / _PLATE_SCALE_TOLERANCE), int(plate_height / _PLATE_SCALE_TOLERANCE))
+        max_size = (int(plate_width * _PLATE_SCALE_TOLERANCE), int(plate_height * _PLATE_SCALE_TOLERANCE))
+        return (top, left, bottom, right), min_size, max_size
+
+    def _remember_plates(self, frame):
+        """
+        Stores the valid plates of tracked vehicles in frame coordinates and forgets outdated ones. A plate of a frame
+        that finished after a later one does not replace the plate of the later frame.
+        """
+        if not self.predict_plate_search_area:
+            return
+        with self._last_plates_lock:
+            for vehicle in frame.vehicles:
+                if vehicle.track_id is None:
+                    continue
+                last_plate = self.last_plates.get(vehicle.track_id)
+                if last_plate is not None and last_plate[0] > frame.frame_number:
+                    continue
+                for plate in vehicle.plates:
+                    if plate.valid:
+                        vehicle_top, vehicle_left, _, _ = vehicle.box
+                        top, left, bottom, right = plate.box
+                        plate_box = (top + vehicle_top, left + vehicle_left, bottom + vehicle_top, right + vehicle_left)
+                        self.last_plates[vehicle.track_id] = (frame.frame_number, plate_box)
+            for track_id, (last_frame_number, _) in list(self.last_plates.items()):
+                if frame.frame_number - last_frame_number > _MAX_PLATE_MEMORY_AGE:
+                    del self.last_plates[track_id]
+
     def measure_plate_height(self, image, plate):
         image_patch = get_image_patch_from_rect(image, plate.box)
         plate_height = get_height_of_license_plate(image_patch)
+        self._set_plate_height(plate, plate_height)
+
+    @staticmethod
+    def _set_plate_height(plate, plate_height):
         if plate_height is not None:
             plate.height = plate_height
         else:
             plate.valid = False
+
+
+def _contains(outer_box, inner_box):
+    """Tells if the box (top, left, bottom, right) 'outer_box' fully contains 'inner_box'"""
+    return outer_box[0] <= inner_box[0] and outer_box[1] <= inner_box[1] and \
+        inner_box[2] <= outer_box[2] and inner_box[3] <= outer_box[3]
+
+
+def _merge_overlapping_boxes(boxes):
+    """Merges the boxes (top, left, bottom, right) into the bounding boxes of the groups of overlapping boxes"""
+    regions = [list(box) for box in boxes]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                first, second = regions[i], regions[j]
+                if first[0] < second[2] and second[0] < first[2] and first[1] < second[3] and second[1] < first[3]:
+                    regions[i] = [min(first[0], second[0]), min(first[1], second[1]),
+                                  max(first[2], second[2]), max(first[3], second[3])]
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return regions
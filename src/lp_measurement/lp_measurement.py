@@ -71,34 +71,62 @@ def perfect_line(image, line):
     This method takes a line and tries to align it as closely as possible with a high contrast boundary found on the
     image in its vicinity. It does so by measuring at multiple points along the line how far of it is from the highest
     contrast boundary and uses curve fitting to adopt the line accordingly.
+    All measuring points are sampled at once and all curves are fitted in one batched least squares solve. The
+    measuring lines are drawn onto the image.
     """
+    actual_line_points = get_actual_line_points(image, line)
+    line_start, line_end = best_fit_line_from_points(actual_line_points)
+    return line_start, line_end
+
+
+def get_actual_line_points(image, line):
+    """Returns the points of highest contrast along the perpendiculars of the line as an array of (x, y) points"""
     ten_percent_of_image_height = image.shape[0] * 0.1
     gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     pt1, pt2 = line
     dx, dy = pt1[0] - pt2[0], pt1[1] - pt2[1]
     angle_rad = math.atan2(dy, dx)
-    points_on_line = get_equidistant_points(pt1, pt2, _NUM_OF_HORIZONTAL_MEASURING_POINTS)
-    actual_line_points = []
-    for point in points_on_line:
-        first_point = get_pixel_at(point, ten_percent_of_image_height, angle_rad + np.pi / 2)
-        second_point = get_pixel_at(point, - ten_percent_of_image_height, angle_rad + np.pi / 2)
-        cv2.line(image, first_point, second_point, (0, 0, 255), 1)
-        measuring_points = get_equidistant_points(first_point, second_point, _NUM_OF_VERTICAL_MEASURING_POINTS)
-        gray_values = []
-        for measuring_point in measuring_points:
-            y = min(measuring_point[1], gray_image.shape[0] - 1)
-            x = min(measuring_point[0], gray_image.shape[1] - 1)
-            gray_values.append(float(gray_image[y][x]))
-
-        line_point_in_array = find_actual_line_point(gray_values, ten_percent_of_image_height * 2)
-        if line_point_in_array is not None:
-            actual_line_point = get_point_at(first_point, line_point_in_array, angle_rad - np.pi / 2)
-            actual_line_points.append(actual_line_point)
-    #         cv2.line(image, (int(actual_line_point[0]), int(actual_line_point[1])), get_pixel_at(actual_line_point, ten_percent_of_image_height, angle_rad), (0, 255, 0), 1)
-    #
-    # show(image, "measuring")
-    line_start, line_end = best_fit_line_from_points(actual_line_points)
-    return line_start, line_end
+
+    # Start and end pixels of the perpendicular measuring lines through the points on the line
+    line_xs = np.linspace(pt1[0], pt2[0], _NUM_OF_HORIZONTAL_MEASURING_POINTS, dtype=int)
+    line_ys = np.linspace(pt1[1], pt2[1], _NUM_OF_HORIZONTAL_MEASURING_POINTS, dtype=int)
+    offset_x = ten_percent_of_image_height * math.cos(angle_rad + np.pi / 2)
+    offset_y = ten_percent_of_image_height * math.sin(angle_rad + np.pi / 2)
+    first_xs, first_ys = (line_xs + offset_x).astype(int), (line_ys + offset_y).astype(int)
+    second_xs, second_ys = (line_xs - offset_x).astype(int), (line_ys - offset_y).astype(int)
+
+    # One gather for the gray values of all measuring points, one row per measuring line
+    sample_xs = np.linspace(first_xs, second_xs, _NUM_OF_VERTICAL_MEASURING_POINTS, axis=1, dtype=int)
+    sample_ys = np.linspace(first_ys, second_ys, _NUM_OF_VERTICAL_MEASURING_POINTS, axis=1, dtype=int)
+    sample_xs = np.minimum(sample_xs, gray_image.shape[1] - 1)
+    sample_ys = np.minimum(sample_ys, gray_image.shape[0] - 1)
+    gray_values = gray_image[sample_ys, sample_xs].astype(float)
+    # Like the original point by point implementation, so the lines of a later call see the same image
+    for first_point, second_point in zip(zip(first_xs, first_ys), zip(second_xs, second_ys)):
+        cv2.line(image, (int(first_point[0]), int(first_point[1])), (int(second_point[0]), int(second_point[1])),
+                 (0, 0, 255), 1)
+
+    line_points_in_array = find_actual_line_points(gray_values, ten_percent_of_image_height * 2)
+    found = ~np.isnan(line_points_in_array)
+    actual_xs = first_xs[found] + line_points_in_array[found] * math.cos(angle_rad - np.pi / 2)
+    actual_ys = first_ys[found] + line_points_in_array[found] * math.sin(angle_rad - np.pi / 2)
+    return np.stack([actual_xs, actual_ys], axis=1)
+
+
+def find_actual_line_points(gray_values, length_of_measuring_line):
+    """
+    Vectorized version of find_actual_line_point that takes one row of gray values per measuring line. Returns the
+    point of highest contrast for every row, NaN where it does not lay on the measuring line.
+    """
+    # Fitting on positions normalized to [0, 1] keeps the least squares problem well conditioned
+    positions = np.linspace(0, 1, gray_values.shape[1])
+    vandermonde = np.vander(positions, 4, increasing=True)
+    coeffs = np.linalg.lstsq(vandermonde, gray_values.T, rcond=None)[0]
+    # The second derivative of c0 + c1*x + c2*x^2 + c3*x^3 is 2*c2 + 6*c3*x, which is zero at -c2 / (3*c3)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roots = -coeffs[2] / (3 * coeffs[3]) * length_of_measuring_line
+    on_measuring_line = (0 <= roots) & (roots <= length_of_measuring_line)
+    return np.where(on_measuring_line, roots, np.nan)
 
 
 def best_fit_line_from_points(points):
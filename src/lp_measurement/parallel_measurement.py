@@ -0,0 +1,98 @@
+"""
+Process pool that measures license plates in parallel.
+
+The measurement runs in Python loops that hold the GIL, so threads do not help here. The image patches are handed to
+the worker processes through a buffer in shared memory that is created together with the pool instead of being
+pickled, only their position within the buffer travels along with the task.
+"""
+
+import multiprocessing
+import threading
+from dataclasses import dataclass
+
+import cv2.cv2 as cv2
+import numpy as np
+
+from src.lp_measurement.lp_measurement import get_height_of_license_plate
+from src.utils.timer import timing
+
+# Size of the buffer the patches are handed over in. The plates of a frame take far less, more patches are measured in
+# several rounds.
+BUFFER_SIZE = 16 * 1024 * 1024
+
+# The buffer as seen by a worker process
+_worker_buffer = None
+
+
+@dataclass
+class PlateMeasurement:
+    """Tags a plate measurement with the frame, vehicle and plate it belongs to"""
+    frame_number: int
+    vehicle_index: int
+    plate_index: int
+    height: float = None
+
+
+def _init_worker(buffer):
+    global _worker_buffer
+    _worker_buffer = np.frombuffer(buffer, dtype=np.uint8)
+    # Every worker measures one plate at a time, OpenCV's own threads would only oversubscribe the cpu
+    cv2.setNumThreads(1)
+
+
+def _measure_patch(task):
+    offset, shape, patch, measurement = task
+    if patch is None:
+        patch = _worker_buffer[offset:offset + int(np.prod(shape))].reshape(shape).copy()
+    measurement.height = get_height_of_license_plate(patch)
+    return measurement
+
+
+class PlateMeasurementPool:
+    """
+    Keeps a pool of worker processes alive so their startup is only paid once per video. It should be created before
+    any tensorflow model is loaded, as forking a process with a tensorflow session and its threads is not safe.
+    """
+
+    def __init__(self, processes=None, buffer_size=BUFFER_SIZE):
+        self.buffer = multiprocessing.RawArray("B", buffer_size)
+        self.buffer_array = np.frombuffer(self.buffer, dtype=np.uint8)
+        # The measurement of several frames may be requested by different threads, but there is only one buffer
+        self.buffer_lock = threading.Lock()
+        self.pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(self.buffer,))
+
+    @timing
+    def measure_plates_parallel(self, patches) -> [PlateMeasurement]:
+        """
+        Takes a list of (PlateMeasurement, image patch) tuples, measures all patches in the worker processes and returns
+        the measurements with their height set. The height is None if the plate could not be measured.
+        """
+        measurements = []
+        with self.buffer_lock:
+            tasks = []
+            offset = 0
+            for measurement, patch in patches:
+                if patch.nbytes > len(self.buffer_array):
+                    # Does not fit into the buffer at all, so it is pickled
+                    tasks.append((0, patch.shape, patch, measurement))
+                    continue
+                if offset + patch.nbytes > len(self.buffer_array):
+                    measurements += self.pool.map(_measure_patch, tasks)
+                    tasks = []
+                    offset = 0
+                self.buffer_array[offset:offset + patch.nbytes] = patch.ravel()
+                tasks.append((offset, patch.shape, None, measurement))
+                offset += patch.nbytes
+            if len(tasks) > 0:
+                measurements += self.pool.map(_measure_patch, tasks)
+        return measurements
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,18 +1,31 @@
 import os
 import numpy as np
+import tensorflow as tf
 
+from src.utils.frozen_graph import FrozenGraph
 from src.utils.image_utils import resize_image, get_image_patch_from_rect
 from src.utils.timer import timing
 from src.lp_validation.TrainLPValidationNet import create_model
 
 img_rows, img_cols = 50, 150
 
+# Where export_frozen_graphs.py writes the frozen inference graph
+FROZEN_GRAPH_PATH = "lp_validation/model_data/lp_validation_frozen.pb"
+
 
 class LPValidation:
 
-    def __init__(self):
+    def __init__(self, frozen_graph_path=None):
+        # A frozen inference graph written by export_frozen_graphs.py is used instead of the Keras model if it is given
+        self.frozen_graph = None
+        if frozen_graph_path is not None:
+            self.frozen_graph = FrozenGraph(os.path.abspath(frozen_graph_path))
+            return
         self.lp_validation_model = create_model()
         self.lp_validation_model.load_weights(os.path.abspath("lp_validation/model_data/lp_validation.h5"))
+        # Building the predict function up front and remembering the graph allows predictions from other threads
+        self.lp_validation_model._make_predict_function()
+        self.graph = tf.get_default_graph()
 
     @timing
     def validate_plates(self, image, plate_candidates):
@@ -20,16 +33,40 @@ class LPValidation:
         Takes a set of 'plate_candidates' and uses a cnn to validate if those coordinates contain a license
         plate on the original 'image'. The result is saved within the Plate model.
         """
-        if len(plate_candidates) > 0:
+        self.validate_plate_groups([(image, plate_candidates)])
+
+    @timing
+    def validate_plate_groups(self, groups):
+        """
+        Validates the candidates of many vehicles, e.g. of all vehicles within a window of frames, with a single
+        prediction. 'groups' is a list of (image, plate_candidates) tuples, usually one per vehicle. Within every group
+        only the candidate with the highest confidence can be valid.
+        """
+        patches = [resize_image(get_image_patch_from_rect(image, plate.box), (img_cols, img_rows))
+                   for image, plate_candidates in groups for plate in plate_candidates]
+        if len(patches) == 0:
+            return
+        confidences = self._predict(np.stack(patches))
+
+        confidence_index = 0
+        for _, plate_candidates in groups:
             for plate in plate_candidates:
-                image_patch = get_image_patch_from_rect(image, plate.box)
-                plate.confidence = self._predict(image_patch)
-            plate_with_heighest_confidence = sorted(plate_candidates, key=lambda p: (p.confidence, ), reverse=True)[0]
-            if plate_with_heighest_confidence.confidence >= 0.9:
-                plate_with_heighest_confidence.valid = True
-
-    def _predict(self, license_plate_candidate):
-        resized_patch = resize_image(license_plate_candidate, (img_cols, img_rows))
-        expanded_dims_for_batch = np.expand_dims(resized_patch, axis=0)
-        prediction = self.lp_validation_model.predict(expanded_dims_for_batch)
-        return prediction[0][0]
+                plate.confidence = confidences[confidence_index]
+                confidence_index += 1
+            if len(plate_candidates) > 0:
+                plate_with_heighest_confidence = sorted(plate_candidates, key=lambda p: (p.confidence, ), reverse=True)[0]
+                if plate_with_heighest_confidence.confidence >= 0.9:
+                    plate_with_heighest_confidence.valid = True
+
+    def _predict(self, license_plate_candidates):
+        """Returns the confidence for every resized candidate within the (N, img_rows, img_cols, 3) batch"""
+        if self.frozen_graph is not None:
+            prediction, = self.frozen_graph.run(["confidence"], {"plate": license_plate_candidates.astype(np.float32)})
+            return prediction[:, 0]
+        with self.graph.as_default():
+            prediction = self.lp_validation_model.predict(license_plate_candidates, batch_size=len(license_plate_candidates))
+        return prediction[:, 0]
+
+    def get_inputs_and_outputs(self):
+        """Returns the input and output tensors of the Keras model by name, see export_frozen_graph"""
+        return {"plate": self.lp_validation_model.input}, {"confidence": self.lp_validation_model.output}
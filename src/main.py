@@ -5,44 +5,303 @@ Given a video file and the appropriate camera calibration data, it runs the conv
 of the vehicle in the video.
 """
 
+import os
 import time
 
+import cv2.cv2 as cv2
+import numpy as np
+
 from src.Video import Frame, Video
 from src.camera_calibration.CameraCalibration import CameraCalibration
 from src.lp_localization.LicensePlateDetectionCascadeClassifier import LicensePlateDetection
-from src.car_detection.yolo import YOLO
-from src.speed_estimation.SpeedEstimator import SpeedEstimator
+from src.lp_measurement.parallel_measurement import PlateMeasurementPool
+from src.serving.RemoteModels import RemoteYOLO, RemoteLPValidation
+from src.lp_validation.LPValidation import LPValidation, FROZEN_GRAPH_PATH as LP_VALIDATION_FROZEN_GRAPH_PATH
+from src.car_detection.detector_cascade import DetectorCascade, TINY_YOLO
+from src.car_detection.yolo import YOLO, FROZEN_GRAPH_PATH as YOLO_FROZEN_GRAPH_PATH
+from src.speed_estimation.EarlyExitController import EarlyExitController
+from src.speed_estimation.FrameSubsampler import FrameSubsampler
+from src.speed_estimation.SpeedEstimator import SpeedEstimator, OnlineSpeedEstimator, MultiVehicleSpeedEstimator
+from src.tracking.VehicleTracker import VehicleTracker
 from src.utils import timer
-from src.utils.image_utils import save_debug_image, get_image_patch_from_rect, get_frames, draw_processed_image
+from src.utils.image_utils import save_debug_image, get_image_patch_from_rect, draw_processed_image, \
+    get_frame_batches, get_frame_rate
+from src.utils.frame_source import PrefetchingFrameReader, create_frame_source
+from src.utils.pipeline import Pipeline, Stage
 
 VIDEO_FILE = "../testFiles/25,74kmh.mov"
 
 CAMERA_MODEL = "camera_calibration/camera_calibration_iPhoneXR_4k_60.npz"
 
+# If set, the frozen inference graphs written by export_frozen_graphs.py are loaded instead of the Keras models
+# benchmarks/frozen_graph_benchmark.py checks that they find the same as the Keras models, run it after exporting.
+USE_FROZEN_GRAPHS = False
+
+# If set, the models are not loaded by this process but used from the running model server (serving/ModelServer.py),
+# which batches the requests of all video workers. Dynamic input resolution is not available then.
+USE_MODEL_SERVER = False
+# Address of the model server's socket, None for the default of ModelServer.get_address. The key the server was started
+# with has to be set in the MODEL_SERVER_AUTHKEY environment variable.
+MODEL_SERVER_ADDRESS = None
+
+# If set, yolo picks its input resolution per frame, smaller while the vehicles are large and close to the camera
+DYNAMIC_INPUT_RESOLUTION = False
+
+# If set, the tiny yolo runs on every frame and the full yolo only where the tiny one is uncertain
+USE_DETECTOR_CASCADE = False
+
+# Number of frames that are fed through the yolo network at once
+YOLO_BATCH_SIZE = 4
+
+# If set, only the vehicle patches are undistorted instead of the whole frame. Yolo then runs on the raw frame and the
+# found boxes are mapped into undistorted coordinates. Frame.image holds the raw frame in this mode.
+ROI_UNDISTORTION = False
+
+# If set, the plates are searched in the regions of the vehicles within the frame image, so overlapping vehicles are
+# only searched once. Not used with ROI_UNDISTORTION, as the frame image is not undistorted then.
+FRAME_LEVEL_PLATE_SEARCH = False
+
+# Number of threads that search the vehicle images of a frame for plates concurrently. OpenCV's own thread count is
+# lowered accordingly, so together they do not use more threads than there are cores.
+PLATE_DETECTION_THREADS = 1
+
+# If set, vehicles are tracked across frames and yolo only runs every DETECTION_INTERVAL frames or when a track is lost.
+# Frames are then passed to yolo one at a time and the speed of every tracked vehicle is estimated separately.
+USE_TRACKING = False
+DETECTION_INTERVAL = 10
+
+# If set, frames are decoded ahead on a background thread into a ring of PREFETCH_RING_SIZE buffers. Only used without
+# the pipeline, which decodes ahead on its own.
+USE_PREFETCHING = False
+PREFETCH_RING_SIZE = 4
+
+# If set, the frames only keep their metadata once they are processed, their images are dropped or spilled to disk
+# if a SPILL_DIRECTORY is given. This bounds the memory usage for long videos.
+STREAMING = False
+SPILL_DIRECTORY = None
+
+# If set, only every LEAD_IN_STRIDE-th frame is processed until a large enough vehicle shows up and no further frames
+# are processed once the confidence interval of the fitted speed is at most MAX_CONFIDENCE_INTERVAL_WIDTH km/h wide
+USE_EARLY_EXIT = False
+LEAD_IN_STRIDE = 10
+MAX_CONFIDENCE_INTERVAL_WIDTH = 1.0
+
+# If set, only a subset of the frames is processed: every SUBSAMPLING_STRIDE-th frame or, with ADAPTIVE_SUBSAMPLING,
+# more or fewer depending on how fast the plate height changes
+USE_SUBSAMPLING = False
+SUBSAMPLING_STRIDE = 2
+ADAPTIVE_SUBSAMPLING = False
+
+# If set, the processing steps run concurrently in a pipeline instead of one after another for each frame
+USE_PIPELINE = False
+PIPELINE_QUEUE_SIZE = 8
+UNDISTORTION_WORKERS = 2
+MEASUREMENT_WORKERS = 2
+
+# If set, the plates are measured by a pool of worker processes that lives for the whole run
+USE_MEASUREMENT_POOL = False
+MEASUREMENT_PROCESSES = 4
+
+
+def create_frame(camera_calibration, frame_number, image):
+    """Creates the frame for a decoded image, undistorting it unless only the vehicle patches get undistorted"""
+    if ROI_UNDISTORTION:
+        # A prefetched image lives in a ring buffer that is reused for later frames
+        return Frame(frame_number, np.copy(image) if USE_PREFETCHING and not USE_PIPELINE else image)
+    return Frame(frame_number, camera_calibration.undistort(image))
+
+
+def get_vehicle_image(camera_calibration, frame, vehicle):
+    """Returns the undistorted image patch of the vehicle"""
+    if ROI_UNDISTORTION:
+        return camera_calibration.undistort_patch(frame.image, vehicle.box)
+    return get_image_patch_from_rect(frame.image, vehicle.box)
+
+
+def set_vehicles(camera_calibration, frame, vehicles):
+    """Adds the found vehicles together with their undistorted image patches to the frame"""
+    frame.vehicles = vehicles
+    for vehicle in frame.vehicles:
+        if ROI_UNDISTORTION:
+            vehicle.box = camera_calibration.undistort_box(vehicle.box)
+        vehicle.image = get_vehicle_image(camera_calibration, frame, vehicle)
+    return frame
+
+
+def process_frames_sequentially(frames, vehicle_detector, license_plate_detection, camera_calibration):
+    """Generator that processes the frames one batch after another and yields them"""
+    for batch_frames in get_frame_batches(frames, YOLO_BATCH_SIZE):
+        if isinstance(vehicle_detector, VehicleTracker):
+            vehicles_per_frame = [vehicle_detector.detect_vehicle(frame.image) for frame in batch_frames]
+        else:
+            vehicles_per_frame = vehicle_detector.detect_vehicles_batch([frame.image for frame in batch_frames])
+        for frame, vehicles in zip(batch_frames, vehicles_per_frame):
+            set_vehicles(camera_calibration, frame, vehicles)
+            license_plate_detection.detect_plate_candidates_of_frame(frame)
+        # The candidates of all frames in the batch are validated with a single prediction
+        license_plate_detection.validate_plates_of_frames(batch_frames)
+        for frame in batch_frames:
+            license_plate_detection.measure_plates_of_frame(frame)
+            frame.release_vehicle_images()
+            yield frame
+
+
+def create_pipeline(vehicle_detector, license_plate_detection, camera_calibration):
+    """
+    Creates a pipeline that processes (frame number, image) tuples. The tensorflow stages have a single worker which
+    owns the session, the OpenCV stages can have more as those release the GIL.
+    """
+
+    def detect_vehicles(frame):
+        return set_vehicles(camera_calibration, frame, vehicle_detector.detect_vehicle(frame.image))
+
+    def detect_plate_candidates(frame):
+        license_plate_detection.detect_plate_candidates_of_frame(frame)
+        return frame
+
+    def validate_plates(frame):
+        license_plate_detection.validate_plates_of_frame(frame)
+        return frame
+
+    def measure_plates(frame):
+        license_plate_detection.measure_plates_of_frame(frame)
+        frame.release_vehicle_images()
+        return frame
+
+    return Pipeline([
+        Stage("undistort", lambda item: create_frame(camera_calibration, *item), workers=UNDISTORTION_WORKERS),
+        Stage("detect vehicles", detect_vehicles),
+        Stage("detect plate candidates", detect_plate_candidates),
+        Stage("validate plates", validate_plates),
+        Stage("measure plates", measure_plates, workers=MEASUREMENT_WORKERS),
+    ], queue_size=PIPELINE_QUEUE_SIZE)
+
+
 if __name__ == "__main__":
-    yolo = YOLO()
-    license_plate_detection = LicensePlateDetection()
+    # The pool has to be started before the models are loaded: tensorflow is imported already, but no session exists
+    # yet whose threads the forked workers would inherit
+    measurement_pool = PlateMeasurementPool(MEASUREMENT_PROCESSES) if USE_MEASUREMENT_POOL else None
+    if USE_MODEL_SERVER:
+        yolo = RemoteYOLO(MODEL_SERVER_ADDRESS)
+        lp_validation = RemoteLPValidation(MODEL_SERVER_ADDRESS)
+    elif USE_FROZEN_GRAPHS:
+        yolo = YOLO(frozen_graph_path=YOLO_FROZEN_GRAPH_PATH, dynamic_input_resolution=DYNAMIC_INPUT_RESOLUTION)
+        lp_validation = LPValidation(LP_VALIDATION_FROZEN_GRAPH_PATH)
+    else:
+        yolo = YOLO(dynamic_input_resolution=DYNAMIC_INPUT_RESOLUTION)
+        lp_validation = LPValidation()
+    if PLATE_DETECTION_THREADS > 1:
+        cv2.setNumThreads(max(1, os.cpu_count() // PLATE_DETECTION_THREADS))
+    license_plate_detection = LicensePlateDetection(measurement_pool,
+                                                    search_whole_frame=FRAME_LEVEL_PLATE_SEARCH and not ROI_UNDISTORTION,
+                                                    detection_threads=PLATE_DETECTION_THREADS,
+                                                    validator=lp_validation)
+    detector_cascade = None
+    if USE_DETECTOR_CASCADE:
+        tiny_yolo = RemoteYOLO(MODEL_SERVER_ADDRESS, "tiny_yolo") if USE_MODEL_SERVER else YOLO(**TINY_YOLO)
+        detector_cascade = DetectorCascade(tiny_yolo, yolo)
+    vehicle_detector = detector_cascade if detector_cascade is not None else yolo
+    if USE_TRACKING:
+        vehicle_detector = VehicleTracker(vehicle_detector, DETECTION_INTERVAL)
     camera_calibration = CameraCalibration(CAMERA_MODEL)
     start = time.time()
-    video = Video(VIDEO_FILE)
-    for frame_number, image in enumerate(get_frames(video.path_to_file, from_sec=7, to_sec=9)):
-        image = camera_calibration.undistort(image)
-        frame = Frame(frame_number, image)
-        video.frames.append(frame)
-        frame.vehicles = yolo.detect_vehicle(frame.image)
-        for vehicle in frame.vehicles:
-            car_image = get_image_patch_from_rect(frame.image, vehicle.box)
-            vehicle.plates = license_plate_detection.detect_license_plate_candidates(car_image)
-
-        # processed_frame = draw_processed_image(frame)
-        # save_debug_image(processed_frame, "frame_" + str(frame.frame_number), "processed_frames", resize_to=(1920, 1080))
-        print(frame)
+    video = Video(VIDEO_FILE, streaming=STREAMING, spill_directory=SPILL_DIRECTORY)
+    frame_source = create_frame_source(video.path_to_file, from_sec=7, to_sec=9,
+                                       reuse_buffer=USE_PREFETCHING and not USE_PIPELINE)
+    frame_rate = get_frame_rate(frame_source, SpeedEstimator.FRAME_RATE)
+    estimator = SpeedEstimator(frame_rate)
+    early_exit_controller = EarlyExitController(estimator, MAX_CONFIDENCE_INTERVAL_WIDTH, lead_in_stride=LEAD_IN_STRIDE)
+    subsampler = FrameSubsampler(SUBSAMPLING_STRIDE, ADAPTIVE_SUBSAMPLING)
+    frame_filter = None
+    if USE_EARLY_EXIT and USE_SUBSAMPLING:
+        def frame_filter(frame_number):
+            return early_exit_controller.should_process(frame_number) and subsampler.should_process(frame_number)
+    elif USE_EARLY_EXIT:
+        frame_filter = early_exit_controller.should_process
+    elif USE_SUBSAMPLING:
+        frame_filter = subsampler.should_process
+    online_estimator = OnlineSpeedEstimator(frame_rate=frame_rate)
+    multi_vehicle_estimator = MultiVehicleSpeedEstimator(frame_rate=frame_rate)
+    final_reading = None
+    # The filter is only known now, it needs the estimator and with it the frame rate of the source
+    frame_source.frame_filter = frame_filter
+    pipeline = None
+    prefetching_reader = None
+    if USE_PIPELINE:
+        images = frame_source.frames()
+        frames = ((frame_number, image) for frame_number, image in enumerate(images) if image is not None)
+        pipeline = create_pipeline(vehicle_detector, license_plate_detection, camera_calibration)
+        processed_frames = pipeline.run(frames)
+    else:
+        images = frame_source.frames()
+        if USE_PREFETCHING:
+            prefetching_reader = PrefetchingFrameReader(images, PREFETCH_RING_SIZE)
+            images = prefetching_reader.frames()
+        # Every image is undistorted right away, so the decoded image is not needed anymore once the next one is read
+        frames = (create_frame(camera_calibration, frame_number, image)
+                  for frame_number, image in enumerate(images) if image is not None)
+        processed_frames = process_frames_sequentially(frames, vehicle_detector, license_plate_detection, camera_calibration)
+
+    try:
+        for frame in processed_frames:
+            # processed_frame = draw_processed_image(frame)
+            # save_debug_image(processed_frame, "frame_" + str(frame.frame_number), "processed_frames", resize_to=(1920, 1080))
+            print(frame)
+            video.add_frame(frame)
+            estimator.add_frame(frame)
+            reading = online_estimator.add_frame(frame)
+            if reading is not None and reading.final and final_reading is None:
+                final_reading = reading
+                print("Plate left the view, final velocity: {0:.2f} km/h".format(reading.speed))
+            elif reading is not None and not reading.final:
+                print("Running velocity: {0:.2f} km/h".format(reading.speed))
+            if USE_TRACKING:
+                multi_vehicle_estimator.add_frame(frame)
+            if USE_SUBSAMPLING:
+                subsampler.update(frame)
+            if USE_EARLY_EXIT:
+                early_exit_controller.update(frame)
+                if early_exit_controller.should_stop:
+                    print("Speed estimate converged, stopping early")
+                    break
+    finally:
+        # Stops the pipeline threads and decoding ahead if the loop ended early
+        if pipeline is not None:
+            pipeline.close()
+        if prefetching_reader is not None:
+            prefetching_reader.close()
+
+    if measurement_pool is not None:
+        measurement_pool.close()
+    license_plate_detection.close()
 
     total_duration = time.time() - start
     fps = frame.frame_number / total_duration
     print("\nTotal duration: {0:.2f}, FPS: {1:.2f}\n".format(total_duration, fps))
 
     timer.print_timing_results()
+    if USE_TRACKING:
+        print()
+        vehicle_detector.print_statistics()
+    if detector_cascade is not None:
+        print()
+        detector_cascade.print_statistics()
+    if USE_PIPELINE:
+        print()
+        pipeline.print_statistics()
+    if USE_EARLY_EXIT:
+        print()
+        early_exit_controller.print_statistics()
+    if USE_SUBSAMPLING:
+        print()
+        subsampler.print_statistics()
 
-    estimator = SpeedEstimator()
-    print("\nEstimated final velocity: " + str(estimator.estimate_speed_of_vehicle(video)) + " km/h")
+    print("\nEstimated final velocity: " + str(estimator.estimate_speed()) + " km/h")
+    speed_fit = estimator.fit_speed()
+    if speed_fit is not None:
+        print("Fitted velocity: {0:.2f} km/h (95% confidence interval: {1:.2f} - {2:.2f} km/h)".format(
+            speed_fit.speed, speed_fit.lower_bound, speed_fit.upper_bound))
+    if USE_TRACKING:
+        print("\nVelocity per vehicle:")
+        multi_vehicle_estimator.finish()
+        multi_vehicle_estimator.print_results()
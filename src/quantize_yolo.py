@@ -0,0 +1,90 @@
+"""
+Writes quantized copies of the yolo network for the reduced precision modes of YOLO (see YOLO._defaults["precision"]).
+
+float16 stores the weights as half precision floats, which needs tensorflow 1.15 or later. int8 quantizes weights and activations to 8 bit integers, the
+ranges of the activations are calibrated on undistorted frames of our own videos, so they match what the network sees
+in main.py. Only the network itself is converted, the post-processing keeps running in tensorflow.
+
+Has to be run from the /src directory, like main.py. benchmarks/quantization_report.py compares the results against the
+float32 model.
+"""
+import numpy as np
+import tensorflow as tf
+from tensorflow.python.keras import backend as K
+from tensorflow.python.keras.models import load_model
+
+from src.camera_calibration.CameraCalibration import CameraCalibration
+from src.car_detection.yolo import YOLO, get_quantized_model_path, prepare_image
+from src.utils.image_utils import get_frames
+
+CALIBRATION_VIDEOS = ["../testFiles/25,74kmh.mov"]
+CAMERA_MODEL = "camera_calibration/camera_calibration_iPhoneXR_4k_60.npz"
+
+# Every CALIBRATION_FRAME_STRIDE-th frame of the calibration videos is used to calibrate the int8 model
+CALIBRATION_FRAME_STRIDE = 10
+
+QUANTIZED_PRECISIONS = ["float16", "int8"]
+
+# Oldest tensorflow version (major, minor) that can convert to a precision. Older converters silently ignore the float16
+# target type and write a model with 8 bit weights instead.
+MIN_TENSORFLOW_VERSIONS = {
+    "float16": (1, 15),
+    "int8": (1, 14),
+}
+
+
+def is_supported(precision):
+    tensorflow_version = tuple(int(part) for part in tf.__version__.split(".")[:2])
+    return tensorflow_version >= MIN_TENSORFLOW_VERSIONS[precision]
+
+
+def get_calibration_data(model_image_size):
+    """Returns the prepared network inputs of the calibration frames"""
+    camera_calibration = CameraCalibration(CAMERA_MODEL)
+    calibration_data = []
+    for video_file in CALIBRATION_VIDEOS:
+        frames = get_frames(video_file, frame_filter=lambda frame_number: frame_number % CALIBRATION_FRAME_STRIDE == 0)
+        for image in frames:
+            if image is not None:
+                calibration_data.append(prepare_image(camera_calibration.undistort(image), model_image_size))
+    print("Collected {0} calibration frames".format(len(calibration_data)))
+    return calibration_data
+
+
+def quantize(model_path, model_image_size, precision, calibration_data):
+    """Converts the Keras model at 'model_path' to a tflite model of the given 'precision' and returns it"""
+    if not is_supported(precision):
+        raise RuntimeError("Quantizing to {0} needs tensorflow {1}.{2} or later, found {3}".format(
+            precision, *MIN_TENSORFLOW_VERSIONS[precision], tf.__version__))
+    # The converter needs a fixed input shape and the name of the input to set it
+    input_name = load_model(model_path, compile=False).input.op.name
+    K.clear_session()
+    width, height = model_image_size
+    converter = tf.lite.TFLiteConverter.from_keras_model_file(model_path,
+                                                              input_shapes={input_name: [1, height, width, 3]})
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if precision == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif precision == "int8":
+        def representative_dataset():
+            for image_data in calibration_data:
+                yield [np.expand_dims(image_data, 0)]
+
+        converter.representative_dataset = tf.lite.RepresentativeDataset(representative_dataset)
+    return converter.convert()
+
+
+if __name__ == "__main__":
+    model_path = YOLO._defaults["model_path"]
+    model_image_size = YOLO._defaults["model_image_size"]
+    calibration_data = get_calibration_data(model_image_size)
+    for precision in QUANTIZED_PRECISIONS:
+        if not is_supported(precision):
+            print("Skipping {0}, it needs tensorflow {1}.{2} or later, found {3}".format(
+                precision, *MIN_TENSORFLOW_VERSIONS[precision], tf.__version__))
+            continue
+        quantized_model = quantize(model_path, model_image_size, precision, calibration_data)
+        with open(get_quantized_model_path(precision), "wb") as f:
+            f.write(quantized_model)
+        print("Wrote {0} model with {1:.1f} MB to {2}".format(precision, len(quantized_model) / 2 ** 20,
+                                                             get_quantized_model_path(precision)))
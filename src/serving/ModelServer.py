@@ -0,0 +1,282 @@
+"""
+Local model server that loads the yolo and plate validation networks once and serves many video workers.
+
+The workers connect over a Unix socket (see RemoteModels.py) and send their requests synchronously. The server collects
+the requests of all workers for a model into one batch: a batch is run as soon as it holds 'max_batch_size' images or
+plate candidates, or once the oldest request in it has waited 'max_latency' seconds, whichever comes first. So a single
+worker is not held up for long, while many workers share the cost of one network run.
+
+Has to be run from the /src directory, like main.py:
+    MODEL_SERVER_AUTHKEY=<secret> python -m src.serving.ModelServer
+The clients have to be given the same key.
+"""
+import os
+import queue
+import socket
+import stat
+import tempfile
+import threading
+import time
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+import numpy as np
+from tabulate import tabulate
+
+from src.car_detection.detector_cascade import TINY_YOLO
+from src.car_detection.yolo import YOLO, normalize_images
+from src.lp_validation.LPValidation import LPValidation
+
+# Environment variables that hold the address of the socket and the key the clients authenticate with
+ADDRESS_VARIABLE = "MODEL_SERVER_ADDRESS"
+AUTHKEY_VARIABLE = "MODEL_SERVER_AUTHKEY"
+
+# Name of the plate validation model in requests, the vehicle detectors are served by the names given to the server
+LP_VALIDATION = "lp_validation"
+
+
+def get_address(address=None):
+    """Returns the given 'address', the one in the environment or one in a directory of the current user"""
+    if address is not None:
+        return address
+    if ADDRESS_VARIABLE in os.environ:
+        return os.environ[ADDRESS_VARIABLE]
+    directory = os.environ.get("XDG_RUNTIME_DIR", tempfile.gettempdir())
+    return os.path.join(directory, "speed_estimation_models_{0}.sock".format(os.getuid()))
+
+
+def get_authkey(authkey=None):
+    """Returns the given 'authkey' or the one in the environment"""
+    if authkey is not None:
+        return authkey
+    if AUTHKEY_VARIABLE not in os.environ:
+        raise KeyError("The key of the model server has to be set in " + AUTHKEY_VARIABLE)
+    return os.environ[AUTHKEY_VARIABLE].encode()
+
+
+# Put on the request queue of a batcher to stop it
+_STOP = object()
+
+
+class _Batcher:
+    """
+    Collects the requests for one model and runs them in batches on its own thread. 'run_batch' takes a list of
+    request payloads and returns one result per payload, 'get_size' tells how many items a payload holds.
+    """
+
+    def __init__(self, name, run_batch, get_size, max_batch_size, max_latency):
+        self.name = name
+        self.run_batch = run_batch
+        self.get_size = get_size
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.requests = queue.Queue()
+        self.number_of_batches = 0
+        self.number_of_requests = 0
+        self.number_of_items = 0
+        self.busy_time = 0.0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _remove_stale_socket(self):
+        """Removes the socket a server left behind, refuses to start if the address is taken"""
+        if not os.path.exists(self.address):
+            return
+        if not stat.S_ISSOCK(os.stat(self.address).st_mode):
+            raise FileExistsError("Not a socket: " + self.address)
+        with socket.socket(socket.AF_UNIX) as probe:
+            try:
+                probe.connect(self.address)
+            except ConnectionRefusedError:
+                os.remove(self.address)
+                return
+        raise RuntimeError("A server is already running on " + self.address)
+
+    def close(self):
+        """Runs the requests that are already queued and stops the thread"""
+        self.requests.put(_STOP)
+        self.thread.join()
+
+    def submit(self, payload, reply):
+        """Queues the 'payload', 'reply' is called with its result or the exception raised while computing it"""
+        self.requests.put((time.time(), payload, reply))
+
+    def _run(self):
+        stopped = False
+        while not stopped:
+            request = self.requests.get()
+            if request is _STOP:
+                break
+            arrival_time, payload, reply = request
+            batch = [(payload, reply)]
+            size = self.get_size(payload)
+            deadline = arrival_time + self.max_latency
+            while size < self.max_batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is _STOP:
+                    stopped = True
+                    break
+                _, payload, reply = request
+                batch.append((payload, reply))
+                size += self.get_size(payload)
+
+            start = time.time()
+            try:
+                results = self.run_batch([payload for payload, _ in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+            self.busy_time += time.time() - start
+            self.number_of_batches += 1
+            self.number_of_requests += len(batch)
+            self.number_of_items += size
+            for (_, reply), result in zip(batch, results):
+                # A client that disconnected while its request was in the batch must not stop the batcher for the others
+                try:
+                    reply(result)
+                except Exception as e:
+                    print("Could not send the result of {0} to a client: {1!r}".format(self.name, e))
+
+
+def _detect_vehicles(detector, payloads):
+    """
+    Runs the 'detector' on the images of all payloads, each a (images, (height, width)) tuple of uint8 images that were
+    resized to the input size of the network and the size of the original images. Images of the same original size
+    are detected together.
+    """
+    width, height = detector.model_image_size
+    for images, _ in payloads:
+        if images.shape[1:3] != (height, width):
+            raise ValueError("Images have to be resized to the input size {0} of the network".format(
+                detector.model_image_size))
+    results = [[] for _ in payloads]
+    indexes_per_shape = {}
+    for index, (_, image_shape) in enumerate(payloads):
+        indexes_per_shape.setdefault(tuple(image_shape), []).append(index)
+    for (height, width), indexes in indexes_per_shape.items():
+        # The images only have to be normalized, they were resized by the clients already
+        image_data = normalize_images(np.concatenate([payloads[index][0] for index in indexes]))
+        vehicles_per_image = detector.detect_vehicles_in_image_data(image_data, height, width)
+        for index in indexes:
+            number_of_images = len(payloads[index][0])
+            results[index], vehicles_per_image = vehicles_per_image[:number_of_images], vehicles_per_image[number_of_images:]
+    return results
+
+
+def _validate_plates(lp_validation, payloads):
+    """Predicts the confidences of all payloads, each a (N, img_rows, img_cols, 3) batch of resized plate candidates"""
+    confidences = lp_validation._predict(np.concatenate(payloads))
+    return np.split(confidences, np.cumsum([len(payload) for payload in payloads])[:-1])
+
+
+class ModelServer:
+    """
+    Serves the given vehicle 'detectors' (name -> YOLO) and an LPValidation to the clients that connect to 'address'
+    with the 'authkey', see get_address and get_authkey for the defaults.
+    """
+
+    def __init__(self, detectors, lp_validation, address=None, authkey=None, max_batch_size=8, max_latency=0.02):
+        self.address = get_address(address)
+        self.authkey = get_authkey(authkey)
+        self.listener = None
+        self.stopped = threading.Event()
+        self.batchers = {name: _Batcher(name, lambda payloads, detector=detector: _detect_vehicles(detector, payloads),
+                                        lambda payload: len(payload[0]), max_batch_size, max_latency)
+                         for name, detector in detectors.items()}
+        # Plate candidates are small, so many more of them fit into one batch
+        self.batchers[LP_VALIDATION] = _Batcher(LP_VALIDATION, lambda payloads: _validate_plates(lp_validation, payloads),
+                                                len, max_batch_size * 8, max_latency)
+
+    def serve_forever(self):
+        """Serves the clients until close is called"""
+        self._remove_stale_socket()
+        listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        # Only the current user may connect
+        os.chmod(self.address, stat.S_IRUSR | stat.S_IWUSR)
+        for batcher in self.batchers.values():
+            batcher.start()
+        self.listener = listener
+        print("Serving {0} on {1}".format(", ".join(self.batchers), self.address))
+        try:
+            while True:
+                try:
+                    connection = self.listener.accept()
+                except (AuthenticationError, EOFError, ConnectionError) as e:
+                    # A client with a wrong key or one that hung up right away must not stop the server
+                    print("Rejected a client: {0!r}".format(e))
+                    continue
+                if self.stopped.is_set():
+                    connection.close()
+                    break
+                threading.Thread(target=self._serve_client, args=(connection,), daemon=True).start()
+        finally:
+            self.listener.close()
+            for batcher in self.batchers.values():
+                batcher.close()
+
+    def _remove_stale_socket(self):
+        """Removes the socket a server left behind, refuses to start if the address is taken"""
+        if not os.path.exists(self.address):
+            return
+        if not stat.S_ISSOCK(os.stat(self.address).st_mode):
+            raise FileExistsError("Not a socket: " + self.address)
+        with socket.socket(socket.AF_UNIX) as probe:
+            try:
+                probe.connect(self.address)
+            except ConnectionRefusedError:
+                os.remove(self.address)
+                return
+        raise RuntimeError("A server is already running on " + self.address)
+
+    def close(self):
+        """
+        Stops serve_forever, which stops the batchers once their queued requests are answered. Has to be called from
+        another thread.
+        """
+        self.stopped.set()
+        # Closing the listener does not wake up a thread waiting in accept, a connection does
+        Client(self.address, family="AF_UNIX", authkey=self.authkey).close()
+
+    def _serve_client(self, connection):
+        """Receives the (model name, payload) requests of one client and sends back the results"""
+        send_lock = threading.Lock()
+
+        def reply(result):
+            # The batchers of different models may answer at the same time
+            with send_lock:
+                connection.send(result)
+
+        try:
+            while True:
+                model_name, payload = connection.recv()
+                if model_name not in self.batchers:
+                    reply(KeyError("Unknown model: " + str(model_name)))
+                    continue
+                self.batchers[model_name].submit(payload, reply)
+        except (EOFError, OSError):
+            pass
+        finally:
+            connection.close()
+
+    def print_statistics(self):
+        headers = ["Model", "batches", "requests", "items", "requests per batch", "items per batch", "busy time"]
+        rows = []
+        for batcher in self.batchers.values():
+            batches = max(batcher.number_of_batches, 1)
+            rows.append([batcher.name, batcher.number_of_batches, batcher.number_of_requests, batcher.number_of_items,
+                         batcher.number_of_requests / batches, batcher.number_of_items / batches, batcher.busy_time])
+        print(tabulate(rows, headers))
+
+
+if __name__ == "__main__":
+    server = ModelServer({"yolo": YOLO(), "tiny_yolo": YOLO(**TINY_YOLO)}, LPValidation())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.print_statistics()
@@ -0,0 +1,97 @@
+"""
+Clients of the ModelServer that can be used in place of a YOLO and an LPValidation within a video worker.
+"""
+import threading
+from multiprocessing.connection import Client
+
+import numpy as np
+
+from src.Video import Vehicle
+from src.car_detection.yolo import YOLO
+from src.lp_validation.LPValidation import LPValidation
+from src.serving.ModelServer import LP_VALIDATION, get_address, get_authkey
+from src.utils.image_utils import resize_image
+from src.utils.timer import timing
+
+
+class _Connection:
+    """
+    Sends requests to the ModelServer at 'address' and waits for their results. Every thread, e.g. every plate
+    detection thread, connects on its own, so the server batches their requests like the ones of different workers.
+    """
+
+    def __init__(self, address=None, authkey=None):
+        self.address = get_address(address)
+        self.authkey = get_authkey(authkey)
+        self._thread_local = threading.local()
+        self.connections = []
+        self._connections_lock = threading.Lock()
+        # Connecting right away tells early if the server is not running
+        self._get_connection()
+
+    def _get_connection(self):
+        connection = getattr(self._thread_local, "connection", None)
+        if connection is None:
+            connection = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+            self._thread_local.connection = connection
+            with self._connections_lock:
+                self.connections.append(connection)
+        return connection
+
+    def request(self, model_name, payload):
+        connection = self._get_connection()
+        connection.send((model_name, payload))
+        result = connection.recv()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        with self._connections_lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+
+
+class RemoteYOLO:
+    """
+    Detects vehicles with the yolo named 'model' on the ModelServer at 'address', see _Connection. The images are resized to the input
+    size of the network before they are sent, which keeps the requests small. The dynamic input resolution is not
+    supported, the server always uses the 'model_image_size'.
+    """
+
+    def __init__(self, address=None, model="yolo", model_image_size=YOLO._defaults["model_image_size"], authkey=None):
+        self.connection = _Connection(address, authkey)
+        self.model = model
+        self.model_image_size = model_image_size
+
+    def detect_vehicle(self, image) -> [Vehicle]:
+        """Runs the yolo network on this 'image' and returns a list of found vehicles"""
+        return self.detect_vehicles_batch([image])[0]
+
+    @timing
+    def detect_vehicles_batch(self, images) -> [[Vehicle]]:
+        """Runs the yolo network on all 'images' of the same shape and returns a list of found vehicles per image"""
+        if len(images) == 0:
+            return []
+        height, width, _ = images[0].shape
+        assert all(image.shape == images[0].shape for image in images), 'All images of a batch must have the same shape'
+        resized_images = np.stack([resize_image(image, self.model_image_size) for image in images])
+        return self.connection.request(self.model, (resized_images, (height, width)))
+
+    def close(self):
+        self.connection.close()
+
+
+class RemoteLPValidation(LPValidation):
+    """Validates the plate candidates with the LPValidation on the ModelServer at 'address'"""
+
+    def __init__(self, address=None, authkey=None):
+        # The model is not loaded here, only the prediction is sent to the server
+        self.connection = _Connection(address, authkey)
+
+    def _predict(self, license_plate_candidates):
+        return self.connection.request(LP_VALIDATION, license_plate_candidates)
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,4 @@
+"""
+Serving package:
+This package contains all code related to sharing the loaded models between several processes.
+"""
@@ -0,0 +1,49 @@
+"""
+Decides which frames of a clip have to be processed at all, so the expensive detection only runs while it improves the
+speed estimate.
+"""
+from src.Video import Frame
+from src.speed_estimation.SpeedEstimator import SpeedEstimator
+
+
+class EarlyExitController:
+    """
+    Until the first vehicle that is large enough for the vehicle detector shows up, only every 'lead_in_stride'-th frame
+    is processed, the others are not even decoded. From then on every frame is processed until the speed fitted by the
+    'estimator' has converged, i.e. its confidence interval is at most 'max_confidence_interval_width' km/h wide.
+    """
+
+    def __init__(self, estimator: SpeedEstimator, max_confidence_interval_width=1.0, min_measurements=10,
+                 lead_in_stride=10):
+        self.estimator = estimator
+        self.max_confidence_interval_width = max_confidence_interval_width
+        self.min_measurements = min_measurements
+        self.lead_in_stride = lead_in_stride
+        self.lead_in_finished = False
+        self.converged = False
+        self.number_of_processed_frames = 0
+        self.number_of_skipped_frames = 0
+
+    def should_process(self, frame_number) -> bool:
+        """Frame filter for get_frames, tells if the frame has to be processed"""
+        process = not self.converged and (self.lead_in_finished or frame_number % self.lead_in_stride == 0)
+        if process:
+            self.number_of_processed_frames += 1
+        else:
+            self.number_of_skipped_frames += 1
+        return process
+
+    def update(self, frame: Frame):
+        """Takes a processed frame after it was added to the estimator"""
+        if frame.vehicles:
+            self.lead_in_finished = True
+        if not self.converged and frame.vehicles:
+            self.converged = self.estimator.has_converged(self.max_confidence_interval_width, self.min_measurements)
+
+    @property
+    def should_stop(self) -> bool:
+        return self.converged
+
+    def print_statistics(self):
+        print("Processed {0} frames, skipped {1} frames".format(self.number_of_processed_frames,
+                                                                  self.number_of_skipped_frames))
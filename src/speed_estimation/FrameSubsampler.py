@@ -0,0 +1,64 @@
+"""
+Decides which frames of a high frame rate video are processed. Neighbouring frames of a 60 fps video barely differ, so
+the speed can be estimated from a subset of them.
+"""
+from src.Video import Frame
+from src.speed_estimation.SpeedEstimator import get_plate_height_of_first_valid_plate
+
+
+class FrameSubsampler:
+    """
+    Processes every 'stride'-th frame. If 'adaptive' is set the stride follows how fast the plate height of the first
+    vehicle changes: it is chosen so the height changes by about 'target_relative_change' between two processed frames,
+    but stays between 'min_stride' and 'max_stride'. While the plate is far away and its height barely changes from
+    frame to frame most frames are skipped, once it comes closer the frames are processed more densely.
+    Until the first two plates are measured and while no plate is visible the stride is kept as it is.
+    """
+
+    def __init__(self, stride=2, adaptive=False, min_stride=1, max_stride=6, target_relative_change=0.01):
+        self.stride = stride
+        self.adaptive = adaptive
+        self.min_stride = min_stride
+        self.max_stride = max_stride
+        self.target_relative_change = target_relative_change
+        self.next_frame_number = 0
+        self.last_frame_number = None
+        self.last_plate_height = None
+        self.number_of_processed_frames = 0
+        self.number_of_skipped_frames = 0
+
+    def should_process(self, frame_number) -> bool:
+        """Frame filter for get_frames, tells if the frame has to be processed"""
+        if frame_number < self.next_frame_number:
+            self.number_of_skipped_frames += 1
+            return False
+        self.next_frame_number = frame_number + self.stride
+        self.number_of_processed_frames += 1
+        return True
+
+    def update(self, frame: Frame):
+        """Takes a processed frame to adapt the stride to the change of its plate height"""
+        if not self.adaptive:
+            return
+        plate_height = get_plate_height_of_first_valid_plate(frame)
+        if plate_height is None:
+            return
+        if self.last_plate_height is not None and frame.frame_number > self.last_frame_number:
+            relative_change_per_frame = abs(plate_height - self.last_plate_height) / self.last_plate_height / \
+                                        (frame.frame_number - self.last_frame_number)
+            if relative_change_per_frame > 0:
+                stride = int(self.target_relative_change / relative_change_per_frame)
+            else:
+                stride = self.max_stride
+            self.stride = min(max(stride, self.min_stride), self.max_stride)
+        self.last_frame_number = frame.frame_number
+        self.last_plate_height = plate_height
+
+    @property
+    def processed_fraction(self):
+        total = self.number_of_processed_frames + self.number_of_skipped_frames
+        return self.number_of_processed_frames / total if total > 0 else 0
+
+    def print_statistics(self):
+        print("Processed {0} frames, skipped {1} frames ({2:.0%} processed), final stride {3}".format(
+            self.number_of_processed_frames, self.number_of_skipped_frames, self.processed_fraction, self.stride))
@@ -1,67 +1,328 @@
-from src.Video import Video, Frame
+from dataclasses import dataclass
+
+import numpy as np
+from tabulate import tabulate
+
+from src.Video import Video, Frame, Vehicle
+
+
+@dataclass
+class _FrameMeasurement:
+    """The part of a processed frame the estimation needs"""
+    frame_number: int
+    plate_height: float  # height of the valid plate of the first vehicle, None if there is none
+    has_valid_plate: bool  # if any vehicle in the frame has a valid plate
+
+
+# z value of the two sided 95 % confidence interval
+_Z_95 = 1.96
+# Tuning constant of the Huber weights, gives 95 % efficiency for normally distributed residuals
+_HUBER_THRESHOLD = 1.345
+
+
+@dataclass
+class SpeedFit:
+    """Speed in km/h fitted over a series of plate measurements with its 95 % confidence interval"""
+    speed: float
+    lower_bound: float
+    upper_bound: float
+    number_of_measurements: int
+
+    @property
+    def confidence_interval_width(self):
+        return self.upper_bound - self.lower_bound
+
+
+def fit_speed(frame_numbers, plate_heights, lens_factor, frame_rate, method="huber", max_iterations=20) -> SpeedFit:
+    """
+    Fits the distance to the plate against time with a line over the whole series, its slope is the speed. 'method' is
+    either "linear" for ordinary least squares or "huber", which iteratively down-weights outliers, e.g. single frames in
+    which the plate height was measured wrongly. Returns None for less than three measurements.
+    """
+    times = np.asarray(frame_numbers, dtype=float) / frame_rate
+    distances = lens_factor / np.asarray(plate_heights, dtype=float)
+    if len(times) < 3:
+        return None
+
+    weights = np.ones_like(distances)
+    for _ in range(max_iterations):
+        slope, intercept, centered_times = _weighted_line_fit(times, distances, weights)
+        if method != "huber":
+            break
+        residuals = distances - (intercept + slope * times)
+        scale = 1.4826 * np.median(np.abs(residuals - np.median(residuals)))
+        if scale == 0:
+            break
+        normalized_residuals = np.abs(residuals) / (_HUBER_THRESHOLD * scale)
+        new_weights = np.where(normalized_residuals <= 1, 1, 1 / np.maximum(normalized_residuals, 1))
+        if np.allclose(new_weights, weights):
+            break
+        weights = new_weights
+    slope, intercept, centered_times = _weighted_line_fit(times, distances, weights)
+
+    residuals = distances - (intercept + slope * times)
+    residual_variance = np.sum(weights * residuals ** 2) / (len(times) - 2)
+    slope_standard_error = np.sqrt(residual_variance / np.sum(weights * centered_times ** 2))
+
+    # The distance shrinks while the vehicle approaches
+    speed = -slope * 3.6
+    margin = _Z_95 * slope_standard_error * 3.6
+    return SpeedFit(speed, speed - margin, speed + margin, len(times))
+
+
+def _weighted_line_fit(times, distances, weights):
+    mean_time = np.sum(weights * times) / np.sum(weights)
+    mean_distance = np.sum(weights * distances) / np.sum(weights)
+    centered_times = times - mean_time
+    slope = np.sum(weights * centered_times * (distances - mean_distance)) / np.sum(weights * centered_times ** 2)
+    intercept = mean_distance - slope * mean_time
+    return slope, intercept, centered_times
+
+
+def get_plate_height_of_first_valid_plate(frame: Frame):
+    if not frame.vehicles:
+        return None
+    return get_plate_height_of_vehicle(frame.vehicles[0])
+
+
+def get_plate_height_of_vehicle(vehicle: Vehicle):
+    for plate in filter(lambda it: it.valid, vehicle.plates):
+        return plate.height
 
 
 class SpeedEstimator:
 
     # LENS_FACTOR = 361  # iPhone 8+ 4k 60
     LENS_FACTOR = 343  # iPhone XR 4k 60
-    FRAME_RATE = 60
+    FRAME_RATE = 60  # used if the frame rate of the video is not known
 
-    def estimate_speed_of_vehicle(self, video: Video):
+    def __init__(self, frame_rate=FRAME_RATE):
+        self.frame_rate = frame_rate
+        self.measurements: [_FrameMeasurement] = []
+
+    def add_frame(self, frame: Frame):
         """
-        Takes a fully processed 'Video' file and calculates the speed of the first car it finds by calculating the
-        distance travelled between frames based on the height of the license plate in each frame.
+        Takes the next processed 'Frame' and keeps only its plate measurements, so the frames can be consumed while the
+        video is still being processed and do not have to be retained. Frames that were skipped are simply not added,
+        the elapsed time is taken from the frame numbers.
         """
-        first_frame_with_valid_plate = self._first_frame_with_valid_plate(video)
-        last_frame_with_valid_plate = self._last_frame_with_valid_plate(video)
-        trimmed_video = video.frames[first_frame_with_valid_plate:last_frame_with_valid_plate + 1]
+        self.measurements.append(_FrameMeasurement(frame.frame_number,
+                                                   get_plate_height_of_first_valid_plate(frame),
+                                                   self._has_valid_plate(frame)))
 
-        speed_estimations = [s for s in self._yield_speed_estimations(trimmed_video)]
+    def estimate_speed(self):
+        """
+        Calculates the speed of the first car found in the frames added so far by calculating the distance travelled
+        between frames based on the height of the license plate in each frame.
+        """
+        first_frame_with_valid_plate = self._first_frame_with_valid_plate()
+        last_frame_with_valid_plate = self._last_frame_with_valid_plate()
+        trimmed_measurements = self.measurements[first_frame_with_valid_plate:last_frame_with_valid_plate + 1]
+
+        speed_estimations = [s for s in self._yield_speed_estimations(trimmed_measurements)]
 
         average_speed = sum(speed_estimations) / len(speed_estimations)
         return average_speed
 
-    def _yield_speed_estimations(self, trimmed_video):
-        last_plate_height = self._get_plate_height_of_first_valid_plate(trimmed_video[0])
-        elapsed_frames = 1
-        for frame in trimmed_video[1:]:
-            current_plate_height = self._get_plate_height_of_first_valid_plate(frame)
+    def fit_speed(self, method="huber") -> SpeedFit:
+        """Fits the speed over all plate heights of the first car added so far, see fit_speed"""
+        measured = [m for m in self.measurements if m.plate_height is not None]
+        return fit_speed([m.frame_number for m in measured], [m.plate_height for m in measured],
+                         self.LENS_FACTOR, self.frame_rate, method)
+
+    def has_converged(self, max_confidence_interval_width=1.0, min_measurements=10, method="huber"):
+        """
+        Tells if the fitted speed is precise enough, i.e. its confidence interval is at most
+        'max_confidence_interval_width' km/h wide. Used to stop processing further frames early.
+        """
+        speed_fit = self.fit_speed(method)
+        return speed_fit is not None and speed_fit.number_of_measurements >= min_measurements and \
+            speed_fit.confidence_interval_width <= max_confidence_interval_width
+
+    def estimate_speed_of_vehicle(self, video: Video):
+        """Takes a fully processed 'Video' file and calculates the speed of the first car it finds"""
+        self.measurements = []
+        for frame in video.frames:
+            self.add_frame(frame)
+        return self.estimate_speed()
+
+    def _yield_speed_estimations(self, trimmed_measurements):
+        last_plate_height = trimmed_measurements[0].plate_height
+        last_frame_number = trimmed_measurements[0].frame_number
+        for measurement in trimmed_measurements[1:]:
+            current_plate_height = measurement.plate_height
             if current_plate_height is not None:
+                # Counted from the frame numbers, so frames without a plate as well as skipped frames are included
+                elapsed_frames = measurement.frame_number - last_frame_number
                 current_distance_to_plate = self.LENS_FACTOR / current_plate_height
                 last_distance_to_plate = self.LENS_FACTOR / last_plate_height
                 distance_delta_in_m = last_distance_to_plate - current_distance_to_plate
                 avg_distance_per_frame = distance_delta_in_m / elapsed_frames
-                estimated_speed = avg_distance_per_frame * self.FRAME_RATE * 3.6
+                estimated_speed = avg_distance_per_frame * self.frame_rate * 3.6
 
                 for _ in range(elapsed_frames):
                     yield estimated_speed
 
                 # reset
                 last_plate_height = current_plate_height
-                elapsed_frames = 1
+                last_frame_number = measurement.frame_number
+
+
+    def _has_valid_plate(self, frame: Frame):
+        for vehicle in frame.vehicles:
+            for plate in vehicle.plates:
+                if plate.valid:
+                    return True
+        return False
+
+    def _first_frame_with_valid_plate(self):
+        for index, measurement in enumerate(self.measurements):
+            if measurement.has_valid_plate:
+                return index
+
+    def _last_frame_with_valid_plate(self):
+        last_frame_with_valid_plate = None
+        for index, measurement in enumerate(self.measurements):
+            if measurement.has_valid_plate:
+                last_frame_with_valid_plate = index
+        return last_frame_with_valid_plate if last_frame_with_valid_plate is not None else len(self.measurements) - 1
+
 
-            else:
-                elapsed_frames += 1
+@dataclass
+class SpeedReading:
+    """A speed estimate in km/h after 'frame_number'. It is final once the plate has left the view."""
+    speed: float
+    frame_number: int
+    final: bool = False
+
+
+class OnlineSpeedEstimator:
+    """
+    Estimates the speed of one vehicle from one plate height at a time while the video is still being processed.
+
+    Averaging the frame to frame speeds like the SpeedEstimator does telescopes to the distance covered between the first
+    and the last measured plate divided by the frames in between, so only those two measurements have to be kept.
+    The estimate is final once no plate was measured for 'frames_until_plate_left_view' frames.
+    """
+
+    def __init__(self, lens_factor=SpeedEstimator.LENS_FACTOR, frame_rate=SpeedEstimator.FRAME_RATE,
+                 frames_until_plate_left_view=30):
+        self.lens_factor = lens_factor
+        self.frame_rate = frame_rate
+        self.frames_until_plate_left_view = frames_until_plate_left_view
+        self.first_frame_number = None
+        self.first_distance = None
+        self.last_frame_number = None
+        self.last_distance = None
+        self.number_of_measurements = 0
+        self.final_reading = None
+
+    def update(self, frame_number, plate_height) -> SpeedReading:
+        """
+        Takes the plate height measured in the frame (None if there was none) and returns the current reading, or None
+        if there is no estimate yet. Once the final reading was returned, later frames do not change it anymore.
+        """
+        if self.final_reading is not None:
+            return self.final_reading
 
+        if plate_height is not None:
+            distance = self.lens_factor / plate_height
+            self.number_of_measurements += 1
+            if self.first_frame_number is None:
+                self.first_frame_number, self.first_distance = frame_number, distance
+            self.last_frame_number, self.last_distance = frame_number, distance
+        elif self.last_frame_number is not None and \
+                frame_number - self.last_frame_number >= self.frames_until_plate_left_view:
+            speed = self.speed
+            if speed is not None:
+                self.final_reading = SpeedReading(speed, self.last_frame_number, final=True)
+            return self.final_reading
 
-    def _get_plate_height_of_first_valid_plate(self, frame: Frame):
-        if not frame.vehicles or not frame.vehicles[0].plates:
+        speed = self.speed
+        return SpeedReading(speed, frame_number) if speed is not None else None
+
+    def add_frame(self, frame: Frame) -> SpeedReading:
+        """Updates the estimate with the plate of the first vehicle in the processed 'Frame', see update"""
+        return self.update(frame.frame_number, get_plate_height_of_first_valid_plate(frame))
+
+    def finish(self) -> SpeedReading:
+        """Returns the final reading, e.g. once the video has ended, or None if less than two plates were measured"""
+        if self.final_reading is None and self.speed is not None:
+            self.final_reading = SpeedReading(self.speed, self.last_frame_number, final=True)
+        return self.final_reading
+
+    @property
+    def speed(self):
+        """Average speed in km/h between the first and the last measured plate"""
+        if self.last_frame_number is None or self.last_frame_number == self.first_frame_number:
             return None
-        for plate in filter(lambda it: it.valid, frame.vehicles[0].plates):
-            return plate.height
+        distance_delta_in_m = self.first_distance - self.last_distance
+        elapsed_frames = self.last_frame_number - self.first_frame_number
+        return distance_delta_in_m / elapsed_frames * self.frame_rate * 3.6
 
-    def _first_frame_with_valid_plate(self, video: Video):
-        for frame in video.frames:
-            for vehicle in frame.vehicles:
-                for plate in vehicle.plates:
-                    if plate.valid:
-                        return frame.frame_number
 
-    def _last_frame_with_valid_plate(self, video: Video):
-        last_frame_with_valid_plate = None
-        for frame in video.frames:
-            for vehicle in frame.vehicles:
-                for plate in vehicle.plates:
-                    if plate.valid:
-                        last_frame_with_valid_plate = frame.frame_number
-        return last_frame_with_valid_plate if last_frame_with_valid_plate is not None else frame.frame_number
+@dataclass
+class _TrackSpeed:
+    """Speed estimation of one tracked vehicle and the range of frames it was seen in"""
+    estimator: OnlineSpeedEstimator
+    first_frame_number: int
+    last_frame_number: int
+
+
+class MultiVehicleSpeedEstimator:
+    """
+    Estimates the speed of every tracked vehicle separately, keyed by the track id of the vehicles. Each track keeps its
+    own OnlineSpeedEstimator, so a frame costs one update per active track no matter how many vehicles are in view.
+    """
+
+    def __init__(self, lens_factor=SpeedEstimator.LENS_FACTOR, frame_rate=SpeedEstimator.FRAME_RATE,
+                 frames_until_plate_left_view=30):
+        self.lens_factor = lens_factor
+        self.frame_rate = frame_rate
+        self.frames_until_plate_left_view = frames_until_plate_left_view
+        self.active_tracks = {}
+        self.finished_tracks = {}
+
+    def add_frame(self, frame: Frame) -> [SpeedReading]:
+        """Updates the estimates of all tracks with the processed 'Frame' and returns the readings of this frame"""
+        readings = {}
+        for vehicle in frame.vehicles:
+            if vehicle.track_id is None or vehicle.track_id in self.finished_tracks:
+                continue
+            track = self.active_tracks.get(vehicle.track_id)
+            if track is None:
+                estimator = OnlineSpeedEstimator(self.lens_factor, self.frame_rate, self.frames_until_plate_left_view)
+                track = _TrackSpeed(estimator, frame.frame_number, frame.frame_number)
+                self.active_tracks[vehicle.track_id] = track
+            track.last_frame_number = frame.frame_number
+            readings[vehicle.track_id] = track.estimator.update(frame.frame_number, get_plate_height_of_vehicle(vehicle))
+
+        # Tracks that are not in view anymore are moved on until their estimate is final
+        for track_id, track in list(self.active_tracks.items()):
+            if track_id not in readings:
+                readings[track_id] = track.estimator.update(frame.frame_number, None)
+            if frame.frame_number - track.last_frame_number >= self.frames_until_plate_left_view or \
+                    (readings[track_id] is not None and readings[track_id].final):
+                track.estimator.finish()
+                self.finished_tracks[track_id] = self.active_tracks.pop(track_id)
+        return [reading for reading in readings.values() if reading is not None]
+
+    def finish(self):
+        """Finishes the estimation of all tracks that are still active, e.g. once the video has ended"""
+        for track_id, track in self.active_tracks.items():
+            track.estimator.finish()
+            self.finished_tracks[track_id] = track
+        self.active_tracks = {}
+
+    def get_results(self):
+        """Returns one row per vehicle: track id, first and last frame, number of measured plates and speed in km/h"""
+        rows = []
+        for track_id, track in sorted({**self.finished_tracks, **self.active_tracks}.items()):
+            estimator = track.estimator
+            speed = estimator.final_reading.speed if estimator.final_reading is not None else estimator.speed
+            rows.append([track_id, track.first_frame_number, track.last_frame_number,
+                         estimator.number_of_measurements, speed])
+        return rows
+
+    def print_results(self):
+        print(tabulate(self.get_results(), ["Vehicle", "first frame", "last frame", "# plates", "speed in km/h"]))
@@ -0,0 +1,5 @@
+"""
+Tests package:
+This package contains the unit tests. They are run from the /src directory with:
+    python -m unittest discover -s tests -t ..
+"""
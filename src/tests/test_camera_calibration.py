@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+
+import cv2.cv2 as cv2
+import numpy as np
+
+from src.camera_calibration.CameraCalibration import CameraCalibration
+from src.utils.image_utils import get_image_patch_from_rect
+
+IMAGE_SIZE = (480, 640)
+
+
+def create_camera_model_file():
+    """Writes a calibration with a strong barrel distortion for IMAGE_SIZE frames to a temporary directory"""
+    height, width = IMAGE_SIZE
+    camera_matrix = np.array([[500, 0, width / 2], [0, 500, height / 2], [0, 0, 1]], np.float64)
+    distortion_coeffs = np.array([[-0.3, 0.1, 0.001, -0.001, 0]], np.float64)
+    camera_matrix_with_crop, _ = cv2.getOptimalNewCameraMatrix(camera_matrix, distortion_coeffs, (width, height), 1,
+                                                               (width, height))
+    path_to_camera_model_file = os.path.join(tempfile.mkdtemp(), "camera_calibration_test.npz")
+    np.savez(path_to_camera_model_file, camera_matrix=camera_matrix, distortion_coeffs=distortion_coeffs,
+             camera_matrix_with_crop=camera_matrix_with_crop)
+    return path_to_camera_model_file
+
+
+def create_frame():
+    """Smooth random color pattern, so every patch differs from its neighbours"""
+    height, width = IMAGE_SIZE
+    pattern = np.random.RandomState(0).randint(0, 256, (height // 8, width // 8, 3)).astype(np.uint8)
+    return cv2.resize(pattern, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+class UndistortPatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.camera_calibration = CameraCalibration(create_camera_model_file())
+        self.image = create_frame()
+        self.undistorted_image = self.camera_calibration.undistort(self.image)
+
+    def assert_same_patch(self, rect):
+        patch = self.camera_calibration.undistort_patch(self.image, rect)
+        expected_patch = get_image_patch_from_rect(self.undistorted_image, rect)
+        self.assertEqual(patch.shape, expected_patch.shape)
+        np.testing.assert_array_equal(patch, expected_patch)
+
+    def test_patch_within_frame(self):
+        self.assert_same_patch((100, 150, 260, 390))
+        self.assert_same_patch((101, 151, 202, 304))
+
+    def test_patch_at_border_of_frame(self):
+        self.assert_same_patch((0, 0, 120, 160))
+        self.assert_same_patch((400, 500, 480, 640))
+
+    def test_patch_beyond_border_of_frame(self):
+        self.assert_same_patch((-20, -30, 100, 100))
+        self.assert_same_patch((420, 580, 520, 700))
+
+    def test_patch_of_undistorted_box(self):
+        box = self.camera_calibration.undistort_box((120, 200, 300, 420))
+        self.assert_same_patch([int(x) for x in box])
+
+
+if __name__ == "__main__":
+    unittest.main()
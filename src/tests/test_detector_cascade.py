@@ -0,0 +1,76 @@
+import unittest
+from collections import Counter
+
+from src.Video import Vehicle
+from src.car_detection.detector_cascade import DetectorCascade
+
+BOX_A = [0, 0, 100, 100]
+BOX_B = [0, 200, 100, 300]
+BOX_C = [200, 0, 300, 100]
+
+# What the cheap detector finds per frame and why the full detector has to run on it
+CHEAP_VEHICLES = [
+    ([], "no vehicle"),
+    ([Vehicle(box=BOX_A, score=0.4)], "low score"),
+    ([Vehicle(box=BOX_A, score=0.9)], None),
+    ([Vehicle(box=BOX_A, score=0.9), Vehicle(box=BOX_B, score=0.9)], "disagreement with previous frame"),
+    ([Vehicle(box=BOX_A, score=0.9), Vehicle(box=BOX_B, score=0.9)], None),
+    ([Vehicle(box=BOX_C, score=0.9), Vehicle(box=BOX_B, score=0.9)], "disagreement with previous frame"),
+    ([Vehicle(box=BOX_C, score=0.9), Vehicle(box=BOX_B, score=0.9)], None),
+]
+
+
+class ScriptedDetector:
+    """Returns the given vehicles of a frame, the images are the frame numbers"""
+
+    def __init__(self, vehicles_per_frame):
+        self.vehicles_per_frame = vehicles_per_frame
+        self.detected_frames = []
+
+    def detect_vehicle(self, image):
+        self.detected_frames.append(image)
+        return self.vehicles_per_frame[image]
+
+    def detect_vehicles_batch(self, images):
+        return [self.detect_vehicle(image) for image in images]
+
+
+class DetectorCascadeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cheap_detector = ScriptedDetector([vehicles for vehicles, _ in CHEAP_VEHICLES])
+        # The full detector finds one vehicle per frame, whose score is the frame number
+        self.full_detector = ScriptedDetector([[Vehicle(box=BOX_A, score=frame_number)]
+                                               for frame_number in range(len(CHEAP_VEHICLES))])
+        self.cascade = DetectorCascade(self.cheap_detector, self.full_detector)
+
+    def detect(self, batch_size):
+        frame_numbers = list(range(len(CHEAP_VEHICLES)))
+        if batch_size is None:
+            return [self.cascade.detect_vehicle(frame_number) for frame_number in frame_numbers]
+        return [vehicles for i in range(0, len(frame_numbers), batch_size)
+                for vehicles in self.cascade.detect_vehicles_batch(frame_numbers[i:i + batch_size])]
+
+    def test_triggers_full_detector(self):
+        vehicles_per_frame = self.detect(None)
+        triggered_frames = [frame_number for frame_number, (_, reason) in enumerate(CHEAP_VEHICLES) if reason]
+        self.assertEqual(self.full_detector.detected_frames, triggered_frames)
+        for frame_number, vehicles in enumerate(vehicles_per_frame):
+            if frame_number in triggered_frames:
+                self.assertEqual([vehicle.score for vehicle in vehicles], [frame_number])
+            else:
+                self.assertIs(vehicles, CHEAP_VEHICLES[frame_number][0])
+        self.assertEqual(self.cascade.triggers, Counter(reason for _, reason in CHEAP_VEHICLES if reason))
+        self.assertAlmostEqual(self.cascade.trigger_rate, len(triggered_frames) / len(CHEAP_VEHICLES))
+
+    def test_batches_trigger_like_single_frames(self):
+        vehicles_per_frame = self.detect(None)
+        for batch_size in range(1, len(CHEAP_VEHICLES) + 1):
+            with self.subTest(batch_size=batch_size):
+                self.setUp()
+                self.assertEqual(self.detect(batch_size), vehicles_per_frame)
+                self.assertEqual(self.cascade.triggers, Counter(reason for _, reason in CHEAP_VEHICLES if reason))
+
+
+if __name__ == "__main__":
+    unittest.main()
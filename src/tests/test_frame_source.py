@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+
+import cv2.cv2 as cv2
+import numpy as np
+
+from src.utils.frame_source import MoviePyFrameSource, OpenCVFrameSource, PrefetchingFrameReader
+
+FRAME_RATE = 30
+NUMBER_OF_FRAMES = 150
+
+
+def get_frame_image(frame_index):
+    """Writes the bits of the frame index as black and white columns, which survive the compression"""
+    image = np.zeros((48, 64, 3), dtype=np.uint8)
+    for bit in range(8):
+        if frame_index >> bit & 1:
+            image[:, bit * 8:(bit + 1) * 8] = 255
+    return image
+
+
+def get_frame_index(image):
+    return sum(1 << bit for bit in range(8) if image[:, bit * 8 + 2:(bit + 1) * 8 - 2].mean() > 127)
+
+
+class FrameSourceTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.video_file = os.path.join(tempfile.mkdtemp(), "frames.mp4")
+        writer = cv2.VideoWriter(cls.video_file, cv2.VideoWriter_fourcc(*"mp4v"), FRAME_RATE, (64, 48))
+        for frame_index in range(NUMBER_OF_FRAMES):
+            writer.write(get_frame_image(frame_index))
+        writer.release()
+
+    def assert_same_frames(self, from_sec, to_sec, frame_filter=None):
+        opencv_frames = list(OpenCVFrameSource(self.video_file, from_sec, to_sec, frame_filter=frame_filter).frames())
+        moviepy_frames = list(MoviePyFrameSource(self.video_file, from_sec, to_sec, frame_filter=frame_filter).frames())
+        first_frame_index = int(from_sec * FRAME_RATE + 1e-5)
+        expected_frame_indexes = [frame_index if frame_filter is None or frame_filter(frame_index - first_frame_index)
+                                  else None
+                                  for frame_index in range(first_frame_index,
+                                                           first_frame_index + len(moviepy_frames))]
+        self.assertEqual([get_frame_index(frame) if frame is not None else None for frame in moviepy_frames],
+                         expected_frame_indexes)
+        self.assertEqual([get_frame_index(frame) if frame is not None else None for frame in opencv_frames],
+                         expected_frame_indexes)
+
+    def test_backends_start_on_the_same_frame(self):
+        for from_sec in [0, 0.5, 1.7, 2.35, 3.9]:
+            with self.subTest(from_sec=from_sec):
+                self.assert_same_frames(from_sec, from_sec + 0.5)
+
+    def test_backends_skip_the_same_frames(self):
+        self.assert_same_frames(2.1, 3, frame_filter=lambda frame_index: frame_index % 3 == 0)
+
+
+
+class PrefetchingFrameReaderTest(unittest.TestCase):
+
+    def test_yields_the_source_frames(self):
+        images = [np.full((4, 4, 3), value, np.uint8) for value in range(10)]
+        frames = [np.copy(frame) for frame in PrefetchingFrameReader(iter(images), ring_size=2).frames()]
+        self.assertEqual([int(frame[0, 0, 0]) for frame in frames], list(range(10)))
+
+    def test_stopping_early_closes_the_source(self):
+        source_closed = []
+
+        def source_frames():
+            try:
+                while True:
+                    yield np.zeros((4, 4, 3), np.uint8)
+            finally:
+                source_closed.append(True)
+
+        reader = PrefetchingFrameReader(source_frames(), ring_size=2)
+        frames = reader.frames()
+        next(frames)
+        # The decoding thread has filled the ring and waits for a free buffer
+        frames.close()
+        self.assertFalse(reader.decoding_thread.is_alive())
+        self.assertEqual(source_closed, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from multiprocessing.connection import AuthenticationError
+
+import numpy as np
+
+from src.serving.ModelServer import ModelServer, _Batcher
+from src.serving.RemoteModels import RemoteYOLO, RemoteLPValidation
+
+
+class FakeDetector:
+    model_image_size = (32, 32)
+
+    def detect_vehicles_in_image_data(self, image_data, height, width):
+        # The mean pixel value before the images were normalized
+        return [(height, width, round(float(image.mean()) * 255)) for image in image_data]
+
+
+class FakeLPValidation:
+
+    def _predict(self, license_plate_candidates):
+        return license_plate_candidates.reshape(len(license_plate_candidates), -1).mean(axis=1)
+
+
+class BatcherTest(unittest.TestCase):
+
+    def test_batches_queued_requests(self):
+        batches = []
+        batcher = _Batcher("test", lambda payloads: batches.append(payloads) or payloads, len, 4, 10)
+        results = []
+        for payload in ["a", "b", "c"]:
+            batcher.submit(payload, results.append)
+        batcher.start()
+        batcher.close()
+        self.assertEqual(batches, [["a", "b", "c"]])
+        self.assertEqual(results, ["a", "b", "c"])
+
+    def test_keeps_running_if_a_reply_fails(self):
+        batcher = _Batcher("test", lambda payloads: payloads, len, 1, 0)
+        batcher.start()
+
+        def broken_reply(result):
+            raise BrokenPipeError()
+
+        results = []
+        answered = threading.Event()
+        batcher.submit("a", broken_reply)
+        batcher.submit("b", lambda result: results.append(result) or answered.set())
+        self.assertTrue(answered.wait(5))
+        batcher.close()
+        self.assertEqual(results, ["b"])
+        self.assertFalse(batcher.thread.is_alive())
+
+
+AUTHKEY = b"test"
+
+
+class ModelServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.address = os.path.join(tempfile.mkdtemp(), "models.sock")
+        self.server = ModelServer({"yolo": FakeDetector()}, FakeLPValidation(), self.address, AUTHKEY,
+                                  max_latency=0.2)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        while self.server.listener is None:
+            self.thread.join(0.01)
+
+    def tearDown(self):
+        self.server.close()
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+
+    def test_serves_clients(self):
+        yolo = RemoteYOLO(self.address, model_image_size=FakeDetector.model_image_size, authkey=AUTHKEY)
+        lp_validation = RemoteLPValidation(self.address, AUTHKEY)
+        self.assertEqual(yolo.detect_vehicles_batch([np.full((64, 48, 3), 51, np.uint8)] * 2), [(64, 48, 51)] * 2)
+        self.assertEqual(list(lp_validation._predict(np.full((3, 2, 2, 3), 5, np.float32))), [5, 5, 5])
+        with self.assertRaises(ValueError):
+            RemoteYOLO(self.address, model_image_size=(64, 64), authkey=AUTHKEY).detect_vehicle(
+                np.zeros((64, 48, 3), np.uint8))
+        with self.assertRaises(KeyError):
+            RemoteYOLO(self.address, "unknown", authkey=AUTHKEY).detect_vehicle(np.zeros((4, 4, 3), np.uint8))
+        yolo.close()
+        lp_validation.close()
+
+    def test_batches_the_requests_of_the_threads_of_a_client(self):
+        yolo = RemoteYOLO(self.address, model_image_size=FakeDetector.model_image_size, authkey=AUTHKEY)
+        results = []
+        threads = [threading.Thread(target=lambda value=value: results.append(
+            yolo.detect_vehicle(np.full((32, 32, 3), value, np.uint8)))) for value in [1, 2]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        yolo.close()
+        self.assertCountEqual(results, [(32, 32, 1), (32, 32, 2)])
+        self.assertEqual(self.server.batchers["yolo"].number_of_batches, 1)
+
+    def test_refuses_to_start_on_a_live_socket(self):
+        with self.assertRaises(RuntimeError):
+            ModelServer({}, FakeLPValidation(), self.address, AUTHKEY).serve_forever()
+        # The server keeps serving after the check connected to it
+        yolo = RemoteYOLO(self.address, model_image_size=FakeDetector.model_image_size, authkey=AUTHKEY)
+        self.assertEqual(yolo.detect_vehicle(np.zeros((32, 32, 3), np.uint8)), (32, 32, 0))
+        yolo.close()
+
+    def test_rejects_clients_with_a_wrong_key(self):
+        with self.assertRaises(AuthenticationError):
+            RemoteYOLO(self.address, authkey=b"wrong")
+        yolo = RemoteYOLO(self.address, model_image_size=FakeDetector.model_image_size, authkey=AUTHKEY)
+        self.assertEqual(yolo.detect_vehicle(np.zeros((32, 32, 3), np.uint8)), (32, 32, 0))
+        yolo.close()
+
+
+class StaleSocketTest(unittest.TestCase):
+
+    def test_replaces_the_socket_of_a_stopped_server(self):
+        address = os.path.join(tempfile.mkdtemp(), "models.sock")
+        with socket.socket(socket.AF_UNIX) as stale:
+            stale.bind(address)
+        server = ModelServer({}, FakeLPValidation(), address, AUTHKEY)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        while server.listener is None:
+            thread.join(0.01)
+        server.close()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
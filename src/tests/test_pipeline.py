@@ -0,0 +1,62 @@
+import unittest
+
+from src.utils.pipeline import Pipeline, Stage
+
+
+def failing_source(number_of_items):
+    for item in range(number_of_items):
+        yield item
+    raise ValueError("source failed")
+
+
+class PipelineTest(unittest.TestCase):
+
+    def create_pipeline(self):
+        return Pipeline([Stage("double", lambda item: item * 2, workers=2), Stage("increment", lambda item: item + 1)])
+
+    def test_keeps_order(self):
+        self.assertEqual(list(self.create_pipeline().run(range(50))), [item * 2 + 1 for item in range(50)])
+
+    def test_raises_failure_of_source_after_its_items(self):
+        results = []
+        with self.assertRaisesRegex(ValueError, "source failed"):
+            for item in self.create_pipeline().run(failing_source(3)):
+                results.append(item)
+        self.assertEqual(results, [1, 3, 5])
+
+    def test_raises_failure_of_source_before_first_item(self):
+        with self.assertRaisesRegex(ValueError, "source failed"):
+            list(self.create_pipeline().run(failing_source(0)))
+
+    def test_raises_failure_of_stage(self):
+        def fail_on_three(item):
+            if item == 3:
+                raise ValueError("stage failed")
+            return item
+
+        with self.assertRaisesRegex(ValueError, "stage failed"):
+            list(Pipeline([Stage("fail", fail_on_three, workers=2)]).run(range(10)))
+
+    def test_stopping_early_stops_the_threads(self):
+        source_closed = []
+
+        def endless_source():
+            try:
+                item = 0
+                while True:
+                    yield item
+                    item += 1
+            finally:
+                source_closed.append(True)
+
+        pipeline = Pipeline([Stage("double", lambda item: item * 2, workers=2)], queue_size=2)
+        results = pipeline.run(endless_source())
+        self.assertEqual([next(results) for _ in range(3)], [0, 2, 4])
+        # The stages and the feeder are blocked on the full queues now
+        results.close()
+        self.assertFalse(any(thread.is_alive() for thread in pipeline.threads))
+        self.assertEqual(source_closed, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from src.Video import Vehicle
+from src.car_detection.resolution_policy import InputResolutionPolicy, get_input_size
+
+UHD_SHAPE = (2160, 3840, 3)
+
+
+def create_vehicle(height):
+    return Vehicle(box=[1000, 1000, 1000 + height, 1000 + height * 2], score=0.9)
+
+
+class GetInputSizeTest(unittest.TestCase):
+
+    def test_rounds_to_multiples_of_32(self):
+        self.assertEqual(get_input_size((100, 100, 3), 410), (416, 416))
+        self.assertEqual(get_input_size((100, 100, 3), 330), (320, 320))
+        self.assertEqual(get_input_size((100, 100, 3), 10), (32, 32))
+        self.assertEqual(get_input_size((1000, 10, 3), 320), (32, 320))
+
+    def test_keeps_aspect_ratio(self):
+        self.assertEqual(get_input_size(UHD_SHAPE, 320), (576, 320))
+        self.assertEqual(get_input_size(UHD_SHAPE, 416), (736, 416))
+        self.assertEqual(get_input_size(UHD_SHAPE, 608), (1088, 608))
+
+
+class InputResolutionPolicyTest(unittest.TestCase):
+
+    def test_largest_height_without_vehicles(self):
+        policy = InputResolutionPolicy()
+        self.assertEqual(policy.select(UHD_SHAPE), (1088, 608))
+        policy.update([])
+        self.assertEqual(policy.select(UHD_SHAPE), (1088, 608))
+
+    def test_smaller_height_for_large_vehicles(self):
+        policy = InputResolutionPolicy()
+        # A vehicle of 500 pixel covers 74 input pixel at a height of 320
+        policy.update([create_vehicle(500)])
+        self.assertEqual(policy.select(UHD_SHAPE), (576, 320))
+        # One of 400 pixel only 59, it covers 77 at 416
+        policy.update([create_vehicle(400)])
+        self.assertEqual(policy.select(UHD_SHAPE), (736, 416))
+
+    def test_smallest_vehicle_decides(self):
+        policy = InputResolutionPolicy()
+        policy.update([create_vehicle(800), create_vehicle(200)])
+        self.assertEqual(policy.select(UHD_SHAPE), (1088, 608))
+        policy.update([create_vehicle(800)])
+        self.assertEqual(policy.select(UHD_SHAPE), (576, 320))
+        policy.update([])
+        self.assertEqual(policy.select(UHD_SHAPE), (1088, 608))
+        self.assertEqual(policy.selected_sizes, {(1088, 608): 2, (576, 320): 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
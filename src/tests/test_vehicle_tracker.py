@@ -0,0 +1,92 @@
+import unittest
+
+import cv2.cv2 as cv2
+import numpy as np
+
+from src.Video import Vehicle
+from src.tracking.VehicleTracker import VehicleTracker
+from src.utils.image_utils import get_intersection_over_union
+
+IMAGE_SIZE = (480, 640)
+
+
+def create_texture(height, width, seed):
+    """Smooth random pattern that still has structure when downscaled"""
+    pattern = np.random.RandomState(seed).randint(0, 256, (height // 16, width // 16)).astype(np.uint8)
+    return cv2.resize(pattern, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+class SyntheticVideo:
+    """A textured vehicle on a textured background that grows by 'growth' per frame around a fixed center"""
+
+    def __init__(self, growth):
+        self.growth = growth
+        self.background = create_texture(*IMAGE_SIZE, seed=1) // 2
+        self.vehicle_texture = create_texture(320, 400, seed=2)
+        self.frame_number = 0
+
+    def get_box(self, frame_number):
+        height, width = np.array([100, 125]) * self.growth ** frame_number
+        center_y, center_x = 240, 320
+        return np.array([center_y - height / 2, center_x - width / 2,
+                         center_y + height / 2, center_x + width / 2]).round()
+
+    def get_image(self, frame_number):
+        top, left, bottom, right = self.get_box(frame_number).astype(int)
+        image = np.copy(self.background)
+        image[top:bottom, left:right] = cv2.resize(self.vehicle_texture, (right - left, bottom - top),
+                                                   interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+
+class GroundTruthDetector:
+
+    def __init__(self, video):
+        self.video = video
+        self.frame_number = 0
+        self.number_of_calls = 0
+
+    def detect_vehicle(self, image):
+        self.number_of_calls += 1
+        return [Vehicle(box=self.video.get_box(self.frame_number), score=0.9)]
+
+
+class VehicleTrackerTest(unittest.TestCase):
+
+    def track(self, growth, number_of_frames=10):
+        """Returns the tracked and the true box of every frame and the detector"""
+        video = SyntheticVideo(growth)
+        detector = GroundTruthDetector(video)
+        tracker = VehicleTracker(detector, detection_interval=number_of_frames)
+        boxes = []
+        for frame_number in range(number_of_frames):
+            detector.frame_number = frame_number
+            vehicles = tracker.detect_vehicle(video.get_image(frame_number))
+            self.assertEqual(len(vehicles), 1)
+            boxes.append((vehicles[0].box, video.get_box(frame_number)))
+        return boxes, detector
+
+    def assert_follows(self, boxes):
+        for box, true_box in boxes:
+            self.assertGreater(get_intersection_over_union(box, true_box), 0.85)
+            true_height = true_box[2] - true_box[0]
+            self.assertAlmostEqual(box[2] - box[0], true_height, delta=true_height * 0.08)
+
+    def test_follows_still_vehicle(self):
+        boxes, detector = self.track(growth=1.0)
+        self.assertEqual(detector.number_of_calls, 1)
+        self.assert_follows(boxes)
+
+    def test_box_grows_with_approaching_vehicle(self):
+        boxes, detector = self.track(growth=1.03)
+        self.assertEqual(detector.number_of_calls, 1)
+        self.assert_follows(boxes)
+
+    def test_box_shrinks_with_receding_vehicle(self):
+        boxes, detector = self.track(growth=1 / 1.03)
+        self.assertEqual(detector.number_of_calls, 1)
+        self.assert_follows(boxes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.Video import Frame, Plate, Vehicle, Video
+
+
+def create_frame(frame_number):
+    image = np.random.RandomState(frame_number).randint(0, 256, (48, 64, 3)).astype(np.uint8)
+    plate = Plate(height=12.5, box=[10, 5, 22, 40])
+    plate.valid = True
+    vehicle = Vehicle(box=[0, 0, 40, 50], score=0.9, track_id=1, plates=[plate], image=image[:40, :50].copy())
+    return Frame(frame_number, image, [vehicle])
+
+
+class VideoTest(unittest.TestCase):
+
+    def test_keeps_images_without_streaming(self):
+        video = Video("video.mov")
+        frame = create_frame(3)
+        video.add_frame(frame)
+        self.assertIsNotNone(frame.image)
+        self.assertIsNotNone(frame.vehicles[0].image)
+
+    def test_drops_images_in_streaming_mode(self):
+        video = Video("video.mov", streaming=True)
+        frame = create_frame(3)
+        video.add_frame(frame)
+        self.assertIsNone(frame.image)
+        self.assertIsNone(frame.image_path)
+        self.assertIsNone(frame.vehicles[0].image)
+
+    def test_spilled_image_round_trip(self):
+        video = Video("video.mov", streaming=True, spill_directory=tempfile.mkdtemp())
+        frames = [create_frame(frame_number) for frame_number in range(3)]
+        images = [np.copy(frame.image) for frame in frames]
+        for frame in frames:
+            video.add_frame(frame)
+
+        for frame, image in zip(video.frames, images):
+            self.assertIsNone(frame.image)
+            self.assertIsNone(frame.vehicles[0].image)
+            np.testing.assert_array_equal(frame.load_spilled_image(), image)
+            # The metadata is kept
+            plate = frame.vehicles[0].plates[0]
+            self.assertTrue(plate.valid)
+            self.assertEqual(plate.height, 12.5)
+            self.assertEqual(frame.vehicles[0].track_id, 1)
+
+    def test_release_vehicle_images_keeps_frame_image(self):
+        frame = create_frame(3)
+        frame.release_vehicle_images()
+        self.assertIsNotNone(frame.image)
+        self.assertIsNone(frame.vehicles[0].image)
+
+
+if __name__ == "__main__":
+    unittest.main()
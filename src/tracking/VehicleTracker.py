@@ -0,0 +1,184 @@
+"""
+Tracks vehicles across frames so the expensive vehicle detection does not have to run on every frame.
+
+At 60 fps a vehicle only moves a few pixels between two frames. The detector therefore only runs every
+'detection_interval' frames, in between the boxes are propagated by matching the vehicle's appearance within a small
+search window around its last position. The appearance is matched at slightly different sizes as well, so the box grows
+with a vehicle that approaches the camera and shrinks with one that moves away.
+"""
+from dataclasses import dataclass
+
+import cv2.cv2 as cv2
+import numpy as np
+from numpy.core.multiarray import ndarray
+
+from src.Video import Vehicle
+from src.utils.image_utils import get_intersection_over_union
+from src.utils.timer import timing
+
+
+@dataclass
+class _Track:
+    """
+    A vehicle followed across frames. The template is a downscaled gray image of it taken at its last detection,
+    'template_offset' is the (y, x) distance from the template's upper left corner to the box in full resolution, and
+    'detected_size' the (height, width) of the box at that time. 'template_scale' is the size of the vehicle in the
+    last frame relative to its detection.
+    """
+    track_id: int
+    box: ndarray
+    score: float
+    template: ndarray
+    template_offset: ndarray
+    detected_size: ndarray
+    template_scale: float = 1.0
+
+
+class _TrackGrid:
+    """
+    Buckets tracks by the center of their box into square cells, so a detection only has to be compared with the tracks
+    in the neighbouring cells instead of all of them. The cells are as large as the largest box, which guarantees that
+    two overlapping boxes are at most one cell apart.
+    """
+
+    def __init__(self, tracks, vehicles):
+        box_sizes = [max(box[2] - box[0], box[3] - box[1]) for box in [t.box for t in tracks] + [v.box for v in vehicles]]
+        self.cell_size = max(max(box_sizes, default=1), 1)
+        self.cells = {}
+        for track in tracks:
+            self.cells.setdefault(self._get_cell(track.box), []).append(track)
+
+    def get_candidates(self, box):
+        """Returns the tracks that can overlap with the box"""
+        row, column = self._get_cell(box)
+        return [track for d_row in (-1, 0, 1) for d_column in (-1, 0, 1)
+                for track in self.cells.get((row + d_row, column + d_column), [])]
+
+    def remove(self, track):
+        self.cells[self._get_cell(track.box)].remove(track)
+
+    def _get_cell(self, box):
+        top, left, bottom, right = box
+        return int((top + bottom) / 2 // self.cell_size), int((left + right) / 2 // self.cell_size)
+
+
+class VehicleTracker:
+    """
+    Wraps a vehicle detector (e.g. YOLO) and can be used in its place. Every returned Vehicle carries the id of its
+    track. The detector runs every 'detection_interval' frames and whenever a track can not be followed with at least
+    'min_match_score', i.e. the vehicle changed too much or left the search window. In between, the vehicles are looked
+    for at up to 'scale_steps' times the factor 'scale_step' smaller or larger than in the last frame.
+    """
+
+    def __init__(self, detector, detection_interval=10, min_match_score=0.6, min_iou=0.3, search_margin=0.25,
+                 scale=0.25, scale_step=1.03, scale_steps=2):
+        self.detector = detector
+        self.detection_interval = detection_interval
+        self.min_match_score = min_match_score
+        self.min_iou = min_iou
+        self.search_margin = search_margin
+        self.scale = scale
+        self.scale_step = scale_step
+        self.scale_steps = scale_steps
+        self.tracks: [_Track] = []
+        self.next_track_id = 0
+        self.frames_since_detection = 0
+        self.number_of_frames = 0
+        self.number_of_detections = 0
+
+    @timing
+    def detect_vehicle(self, image) -> [Vehicle]:
+        """Returns the vehicles in this 'image', which has to be the frame following the previous call"""
+        self.number_of_frames += 1
+        small_gray_image = cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), None, fx=self.scale, fy=self.scale)
+
+        if self.frames_since_detection + 1 < self.detection_interval and self.tracks:
+            propagated_boxes = [self._propagate(track, small_gray_image) for track in self.tracks]
+            if all(box is not None for box in propagated_boxes):
+                self.frames_since_detection += 1
+                for track, box in zip(self.tracks, propagated_boxes):
+                    track.box = box
+                return [Vehicle(box=np.copy(track.box), score=track.score, track_id=track.track_id) for track in self.tracks]
+
+        return self._detect(image, small_gray_image)
+
+    @property
+    def detection_rate(self):
+        """Fraction of frames on which the detector had to run"""
+        return self.number_of_detections / self.number_of_frames if self.number_of_frames > 0 else 0
+
+    def print_statistics(self):
+        print("Vehicle detector ran on {0} of {1} frames, detection rate: {2:.2f}".format(
+            self.number_of_detections, self.number_of_frames, self.detection_rate))
+
+    def _detect(self, image, small_gray_image):
+        """Runs the detector and assigns the found vehicles to the existing tracks or new ones"""
+        self.number_of_detections += 1
+        self.frames_since_detection = 0
+        vehicles = self.detector.detect_vehicle(image)
+
+        track_grid = _TrackGrid(self.tracks, vehicles)
+        new_tracks = []
+        for vehicle in sorted(vehicles, key=lambda v: v.score, reverse=True):
+            best_track = max(track_grid.get_candidates(vehicle.box),
+                             key=lambda t: get_intersection_over_union(t.box, vehicle.box), default=None)
+            if best_track is not None and get_intersection_over_union(best_track.box, vehicle.box) >= self.min_iou:
+                track_grid.remove(best_track)
+                track_id = best_track.track_id
+            else:
+                track_id = self.next_track_id
+                self.next_track_id += 1
+            vehicle.track_id = track_id
+            top, left, bottom, right = self._to_small_coordinates(small_gray_image, vehicle.box)
+            template = small_gray_image[top:bottom, left:right]
+            template_offset = vehicle.box[:2] - np.array([top, left]) / self.scale
+            detected_size = vehicle.box[2:] - vehicle.box[:2]
+            new_tracks.append(_Track(track_id, np.copy(vehicle.box), vehicle.score, template, template_offset,
+                                     detected_size))
+        self.tracks = new_tracks
+        return vehicles
+
+    def _propagate(self, track, small_gray_image):
+        """
+        Returns the box of the track within this frame or None if it could not be found reliably. The template is
+        matched at the size of the vehicle in the last frame and at up to 'scale_steps' steps smaller and larger, the
+        best match gives the new position and size. A single step either way is not enough, the scores of the small
+        template do not fall off evenly around the best size.
+        """
+        top, left, bottom, right = self._to_small_coordinates(small_gray_image, track.box)
+        margin_y = int((bottom - top) * self.search_margin)
+        margin_x = int((right - left) * self.search_margin)
+        image_height, image_width = small_gray_image.shape[:2]
+        search_top, search_left = max(top - margin_y, 0), max(left - margin_x, 0)
+        search_bottom, search_right = min(bottom + margin_y, image_height), min(right + margin_x, image_width)
+        search_window = small_gray_image[search_top:search_bottom, search_left:search_right]
+
+        best_score, best_position, best_scale = self.min_match_score, None, None
+        steps = np.arange(-self.scale_steps, self.scale_steps + 1)
+        for template_scale in track.template_scale * self.scale_step ** steps:
+            template_height, template_width = [int(round(x * template_scale)) for x in track.template.shape[:2]]
+            if template_height == 0 or template_width == 0 or \
+                    search_window.shape[0] < template_height or search_window.shape[1] < template_width:
+                continue
+            template = track.template
+            if template_scale != 1:
+                template = cv2.resize(track.template, (template_width, template_height), interpolation=cv2.INTER_AREA)
+            scores = cv2.matchTemplate(search_window, template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (x, y) = cv2.minMaxLoc(scores)
+            if score >= best_score:
+                best_score, best_position, best_scale = score, (y, x), template_scale
+        if best_position is None:
+            return None
+        track.template_scale = best_scale
+
+        # The position is derived from the template's origin instead of the last box, so rounding errors do not add up
+        best_y, best_x = best_position
+        new_top, new_left = np.array([search_top + best_y, search_left + best_x]) / self.scale + \
+            track.template_offset * best_scale
+        height, width = track.detected_size * best_scale
+        return np.array([new_top, new_left, new_top + height, new_left + width]).round()
+
+    def _to_small_coordinates(self, small_gray_image, box):
+        image_height, image_width = small_gray_image.shape[:2]
+        top, left, bottom, right = [int(round(x * self.scale)) for x in box]
+        return max(top, 0), max(left, 0), min(bottom, image_height), min(right, image_width)
@@ -0,0 +1,4 @@
+"""
+Tracking package:
+This package contains all code related to following vehicles across frames.
+"""
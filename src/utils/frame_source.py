@@ -0,0 +1,264 @@
+"""
+Frame sources that decode a video file and yield BGR frames one at a time, as well as a reader that decodes ahead.
+
+The OpenCV source decodes directly into BGR, seeks close to the start of the requested range and can decode into a
+reused buffer. The MoviePy source reads raw RGB frames piped from an ffmpeg subprocess and has to convert every frame.
+Both can optionally downscale the frames for stages that do not need the full resolution and skip frames that are not
+needed at all: a 'frame_filter' gets the index of every frame and if it returns False, None is yielded in its place.
+"""
+import math
+import os
+import queue
+import threading
+import time
+
+import cv2.cv2 as cv2
+import numpy as np
+from moviepy.video.io.VideoFileClip import VideoFileClip
+
+from src.utils import timer
+
+
+# How far before the requested start the OpenCV source seeks at first, in seconds. It is doubled as long as the seek
+# lands behind the start.
+_SEEK_MARGIN = 0.5
+
+
+class OpenCVFrameSource:
+    """
+    Decodes with cv2.VideoCapture. If 'reuse_buffer' is set, every frame is decoded into the same array, so a yielded
+    frame is only valid until the next one is requested. 'downscale_to' (width, height) resizes every frame.
+    Frames rejected by the 'frame_filter' are only grabbed from the container but not retrieved.
+    It starts on the same frame as the MoviePyFrameSource, see _seek.
+    """
+
+    def __init__(self, path_to_video, from_sec=0, to_sec=None, reuse_buffer=False, downscale_to=None,
+                 frame_filter=None):
+        self.capture = cv2.VideoCapture(os.path.abspath(path_to_video))
+        if not self.capture.isOpened():
+            raise IOError("Could not open video file: " + path_to_video)
+        self.from_sec = from_sec
+        self.to_sec = to_sec
+        self.reuse_buffer = reuse_buffer
+        self.downscale_to = downscale_to
+        self.frame_filter = frame_filter
+
+    @property
+    def fps(self):
+        return self.capture.get(cv2.CAP_PROP_FPS)
+
+    def frames(self):
+        number_of_frames = None
+        if self.to_sec is not None and self.fps > 0:
+            number_of_frames = math.ceil((self.to_sec - self.from_sec) * self.fps)
+
+        buffer = None
+        downscaled_buffer = None
+        frame_count = 0
+        try:
+            grabbed = self._seek()
+            while number_of_frames is None or frame_count < number_of_frames:
+                if not grabbed and not self.capture.grab():
+                    break
+                grabbed = False
+                if self._is_past_end(number_of_frames):
+                    break
+                if self.frame_filter is not None and not self.frame_filter(frame_count):
+                    frame_count += 1
+                    yield None
+                    continue
+                success, frame = self.capture.retrieve(buffer)
+                if not success:
+                    break
+                frame_count += 1
+                if self.reuse_buffer:
+                    buffer = frame
+                if self.downscale_to is not None:
+                    frame = cv2.resize(frame, self.downscale_to, dst=downscaled_buffer, interpolation=cv2.INTER_AREA)
+                    if self.reuse_buffer:
+                        downscaled_buffer = frame
+                yield frame
+        finally:
+            self.capture.release()
+
+    def _seek(self):
+        """
+        Moves to the frame at 'from_sec' and returns True if it is grabbed already. Seeking by time is not frame
+        accurate for e.g. H.264 in a .mov, the capture may land a few frames off. So it seeks a little earlier and grabs
+        frame by frame until the timestamp of a frame reaches the first frame moviepy would return, the one with index
+        int(from_sec * fps). If the seek still lands behind that frame, it seeks further back.
+        """
+        if self.from_sec <= 0:
+            return False
+        if self.fps <= 0:
+            # Without a frame rate the first frame is not known, this is as close as it gets
+            self.capture.set(cv2.CAP_PROP_POS_MSEC, self.from_sec * 1000)
+            return False
+        first_frame_msec = int(self.from_sec * self.fps + 1e-5) * 1000 / self.fps
+        # Timestamps are compared with a tolerance of half a frame
+        tolerance_msec = 500 / self.fps
+        margin = _SEEK_MARGIN
+        while True:
+            seek_msec = max(first_frame_msec - margin * 1000, 0)
+            self.capture.set(cv2.CAP_PROP_POS_MSEC, seek_msec)
+            if not self.capture.grab():
+                return False
+            # The position is the timestamp of the frame that was just grabbed
+            if seek_msec == 0 or self.capture.get(cv2.CAP_PROP_POS_MSEC) <= first_frame_msec + tolerance_msec:
+                break
+            margin *= 2
+        while self.capture.get(cv2.CAP_PROP_POS_MSEC) < first_frame_msec - tolerance_msec:
+            if not self.capture.grab():
+                return False
+        return True
+
+    def _is_past_end(self, number_of_frames):
+        """
+        Tells if the frame that was just read is behind 'to_sec'. Only needed if the number of frames is unknown
+        because the container does not know the frame rate, the position is then taken from the frame's timestamp.
+        """
+        return number_of_frames is None and self.to_sec is not None and \
+            self.capture.get(cv2.CAP_PROP_POS_MSEC) >= self.to_sec * 1000
+
+
+class MoviePyFrameSource:
+    """
+    Decodes with moviepy. It takes the same arguments as the OpenCVFrameSource, frames rejected by the 'frame_filter'
+    are still decoded by ffmpeg but not converted.
+    """
+
+    def __init__(self, path_to_video, from_sec=0, to_sec=None, reuse_buffer=False, downscale_to=None,
+                 frame_filter=None):
+        self.clip = VideoFileClip(os.path.abspath(path_to_video), audio=False).subclip(from_sec, to_sec)
+        self.reuse_buffer = reuse_buffer
+        self.downscale_to = downscale_to
+        self.frame_filter = frame_filter
+
+    @property
+    def fps(self):
+        return self.clip.fps
+
+    def frames(self):
+        buffer = None
+        downscaled_buffer = None
+        for frame_index, frame in enumerate(self.clip.iter_frames()):
+            if self.frame_filter is not None and not self.frame_filter(frame_index):
+                yield None
+                continue
+            # We have to switch the order of channels as opencv has a different order as they are coming from the camera
+            color_corrected_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=buffer)
+            if self.reuse_buffer:
+                buffer = color_corrected_frame
+            if self.downscale_to is not None:
+                color_corrected_frame = cv2.resize(color_corrected_frame, self.downscale_to, dst=downscaled_buffer,
+                                                   interpolation=cv2.INTER_AREA)
+                if self.reuse_buffer:
+                    downscaled_buffer = color_corrected_frame
+            yield color_corrected_frame
+
+
+FRAME_SOURCES = {
+    "opencv": OpenCVFrameSource,
+    "moviepy": MoviePyFrameSource,
+}
+
+
+def create_frame_source(path_to_video, from_sec=0, to_sec=None, backend="opencv", reuse_buffer=False,
+                        downscale_to=None, frame_filter=None):
+    """Creates the frame source of the given 'backend', see FRAME_SOURCES"""
+    return FRAME_SOURCES[backend](path_to_video, from_sec, to_sec, reuse_buffer, downscale_to, frame_filter)
+
+
+_END_OF_VIDEO = object()
+
+# How often the decoding thread of a PrefetchingFrameReader that waits for a free buffer checks if it was closed, in
+# seconds
+_STOP_POLL_INTERVAL = 0.1
+
+
+class PrefetchingFrameReader:
+    """
+    Decodes frames ahead on a background thread into a fixed ring of 'ring_size' preallocated buffers, so decoding
+    overlaps with the processing of earlier frames. When all buffers are filled the decoding thread waits, which caps the
+    memory that is held by decoded frames.
+
+    A yielded frame lives in one of the ring buffers and is only valid until the next frame is requested, it has to be
+    copied if it is needed for longer. The time spent waiting for a decoded frame is reported to the timer module as
+    'prefetch_starvation', the number of frames that were ready as 'prefetch_ring_occupancy'.
+
+    If the consumer stops early, close has to be called or the generator of frames closed. The decoding thread then
+    stops and closes the source 'frames', which releases the video.
+    """
+
+    def __init__(self, frames, ring_size=4):
+        self.source_frames = frames
+        self.ring_size = ring_size
+        self.buffers = [None] * ring_size
+        self.free_slots = queue.Queue()
+        self.filled_slots = queue.Queue()
+        for slot in range(ring_size):
+            self.free_slots.put(slot)
+        self.stopped = threading.Event()
+        self.decoding_thread = None
+
+    def frames(self):
+        self.decoding_thread = threading.Thread(target=self._decode, daemon=True)
+        self.decoding_thread.start()
+        slot = None
+        try:
+            while True:
+                if slot is not None:
+                    self.free_slots.put(slot)
+                timer.record_sample("prefetch_ring_occupancy", self.filled_slots.qsize())
+                start = time.time()
+                slot = self.filled_slots.get()
+                timer.record_time("prefetch_starvation", time.time() - start)
+                if slot is _END_OF_VIDEO:
+                    break
+                if isinstance(slot, Exception):
+                    raise slot
+                if slot is None:
+                    yield None
+                    continue
+                yield self.buffers[slot]
+        finally:
+            self.close()
+
+    def close(self):
+        """Stops the decoding thread and waits until it closed the source frames"""
+        self.stopped.set()
+        if self.decoding_thread is not None and self.decoding_thread is not threading.current_thread():
+            self.decoding_thread.join()
+
+    def _decode(self):
+        try:
+            for frame in self.source_frames:
+                if self.stopped.is_set():
+                    return
+                if frame is None:
+                    # A skipped frame, see frame_filter
+                    self.filled_slots.put(None)
+                    continue
+                slot = self._get_free_slot()
+                if slot is None:
+                    return
+                if self.buffers[slot] is None or self.buffers[slot].shape != frame.shape:
+                    self.buffers[slot] = np.empty_like(frame)
+                np.copyto(self.buffers[slot], frame)
+                self.filled_slots.put(slot)
+            self.filled_slots.put(_END_OF_VIDEO)
+        except Exception as e:
+            self.filled_slots.put(e)
+        finally:
+            # The source is a generator that is closed from this thread, which is the one that runs it
+            if hasattr(self.source_frames, "close"):
+                self.source_frames.close()
+
+    def _get_free_slot(self):
+        """Waits for a free buffer and returns its slot, or None if the reader was closed in the meantime"""
+        while not self.stopped.is_set():
+            try:
+                return self.free_slots.get(timeout=_STOP_POLL_INTERVAL)
+            except queue.Empty:
+                pass
+        return None
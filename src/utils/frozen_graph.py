@@ -0,0 +1,81 @@
+"""
+Export and loading of frozen inference graphs.
+
+A frozen graph contains only the operations needed to compute the given outputs, with all variables replaced by
+constants and constant subexpressions folded. It is loaded straight into its own graph and session, without rebuilding
+the Keras model first. The names of the input and output tensors are stored next to the graph file in a json file, so
+the networks can be run by the logical names given on export, together with the settings that were baked into the graph.
+"""
+import json
+
+import tensorflow as tf
+from tensorflow.tools.graph_transforms import TransformGraph
+
+# Graph transforms that are applied after freezing, see the graph_transforms tool of tensorflow
+_TRANSFORMS = [
+    "fold_constants(ignore_errors=true)",
+    "fold_batch_norms",
+    "fold_old_batch_norms",
+    "strip_unused_nodes",
+    "sort_by_execution_order",
+]
+
+
+def get_path_to_tensor_names_file(path_to_graph_file):
+    return path_to_graph_file.rsplit(".", 1)[0] + ".json"
+
+
+def export_frozen_graph(sess, inputs, outputs, path_to_graph_file, settings=None):
+    """
+    Freezes the part of the graph of 'sess' that computes the 'outputs' from the 'inputs' and writes it to
+    'path_to_graph_file'. 'inputs' and 'outputs' map logical names to tensors. The graph should have been built with the
+    learning phase set to inference, so the training branches are not part of it. 'settings' is a json serializable
+    dict of the parameters the graph was built with, it is handed to FrozenGraph on loading.
+    """
+    input_node_names = [tensor.op.name for tensor in inputs.values()]
+    output_node_names = [tensor.op.name for tensor in outputs.values()]
+    graph_def = tf.graph_util.convert_variables_to_constants(sess, sess.graph.as_graph_def(), output_node_names)
+    # tf.graph_util.remove_training_nodes is not applied: it drops Identity nodes, which within a while loop, e.g. the
+    # tf.map_fn of the batched yolo post-processing, carry the loop variables from one iteration to the next
+    graph_def = TransformGraph(graph_def, input_node_names, output_node_names, _TRANSFORMS)
+
+    with tf.gfile.GFile(path_to_graph_file, "wb") as f:
+        f.write(graph_def.SerializeToString())
+    tensor_names = {
+        "inputs": {name: tensor.name for name, tensor in inputs.items()},
+        "outputs": {name: tensor.name for name, tensor in outputs.items()},
+        "settings": settings if settings is not None else {},
+    }
+    with open(get_path_to_tensor_names_file(path_to_graph_file), "w") as f:
+        json.dump(tensor_names, f, indent=2)
+    print("Wrote frozen graph with {0} nodes to {1}".format(len(graph_def.node), path_to_graph_file))
+
+
+class FrozenGraph:
+    """Loads a graph written by export_frozen_graph into its own graph and session and runs it"""
+
+    def __init__(self, path_to_graph_file):
+        graph_def = tf.GraphDef()
+        with tf.gfile.GFile(path_to_graph_file, "rb") as f:
+            graph_def.ParseFromString(f.read())
+        with open(get_path_to_tensor_names_file(path_to_graph_file)) as f:
+            tensor_names = json.load(f)
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name="")
+        self.inputs = {name: self.graph.get_tensor_by_name(tensor_name)
+                       for name, tensor_name in tensor_names["inputs"].items()}
+        self.outputs = {name: self.graph.get_tensor_by_name(tensor_name)
+                        for name, tensor_name in tensor_names["outputs"].items()}
+        # Graphs exported before the settings were stored have none
+        self.settings = tensor_names.get("settings")
+        self.sess = tf.Session(graph=self.graph)
+
+    def run(self, output_names, feeds):
+        """Computes the outputs of the given names, 'feeds' maps input names to their values"""
+        return self.sess.run([self.outputs[name] for name in output_names],
+                             feed_dict={self.inputs[name]: value for name, value in feeds.items()})
+
+    def close(self):
+        self.sess.close()
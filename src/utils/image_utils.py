@@ -2,8 +2,8 @@
 import os
 
 import cv2.cv2 as cv2
-from moviepy.video.io.VideoFileClip import VideoFileClip
 
+from src.utils.frame_source import create_frame_source
 from src.utils.timer import timing
 
 
@@ -56,6 +56,19 @@ def get_image_patch_from_rect(image, rect):
     return cv2.getRectSubPix(image, size, center)
 
 
+def get_intersection_over_union(box1, box2):
+    """Returns the intersection over union of two boxes given as (top, left, bottom, right)"""
+    top1, left1, bottom1, right1 = box1
+    top2, left2, bottom2, right2 = box2
+    intersection_height = min(bottom1, bottom2) - max(top1, top2)
+    intersection_width = min(right1, right2) - max(left1, left2)
+    if intersection_height <= 0 or intersection_width <= 0:
+        return 0.0
+    intersection = intersection_height * intersection_width
+    union = (bottom1 - top1) * (right1 - left1) + (bottom2 - top2) * (right2 - left2) - intersection
+    return float(intersection / union)
+
+
 def get_image_patch_from_contour(image, contour):
     """Returns the specified area from the image"""
     x, y, w, h = cv2.boundingRect(contour)
@@ -85,16 +98,43 @@ def save_debug_image(image, filename, folder=None, resize_to=None):
     cv2.imwrite(path, image)
 
 
-def get_frames(path_to_video, from_sec=0, to_sec=None):
+def get_frames(path_to_video, from_sec=0, to_sec=None, backend="opencv", reuse_buffer=False, downscale_to=None,
+               frame_filter=None):
+    """
+    Generator that reads a video file from disk and yields a color correct (BGR) frame at a time.
+    'backend' selects the decoder, see frame_source.FRAME_SOURCES. If 'reuse_buffer' is set, a yielded frame is only
+    valid until the next one is requested. 'downscale_to' (width, height) optionally resizes the frames while decoding.
+    If a 'frame_filter' is given, it is called with the index of every frame and None is yielded for rejected frames.
+    """
+    frame_source = create_frame_source(path_to_video, from_sec, to_sec, backend, reuse_buffer, downscale_to,
+                                       frame_filter)
+    yield from frame_source.frames()
+
+
+def get_frame_rate(frame_source, default_frame_rate):
+    """
+    Returns the frame rate stored in the container of the video of the 'frame_source' or 'default_frame_rate' if the
+    container does not know it, some report a frame rate of 0 then
+    """
+    frame_rate = frame_source.fps
+    if frame_rate is not None and frame_rate > 0:
+        return frame_rate
+    print("Frame rate of the video is unknown, assuming {0} fps".format(default_frame_rate))
+    return default_frame_rate
+
+
+def get_frame_batches(frames, batch_size):
     """
-    Generator that reads a video file from disk and yields a color correct frame at a time
+    Generator that groups the given 'frames' into lists of 'batch_size' frames. The last batch may be smaller.
     """
-    fullpath = os.path.abspath(path_to_video)
-    video = VideoFileClip(fullpath, audio=False).subclip(from_sec, to_sec)
-    for frame in video.iter_frames():
-        # We have to switch the order of channels as opencv has a different order as they are coming from the camera
-        color_corrected_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        yield color_corrected_frame
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 
 def draw_rectangle(image, box, color=(0, 0, 255), thickness=2, offset=(0, 0)):
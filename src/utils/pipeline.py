@@ -0,0 +1,183 @@
+"""
+Multi-stage pipeline that processes consecutive items (e.g. frames) concurrently.
+
+Every stage runs in its own worker threads and the stages are connected by bounded queues, so a slow stage applies
+backpressure instead of letting items pile up in memory. The results are yielded in the order the items came in.
+If the consumer stops early, the threads are stopped by closing the generator of results or calling Pipeline.close.
+"""
+import queue
+import threading
+import time
+
+from tabulate import tabulate
+
+_END_OF_STREAM = object()
+
+# How often threads that wait on a queue check if the pipeline was closed, in seconds
+_STOP_POLL_INTERVAL = 0.1
+
+
+class _Failure:
+    """Wraps an exception raised while processing an item, so it can be passed down the pipeline and re-raised"""
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class Stage:
+    """
+    One processing step of the pipeline. 'function' takes an item and returns the processed item. It is called by
+    'workers' threads concurrently, which pays off for OpenCV functions as they release the GIL. Stages that use a
+    tensorflow session or another resource that is not thread safe must keep a single worker so one thread owns it.
+    """
+
+    def __init__(self, name, function, workers=1):
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.processed_items = 0
+        self.busy_time = 0.0
+        self.total_queue_depth = 0
+        self.max_queue_depth = 0
+        self._lock = threading.Lock()
+
+    def _record(self, busy_time, queue_depth):
+        with self._lock:
+            self.processed_items += 1
+            self.busy_time += busy_time
+            self.total_queue_depth += queue_depth
+            self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+
+
+class Pipeline:
+    """Runs items through a list of stages. 'queue_size' is the maximum number of items waiting in front of a stage."""
+
+    def __init__(self, stages, queue_size=8):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.total_time = 0.0
+        self.threads = []
+        self.stopped = threading.Event()
+
+    def run(self, items):
+        """Generator that feeds the 'items' into the pipeline and yields the processed items in their original order"""
+        self.stopped.clear()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        self.threads = [threading.Thread(target=self._feed, args=(items, queues[0]), daemon=True)]
+        for stage_index, stage in enumerate(self.stages):
+            remaining_workers = [stage.workers]
+            lock = threading.Lock()
+            for _ in range(stage.workers):
+                self.threads.append(threading.Thread(target=self._work, daemon=True, args=(
+                    stage, queues[stage_index], queues[stage_index + 1], remaining_workers, lock)))
+
+        start = time.time()
+        for thread in self.threads:
+            thread.start()
+
+        # Items can overtake each other in stages with multiple workers, so they are put back in order here
+        next_index = 0
+        pending = {}
+        output_queue = queues[-1]
+        try:
+            while True:
+                entry = output_queue.get()
+                if entry is _END_OF_STREAM:
+                    break
+                index, item = entry
+                pending[index] = item
+                while next_index in pending:
+                    item = pending.pop(next_index)
+                    next_index += 1
+                    if isinstance(item, _Failure):
+                        raise item.exception
+                    self.total_time = time.time() - start
+                    yield item
+            self.total_time = time.time() - start
+        finally:
+            self.close()
+
+    def close(self):
+        """Stops the threads, e.g. once the consumer stopped early, and waits until they finished their current item"""
+        self.stopped.set()
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def _put(self, output_queue, entry):
+        """Puts the entry on the queue once there is room, returns False if the pipeline was closed in the meantime"""
+        while not self.stopped.is_set():
+            try:
+                output_queue.put(entry, timeout=_STOP_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, input_queue):
+        """Returns the next entry of the queue, or None if the pipeline was closed in the meantime"""
+        while not self.stopped.is_set():
+            try:
+                return input_queue.get(timeout=_STOP_POLL_INTERVAL)
+            except queue.Empty:
+                pass
+        return None
+
+    def _feed(self, items, output_queue):
+        # The failure takes the index of the next item, so it is raised after all items that were fed before it
+        number_of_items = 0
+        try:
+            for item in items:
+                if not self._put(output_queue, (number_of_items, item)):
+                    return
+                number_of_items += 1
+        except Exception as e:
+            if not self._put(output_queue, (number_of_items, _Failure(e))):
+                return
+        finally:
+            # Releases e.g. the video the items are read from if the pipeline was closed early
+            if hasattr(items, "close"):
+                items.close()
+        self._put(output_queue, _END_OF_STREAM)
+
+    def _work(self, stage, input_queue, output_queue, remaining_workers, lock):
+        while True:
+            entry = self._get(input_queue)
+            if entry is None:
+                return
+            if entry is _END_OF_STREAM:
+                # Put it back so the other workers of this stage stop as well, the last one passes it on
+                self._put(input_queue, _END_OF_STREAM)
+                with lock:
+                    remaining_workers[0] -= 1
+                    is_last_worker = remaining_workers[0] == 0
+                if is_last_worker:
+                    self._put(output_queue, _END_OF_STREAM)
+                return
+
+            index, item = entry
+            queue_depth = input_queue.qsize()
+            if not isinstance(item, _Failure):
+                start = time.time()
+                try:
+                    item = stage.function(item)
+                except Exception as e:
+                    item = _Failure(e)
+                stage._record(time.time() - start, queue_depth)
+            if not self._put(output_queue, (index, item)):
+                return
+
+    def print_statistics(self):
+        """
+        Prints throughput and queue depth per stage. The stage with the lowest throughput, a high utilization and a
+        full queue in front of it is the bottleneck.
+        """
+        headers = ["Stage", "workers", "items", "items/s", "utilization", "avg queue depth", "max queue depth"]
+        rows = []
+        for stage in self.stages:
+            throughput = stage.processed_items / self.total_time if self.total_time > 0 else 0
+            utilization = stage.busy_time / (self.total_time * stage.workers) if self.total_time > 0 else 0
+            average_queue_depth = stage.total_queue_depth / stage.processed_items if stage.processed_items > 0 else 0
+            rows.append([stage.name, stage.workers, stage.processed_items, throughput, utilization,
+                         average_queue_depth, stage.max_queue_depth])
+        print(tabulate(rows, headers))
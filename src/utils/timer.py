@@ -1,4 +1,4 @@
-"""Functions used to measure the execution time of a wrapped function"""
+"""Functions used to measure the execution time of a wrapped function and to keep track of other measured values"""
 from collections import Counter
 from functools import wraps
 from time import time
@@ -7,6 +7,9 @@ from tabulate import tabulate
 
 number_of_calls = Counter()
 total_time_per_function = Counter()
+number_of_samples = Counter()
+total_per_sample = Counter()
+max_per_sample = Counter()
 
 
 def timing(function_to_time):
@@ -26,9 +29,22 @@ def timing(function_to_time):
     return wrapper
 
 
+def record_time(name, duration):
+    """Stores a duration that was measured by hand under 'name', as if it was a call of a timed function"""
+    number_of_calls[name] += 1
+    total_time_per_function[name] += duration
+
+
+def record_sample(name, value):
+    """Stores a sampled value under 'name', e.g. the occupancy of a queue"""
+    number_of_samples[name] += 1
+    total_per_sample[name] += value
+    max_per_sample[name] = max(max_per_sample[name], value)
+
+
 def print_timing_results():
     """
-    Prints out the internally stored function calls with their respective execution times
+    Prints out the internally stored function calls with their respective execution times and the sampled values
     """
     headers = ["Function", "# calls", " total time", "time per call"]
     rows = []
@@ -36,3 +52,12 @@ def print_timing_results():
         time_per_call = total_time_per_function[func] / number_of_calls[func]
         rows.append([func, number_of_calls[func], total_time_per_function[func], time_per_call])
     print(tabulate(rows, headers))
+
+    if number_of_samples:
+        headers = ["Sample", "# samples", "average", "max"]
+        rows = []
+        for name in number_of_samples.keys():
+            rows.append([name, number_of_samples[name], total_per_sample[name] / number_of_samples[name],
+                         max_per_sample[name]])
+        print()
+        print(tabulate(rows, headers))